@@ -1,5 +1,9 @@
 from scipy.interpolate import RegularGridInterpolator as rgi
+from contextlib import contextmanager, nullcontext
 import matplotlib.pyplot as plt
+import json
+import time
+import tracemalloc
 import numpy as np
 import pandas as pd
 import yaml
@@ -17,6 +21,7 @@ output_directory = configs['output_directory']
 output_suffix = configs['output_suffix']
 cell_edge_velocity = configs['cell_edge_velocity']
 eos_file_path = configs['eos_file_path']
+profile_stages = configs.get('profile_stages', False)
 velocity_col_name = "v" if cell_edge_velocity else "u"
 
 # Constants in CGS units
@@ -46,10 +51,16 @@ def convert(model_name, stir_alpha, stir_portion = 0.8, plotted_profiles = ["DEF
             The profiles available for plotting are: enclosed_mass, density, temp, r, L, dq, v, mlt_vc, ener, pressure, and any nuclear network composition
     """
 
-    prog = load_progenitor(model_name)
-    stir = load_stir_profiles(f"{model_name}_a{stir_alpha}", prog["nuclear_network"])
-    data = combine_data(stir, prog, stir_portion)
-    write_mesa_model(data, prog, f"{model_name}_a{stir_alpha}")
+    stages = StageProfile(profile_stages)
+    with stages.stage("load_progenitor"):
+        prog = load_progenitor(model_name)
+    with stages.stage("load_stir_profiles"):
+        stir = load_stir_profiles(f"{model_name}_a{stir_alpha}", prog["nuclear_network"])
+    with stages.stage("combine_data"):
+        data = combine_data(stir, prog, stir_portion)
+    with stages.stage("write_mesa_model"):
+        write_mesa_model(data, prog, f"{model_name}_a{stir_alpha}")
+    stages.report(f"{output_directory}/{model_name}_a{stir_alpha}{output_suffix}_stages.json")
     
     # Plot the desired profiles
     if "DEFAULT" in plotted_profiles: plotted_profiles = default_plotted_profiles
@@ -362,6 +373,54 @@ def plot_profile(data, profile, zoom_width = 80):
     plt.show()
 
 
+class StageProfile:
+    """
+    The wall time and peak memory (traced by tracemalloc) of each stage of a conversion.
+    Turned on with profile_stages: True in config.yaml, otherwise the stages are not timed.
+
+    Parameters:
+        enabled (bool) :
+            Whether to time the stages.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.records = []
+
+    def stage(self, name):
+        '''Times the with block as the stage name.'''
+        if not self.enabled:
+            return nullcontext()
+        return self._timed_stage(name)
+
+    @contextmanager
+    def _timed_stage(self, name):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            self.records.append({"stage": name, "seconds": seconds, "peak_memory_mb": (peak_memory - start_memory) / 2**20})
+
+    def report(self, report_path):
+        '''Prints the time and peak memory of each stage and writes them to a json file.'''
+        if not self.enabled:
+            return
+        for record in self.records:
+            print(f"{record['stage']:<20} {record['seconds']:9.3f} s {record['peak_memory_mb']:10.1f} MB")
+        with open(report_path, 'w') as file:
+            json.dump(self.records, file, indent=1)
+        print(f"Wrote the stage profile to '{report_path}'")
+
+
 def shift_to_cell_edge(profile):
     """
     Takes values which are cell centered and shifts them to the edge of the cell.
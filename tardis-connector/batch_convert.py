@@ -0,0 +1,414 @@
+# Convert many SNEC and STELLA model folders to TARDIS config and csvy files in one
+# process, run with:
+#   python batch_convert.py MODEL_FOLDER [MODEL_FOLDER ...] [--templates FOLDER]
+#       [--output-folder FOLDER] [--workers N] [--cache-folder FOLDER] [--overwrite]
+#       [--profile-report REPORT.json] [parser options, see --help]
+# The kind of each model is detected from its files, see detect_model_kind.
+import argparse
+import contextlib
+import glob
+import logging
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+from snec_to_tardis_parser import convert_snec_to_tardis
+from stage_profiler import (
+    merge_stage_records,
+    profile_stage,
+    profile_stages,
+    stage_profiling_settings,
+    worker_stage_records,
+)
+from stella_to_tardis_parser import parse_stella_models_to_tardis_configs
+
+DEFAULT_TEMPLATE_FOLDER = Path(__file__).parent / "TARDIS_template_configs"
+
+
+def detect_model_kind(model_folder_path):
+    """
+    Purpose:
+    Detect if a model folder is a SNEC run (output/vel.xg) or a STELLA run (res/mesa.day*)
+    -------------------
+    model_folder_path: str or Path
+    -------------------
+
+    Returns
+    -------------------
+    "snec" or "stella", raises a ValueError if the folder is neither
+    """
+    model_folder_path = Path(model_folder_path)
+    if (model_folder_path / "output" / "vel.xg").exists():
+        return "snec"
+    if len(glob.glob(f"{model_folder_path}/res/mesa.day*")) > 0:
+        return "stella"
+    raise ValueError(
+        f"{model_folder_path} is neither a SNEC (output/vel.xg) nor a STELLA (res/mesa.day*) model folder"
+    )
+
+
+def convert_model(
+    model_folder_path,
+    tardis_example_config_folder_path=DEFAULT_TEMPLATE_FOLDER,
+    output_folder_path=None,
+    cache_folder_path=None,
+    overwrite=False,
+    snec_options=None,
+    stella_options=None,
+):
+    """
+    Purpose:
+    Convert one model folder with convert_snec_to_tardis or
+    parse_stella_models_to_tardis_configs. An error is returned in the result instead of
+    raised, so one bad model does not stop the others
+    -------------------
+    model_folder_path: str or Path, the SNEC or STELLA model folder
+    tardis_example_config_folder_path: str or Path, the folder of the TARDIS templates
+    output_folder_path: str, Path or None, the folder for the TARDIS files of this model,
+        None for the tardis_configs folder in the model folder
+    cache_folder_path: str, Path or None, the cache folder of the parsed SNEC output
+    overwrite: boolean, if False then skip the epochs that are up to date
+    snec_options: dict or None, the other keyword arguments of convert_snec_to_tardis
+    stella_options: dict or None, the other keyword arguments of
+        parse_stella_models_to_tardis_configs
+    -------------------
+
+    Returns
+    -------------------
+    dict with the "model", "kind", "status" ("ok" or "failed"), "seconds", the number of
+    "converted", "skipped", "up_to_date" and "failed" epochs, and the "error" or None
+    """
+    model_folder_path = Path(model_folder_path)
+    result = {
+        "model": model_folder_path.name,
+        "kind": None,
+        "status": "ok",
+        "seconds": 0.0,
+        "converted": 0,
+        "skipped": 0,
+        "up_to_date": 0,
+        "failed": 0,
+        "error": None,
+    }
+    start = time.perf_counter()
+    try:
+        result["kind"] = detect_model_kind(model_folder_path)
+        if output_folder_path is None:
+            output_folder_path = model_folder_path / "tardis_configs"
+        output_folder_path = Path(output_folder_path)
+
+        if result["kind"] == "snec":
+            with profile_stage("model", model=result["model"]):
+                summary = convert_snec_to_tardis(
+                    model_folder_path,
+                    Path(tardis_example_config_folder_path),
+                    str(output_folder_path),
+                    cache_folder_path=cache_folder_path,
+                    overwrite=overwrite,
+                    **(snec_options or {}),
+                )
+        else:
+            with profile_stage("model", model=result["model"]):
+                summary = parse_stella_models_to_tardis_configs(
+                    model_folder_path,
+                    tardis_example_config_folder_path,
+                    tardis_config_output_folder_path=output_folder_path,
+                    overwrite=overwrite,
+                    **(stella_options or {}),
+                )
+        for status in ["converted", "skipped", "up_to_date", "failed"]:
+            result[status] = len(summary[status])
+        if len(summary["failed"]) > 0:
+            result["status"] = "failed"
+            epoch_kind = "epochs" if result["kind"] == "snec" else "days"
+            result["error"] = (
+                f"{epoch_kind} {', '.join(summary['failed'])} failed to convert"
+            )
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _convert_model_in_worker(stage_profiling, *convert_args):
+    """convert_model in a worker process, returns its result and the records of its stages
+    if they are profiled, see stage_profiler.worker_stage_records"""
+    with worker_stage_records(stage_profiling) as stage_records:
+        result = convert_model(*convert_args)
+    return result, stage_records
+
+
+def convert_models(
+    model_folder_paths,
+    tardis_example_config_folder_path=DEFAULT_TEMPLATE_FOLDER,
+    output_folder_path=None,
+    cache_folder_path=None,
+    overwrite=False,
+    n_workers=1,
+    snec_options=None,
+    stella_options=None,
+):
+    """
+    Purpose:
+    Convert many model folders, over a pool of n_workers processes. Each worker imports
+    the parsers once and keeps the parsed templates and nuclide lookups (see
+    tardis_utils.load_tardis_templates) for all the models it converts
+    -------------------
+    model_folder_paths: list, the SNEC and STELLA model folders
+    tardis_example_config_folder_path, cache_folder_path, overwrite, snec_options,
+    stella_options: see convert_model
+    output_folder_path: str, Path or None, if given then the TARDIS files of each model are
+        saved in output_folder_path/{model folder name}, otherwise in the tardis_configs
+        folder of each model
+    n_workers: int, default 1, the number of processes converting the models
+    -------------------
+
+    Returns
+    -------------------
+    list of the convert_model results, in the order of model_folder_paths
+    """
+    model_output_folder_paths = [
+        None
+        if output_folder_path is None
+        else Path(output_folder_path) / Path(model).name
+        for model in model_folder_paths
+    ]
+    convert_args = [
+        (
+            model,
+            tardis_example_config_folder_path,
+            model_output_folder_path,
+            cache_folder_path,
+            overwrite,
+            snec_options,
+            stella_options,
+        )
+        for model, model_output_folder_path in zip(
+            model_folder_paths, model_output_folder_paths
+        )
+    ]
+    if n_workers <= 1 or len(convert_args) <= 1:
+        return [convert_model(*args) for args in convert_args]
+    with ProcessPoolExecutor(min(n_workers, len(convert_args))) as executor:
+        results = []
+        for result, stage_records in executor.map(
+            _convert_model_in_worker,
+            repeat(stage_profiling_settings()),
+            *zip(*convert_args),
+        ):
+            merge_stage_records(stage_records)
+            results.append(result)
+        return results
+
+
+def print_batch_report(results, wall_seconds, file=sys.stdout):
+    """
+    Purpose:
+    Print the time and the number of converted, skipped, up to date and failed epochs
+    of each model, the totals, and the errors of the failed models
+    -------------------
+    results: list, the convert_model results
+    wall_seconds: float, the wall time of the whole batch
+    file: the stream to print to, default sys.stdout
+    -------------------
+    """
+    name_width = max([len("model")] + [len(result["model"]) for result in results])
+    header = (
+        f"{'model':<{name_width}}  {'kind':<6}  {'status':<6}  {'time (s)':>9}  "
+        f"{'converted':>9}  {'skipped':>7}  {'up to date':>10}  {'failed':>6}"
+    )
+    print(header, file=file)
+    print("-" * len(header), file=file)
+    for result in results:
+        print(
+            f"{result['model']:<{name_width}}  {result['kind'] or '?':<6}  "
+            f"{result['status']:<6}  {result['seconds']:>9.2f}  {result['converted']:>9}  "
+            f"{result['skipped']:>7}  {result['up_to_date']:>10}  {result['failed']:>6}",
+            file=file,
+        )
+    print("-" * len(header), file=file)
+
+    n_failed_models = sum(result["status"] == "failed" for result in results)
+    model_seconds = sum(result["seconds"] for result in results)
+    print(
+        f"{len(results)} models, {len(results) - n_failed_models} ok, {n_failed_models} failed; "
+        f"{sum(result['converted'] for result in results)} epochs converted, "
+        f"{sum(result['failed'] for result in results)} failed",
+        file=file,
+    )
+    print(
+        f"wall time {wall_seconds:.2f} s, conversion time {model_seconds:.2f} s "
+        f"({model_seconds / max(wall_seconds, 1e-9):.1f}x parallel)",
+        file=file,
+    )
+    if len(results) > 0:
+        slowest = max(results, key=lambda result: result["seconds"])
+        print(
+            f"slowest model: {slowest['model']} ({slowest['seconds']:.2f} s)", file=file
+        )
+    for result in results:
+        if result["error"] is not None:
+            print(f"\n{result['model']} failed: {result['error']}", file=file)
+
+
+def parser_options(args):
+    """The SNEC and STELLA parser options given on the command line, as the snec_options
+    and stella_options of convert_models. The options that are not given keep the
+    defaults of the parsers"""
+    snec_options = {}
+    stella_options = {}
+    for option in ["tau_upper_limit", "tau_lower_limit"]:
+        if getattr(args, option) is not None:
+            snec_options[option] = stella_options[option] = getattr(args, option)
+    if args.shells is not None:
+        snec_options["num_keep_shells"] = args.shells
+        stella_options["shrink_shell_number"] = args.shells
+    if args.rebin_weighting is not None:
+        snec_options["rebin_weighting"] = args.rebin_weighting
+        stella_options["shrink_shell_weighting"] = args.rebin_weighting
+    if args.no_interpolate_mass_fractions:
+        stella_options["interpolate_mass_fractions"] = False
+    if args.keep_nonhomologous:
+        stella_options["skip_nonhomologous_models"] = False
+    for option in ["max_nonhomologous_shells", "l_nuc_ratio_upper_limit"]:
+        if getattr(args, option) is not None:
+            stella_options[option] = getattr(args, option)
+    return snec_options, stella_options
+
+
+def _tau_limit(value):
+    """A tau limit of the command line, a float or "off" for no limit (False)"""
+    if value.lower() == "off":
+        return False
+    return float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert many SNEC and STELLA model folders to TARDIS config and csvy files"
+    )
+    parser.add_argument("model_folders", nargs="+", help="SNEC or STELLA model folders")
+    parser.add_argument(
+        "--templates",
+        default=DEFAULT_TEMPLATE_FOLDER,
+        help="folder of the TARDIS template csvy and config files",
+    )
+    parser.add_argument(
+        "--output-folder",
+        default=None,
+        help="save the files of each model in OUTPUT_FOLDER/{model folder name}, "
+        "default the tardis_configs folder of each model",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes converting the models",
+    )
+    parser.add_argument(
+        "--cache-folder", default=None, help="cache folder of the parsed SNEC output"
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="rewrite the epochs that are up to date",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="log the progress of each model"
+    )
+    parser.add_argument(
+        "--profile-report",
+        default=None,
+        help="profile the wall time and peak memory of each stage and epoch of the "
+        "conversions, write them to PROFILE_REPORT (.json or .csv) and log a summary",
+    )
+    parser.add_argument(
+        "--profile-time-only",
+        action="store_true",
+        help="with --profile-report, do not trace the memory, which slows the "
+        "conversions down",
+    )
+    parser_group = parser.add_argument_group(
+        "parser options", "the defaults are those of the SNEC and STELLA parsers"
+    )
+    parser_group.add_argument(
+        "--tau-upper-limit",
+        type=_tau_limit,
+        default=None,
+        help="filter out the shells with a larger tau, a float or off",
+    )
+    parser_group.add_argument(
+        "--tau-lower-limit",
+        type=_tau_limit,
+        default=None,
+        help="filter out the shells with a smaller tau, a float or off",
+    )
+    parser_group.add_argument(
+        "--shells",
+        type=int,
+        default=None,
+        help="the (rough) number of shells to rebin the models to",
+    )
+    parser_group.add_argument(
+        "--rebin-weighting",
+        choices=["volume", "mass"],
+        default=None,
+        help="average the density and composition of the rebinned shells by volume or "
+        "mass, default the plain mean",
+    )
+    parser_group.add_argument(
+        "--no-interpolate-mass-fractions",
+        action="store_true",
+        help="STELLA: use the composition of the stella snapshots instead of "
+        "interpolating the MESA profile1.data",
+    )
+    parser_group.add_argument(
+        "--keep-nonhomologous",
+        action="store_true",
+        help="STELLA: also convert the days that are not homologous",
+    )
+    parser_group.add_argument(
+        "--max-nonhomologous-shells",
+        type=int,
+        default=None,
+        help="STELLA: the days with more non-homologous shells are skipped",
+    )
+    parser_group.add_argument(
+        "--l-nuc-ratio-upper-limit",
+        type=float,
+        default=None,
+        help="STELLA: only convert the days with L_nuc/L_bol up to this ratio",
+    )
+    args = parser.parse_args(argv)
+    snec_options, stella_options = parser_options(args)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if args.profile_report is None:
+        profiling = contextlib.nullcontext()
+    else:
+        logging.getLogger("stage_profiler").setLevel(logging.INFO)
+        profiling = profile_stages(
+            args.profile_report, trace_memory=not args.profile_time_only
+        )
+    start = time.perf_counter()
+    with profiling:
+        results = convert_models(
+            args.model_folders,
+            tardis_example_config_folder_path=args.templates,
+            output_folder_path=args.output_folder,
+            cache_folder_path=args.cache_folder,
+            overwrite=args.overwrite,
+            n_workers=args.workers,
+            snec_options=snec_options,
+            stella_options=stella_options,
+        )
+    print_batch_report(results, time.perf_counter() - start)
+    return 1 if any(result["status"] == "failed" for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
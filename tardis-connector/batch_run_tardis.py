@@ -0,0 +1,715 @@
+# Run TARDIS on many epoch configs over a pool of worker processes, run with:
+#   python batch_run_tardis.py CONFIGS [CONFIGS ...] [--output-folder FOLDER]
+#       [--workers N] [--threads N] [--overwrite] [--chain [--compare-cold]]
+#       [--store FILE [--no-csv]]
+# CONFIGS is a folder (all its .yml configs) or a glob pattern of configs, e.g. the
+# output folders of batch_convert.py. The spectrum csv of each epoch is written by its
+# worker to FOLDER/{model name} as soon as the epoch finishes, see config_model_name. With --store, the
+# spectra are also appended to one HDF5 file, see spectra_store.SpectraStore. With
+# --chain, the epochs of each folder run in time order and each one is warm started from
+# the previous one, see run_epoch_series.
+import argparse
+import glob
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import astropy.units as u
+import yaml
+from cache_utils import cache_key
+from spectra_store import SpectraStore
+from tardis.io.atom_data import AtomData
+from tardis.io.configuration.config_reader import Configuration
+from tardis_utils import (
+    TardisEpochModel,
+    atom_data_for_run,
+    quantity_value,
+    run_tardis_epoch,
+    run_tardis_workflow,
+)
+
+# the montecarlo threads and the atomic data of a worker process, see _init_tardis_worker
+_TARDIS_WORKER_STATE = {}
+# the default output folder of the parsers in a model folder
+CONFIG_FOLDER_NAME = "tardis_configs"
+
+
+def _init_tardis_worker(n_threads):
+    """Set the number of montecarlo threads of a worker, its atomic data is loaded on first use"""
+    _TARDIS_WORKER_STATE["n_threads"] = n_threads
+    _TARDIS_WORKER_STATE["atom_data"] = {}
+
+
+def find_epoch_configs(configs):
+    """
+    Purpose:
+    The epoch config files of folders (all the .yml files in them) and glob patterns
+    -------------------
+    configs: list, folders or glob patterns of config files
+    -------------------
+
+    Returns
+    -------------------
+    list of the config file paths, sorted within each folder or pattern, without duplicates
+    """
+    config_paths = []
+    for config in configs:
+        if os.path.isdir(config):
+            config_paths += sorted(glob.glob(f"{config}/*.yml"))
+        else:
+            config_paths += sorted(glob.glob(str(config)))
+    return list(dict.fromkeys(config_paths))
+
+
+def threads_per_worker(n_workers, n_cores=None):
+    """Split the cores available to this process evenly between n_workers, at least 1 each"""
+    if n_cores is None:
+        if hasattr(os, "sched_getaffinity"):
+            n_cores = len(os.sched_getaffinity(0))
+        else:
+            n_cores = os.cpu_count() or 1
+    return max(n_cores // max(n_workers, 1), 1)
+
+
+def config_model_name(yml_file_path):
+    """The model of an epoch config: the name of the model folder for the configs in its
+    tardis_configs folder (the default output folder of the parsers), otherwise the name
+    of the config folder"""
+    config_folder_path = Path(yml_file_path).absolute().parent
+    if config_folder_path.name == CONFIG_FOLDER_NAME:
+        config_folder_path = config_folder_path.parent
+    return config_folder_path.name
+
+
+def check_unique_model_names(config_paths):
+    """Raise a ValueError if the configs of different folders have the same model name,
+    since their spectrum csv files and store entries would overwrite each other, see
+    config_model_name"""
+    config_folder_paths = {}
+    for yml_file_path in config_paths:
+        config_folder_paths.setdefault(config_model_name(yml_file_path), set()).add(
+            Path(yml_file_path).absolute().parent
+        )
+    duplicates = [
+        f"{model_name} ({', '.join(sorted(map(str, folder_paths)))})"
+        for model_name, folder_paths in config_folder_paths.items()
+        if len(folder_paths) > 1
+    ]
+    if len(duplicates) > 0:
+        raise ValueError(
+            f"The configs of different folders have the same model name: "
+            f"{'; '.join(duplicates)}. Run them separately or rename the folders"
+        )
+
+
+def spectrum_output_path(yml_file_path, spec_output_folder_path):
+    """The spectrum csv of an epoch config, {model name}/{config name}_spectrum.csv, since
+    the configs of different models have the same names, see config_model_name"""
+    yml_file_path = Path(yml_file_path)
+    return (
+        Path(spec_output_folder_path)
+        / config_model_name(yml_file_path)
+        / f"{yml_file_path.stem}_spectrum.csv"
+    )
+
+
+def epoch_series(config_paths):
+    """
+    Purpose:
+    The time series of epoch configs to chain, the configs of each folder (one model)
+    sorted by their supernova time_explosion
+    -------------------
+    config_paths: list, the epoch configs, see find_epoch_configs
+    -------------------
+
+    Returns
+    -------------------
+    list of the series, each a list of config paths in time order
+    """
+    series = {}
+    for yml_file_path in config_paths:
+        series.setdefault(Path(yml_file_path).parent, []).append(yml_file_path)
+    return [sorted(paths, key=config_time_explosion) for paths in series.values()]
+
+
+def config_time_explosion(yml_file_path):
+    """The supernova time_explosion of an epoch config, in days"""
+    with open(yml_file_path) as file:
+        config = yaml.safe_load(file)
+    return quantity_value(config["supernova"]["time_explosion"], u.day)
+
+
+def epoch_store_key(yml_file_path):
+    """The model (see config_model_name) and epoch (config name) of a config in a
+    SpectraStore"""
+    return config_model_name(yml_file_path), Path(yml_file_path).stem
+
+
+def config_hash(yml_file_path):
+    """The hash of the content of an epoch config and its csvy model, see cache_utils.cache_key"""
+    with open(yml_file_path) as file:
+        config = yaml.safe_load(file)
+    return cache_key(
+        [yml_file_path, Path(yml_file_path).parent / config["csvy_model"]],
+        include_mtime=False,
+    )
+
+
+def _epoch_result(yml_file_path, spec_output_file, status="ok"):
+    """The result of an epoch before it runs, see run_epoch_config"""
+    return {
+        "config": Path(yml_file_path).name,
+        "status": status,
+        "seconds": 0.0,
+        "spectrum": None if spec_output_file is None else str(spec_output_file),
+        "worker": os.getpid() if status == "ok" else None,
+        "iterations": None,
+        "cold_iterations": None,
+        "warm_started": False,
+        "atom_data": {
+            "loads": 0,
+            "load_seconds": 0.0,
+            "copies": 0,
+            "copy_seconds": 0.0,
+        },
+        "error": None,
+    }
+
+
+def _spectrum_data(converged_state):
+    """The spectrum of a run and its values for SpectraStore.append"""
+    return {
+        "wavelength": converged_state.wavelength,
+        "luminosity_density": converged_state.luminosity_density,
+        "time_explosion": converged_state.time_explosion / 86400.0,
+        "t_inner": converged_state.t_inner,
+        "v_inner_boundary": converged_state.v_inner_boundary,
+        "luminosity_requested": converged_state.luminosity_requested,
+        "iterations": converged_state.iterations,
+    }
+
+
+def worker_atom_data(config):
+    """
+    Purpose:
+    The atomic data of a config, read once per atomic data file and worker process and
+    reused by all the epochs the worker runs
+    -------------------
+    config: tardis.io.configuration.config_reader.Configuration
+    -------------------
+
+    Returns
+    -------------------
+    tardis AtomData, shared by the runs of the worker, each run gets a copy, see
+    run_atom_data
+    """
+    atom_data_path = Path(config.atom_data)
+    config_dirname = config.get("config_dirname", "")
+    if (
+        not atom_data_path.is_absolute()
+        and (Path(config_dirname) / atom_data_path).exists()
+    ):
+        atom_data_path = Path(config_dirname) / atom_data_path
+    # AtomData.from_hdf also finds the file names in the tardis data folder
+    atom_data_cache = _TARDIS_WORKER_STATE.setdefault("atom_data", {})
+    if str(atom_data_path) not in atom_data_cache:
+        atom_data_cache[str(atom_data_path)] = AtomData.from_hdf(str(atom_data_path))
+    return atom_data_cache[str(atom_data_path)]
+
+
+def run_atom_data(config, result):
+    """
+    Purpose:
+    The atomic data of one run of an epoch: a copy of the atomic data of the worker
+    (see tardis_utils.atom_data_for_run), which is loaded on first use. The loading and
+    copying times are added to the "atom_data" of the result
+    -------------------
+    config: tardis.io.configuration.config_reader.Configuration
+    result: dict, the result of the epoch, see run_epoch_config
+    -------------------
+
+    Returns
+    -------------------
+    tardis AtomData, for this run only
+    """
+    timings = result["atom_data"]
+    n_loaded = len(_TARDIS_WORKER_STATE.get("atom_data", {}))
+    start = time.perf_counter()
+    atom_data = worker_atom_data(config)
+    if len(_TARDIS_WORKER_STATE["atom_data"]) > n_loaded:
+        timings["loads"] += 1
+        timings["load_seconds"] += time.perf_counter() - start
+    start = time.perf_counter()
+    atom_data = atom_data_for_run(atom_data)
+    timings["copies"] += 1
+    timings["copy_seconds"] += time.perf_counter() - start
+    return atom_data
+
+
+def run_epoch_config(yml_file_path, spec_output_file, return_spectrum=False):
+    """
+    Purpose:
+    Run TARDIS on one epoch config in a worker and write its spectrum csv, with the
+    montecarlo threads and the atomic data of the worker. An error is returned in the
+    result instead of raised, so one bad epoch does not stop the others
+    -------------------
+    yml_file_path: str, the epoch config
+    spec_output_file: str or None, the spectrum csv to write, None to not write it
+    return_spectrum: boolean, default False, if True then return the spectrum and the
+        converged values in the result, to store them in the main process
+    -------------------
+
+    Returns
+    -------------------
+    dict with the "config", "status" ("ok" or "failed"), "seconds", "spectrum", the
+    "worker" process id, the "iterations" of the run, "cold_iterations" and
+    "warm_started" (see run_epoch_series), the "atom_data" loads and copies and their
+    seconds (see run_atom_data) and the "error" or None. With return_spectrum,
+    also the "spectrum_data" for SpectraStore.append
+    """
+    result = _epoch_result(yml_file_path, spec_output_file)
+    start = time.perf_counter()
+    try:
+        config = Configuration.from_yaml(yml_file_path)
+        converged_state = run_tardis_workflow(
+            config,
+            spec_output_file,
+            n_threads=_TARDIS_WORKER_STATE.get("n_threads", 1),
+            atom_data=run_atom_data(config, result),
+        )
+        result["iterations"] = converged_state.iterations
+        if return_spectrum:
+            result["spectrum_data"] = _spectrum_data(converged_state)
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_epoch_series(epochs, compare_cold=False, return_spectrum=False):
+    """
+    Purpose:
+    Run TARDIS on a time series of epoch configs in a worker, each epoch warm started
+    from the converged state of the previous one (see tardis_utils.TardisWarmStart), and
+    write their spectrum csv files. A skipped or failed epoch breaks the chain, the
+    epoch after it starts from its own model again
+    -------------------
+    epochs: list of (yml_file_path, spec_output_file, run) in time order, spec_output_file
+        None to not write the spectrum csv and run False for the epochs to skip
+    compare_cold: boolean, default False, if True then also run each warm started epoch
+        from its own model (its spectrum is not kept), to count the iterations the warm
+        start saves
+    return_spectrum: boolean, default False, see run_epoch_config
+    -------------------
+
+    Returns
+    -------------------
+    list of the results of the epochs, see run_epoch_config
+    """
+    results = []
+    warm_start = None
+    for yml_file_path, spec_output_file, run in epochs:
+        if not run:
+            results.append(
+                _epoch_result(yml_file_path, spec_output_file, status="skipped")
+            )
+            warm_start = None
+            continue
+
+        result = _epoch_result(yml_file_path, spec_output_file)
+        start = time.perf_counter()
+        try:
+            epoch_model = TardisEpochModel.from_config_file(yml_file_path)
+            n_threads = _TARDIS_WORKER_STATE.get("n_threads", 1)
+            config = Configuration.from_yaml(yml_file_path)
+            if compare_cold and warm_start is not None:
+                cold_state = run_tardis_epoch(
+                    epoch_model,
+                    None,
+                    n_threads=n_threads,
+                    atom_data=run_atom_data(config, result),
+                )
+                result["cold_iterations"] = cold_state.iterations
+            result["warm_started"] = warm_start is not None
+            warm_start = run_tardis_epoch(
+                epoch_model,
+                spec_output_file,
+                n_threads=n_threads,
+                atom_data=run_atom_data(config, result),
+                warm_start=warm_start,
+            )
+            result["iterations"] = warm_start.iterations
+            if compare_cold and result["cold_iterations"] is None:
+                result["cold_iterations"] = warm_start.iterations
+            if return_spectrum:
+                result["spectrum_data"] = _spectrum_data(warm_start)
+        except Exception as e:
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+            warm_start = None
+        result["seconds"] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+def run_epoch_configs(
+    config_paths,
+    spec_output_folder_path,
+    n_workers=1,
+    n_threads=None,
+    overwrite=False,
+    epoch_done_callback=None,
+    chain=False,
+    compare_cold=False,
+    spectra_store=None,
+    write_csv=True,
+):
+    """
+    Purpose:
+    Run TARDIS on many epoch configs over a pool of n_workers processes. The workers stay
+    alive for all the epochs, so each of them imports TARDIS, compiles the numba kernels
+    and reads the atomic data once
+    -------------------
+    config_paths: list, the epoch configs, see find_epoch_configs
+    spec_output_folder_path: str or Path, the folder of the spectrum csv files
+    n_workers: int, default 1, the number of worker processes
+    n_threads: int or None, the montecarlo threads of each worker, None to split the cores
+        between the workers that are started (no more than the epochs to run, or with
+        chain the series), see threads_per_worker
+    overwrite: boolean, default False, if False then skip the epochs whose spectrum csv
+        exists and, with spectra_store, that are stored with the same config hash
+    epoch_done_callback: callable or None, called with the result of each epoch in this
+        process as soon as the epoch finishes (with chain, as soon as its series
+        finishes), e.g. to print the progress
+    chain: boolean, default False, if True then warm start the epochs of each folder
+        from each other in time order, one series per worker, see run_epoch_series
+    compare_cold: boolean, default False, with chain, also run the warm started epochs
+        from their own model to count the saved iterations, see run_epoch_series
+    spectra_store: SpectraStore or None, if given then this process appends the spectrum
+        of each epoch to it as soon as the epoch finishes, keyed by epoch_store_key and
+        with the config_hash
+    write_csv: boolean, default True, if False then do not write the spectrum csv files
+    -------------------
+
+    Returns
+    -------------------
+    list of the run_epoch_config results in the order of config_paths, the skipped epochs
+    have the status "skipped". Raises a ValueError before running anything if the configs
+    of different folders have the same model name, see check_unique_model_names
+    """
+    check_unique_model_names(config_paths)
+    if write_csv:
+        Path(spec_output_folder_path).mkdir(parents=True, exist_ok=True)
+    return_spectrum = spectra_store is not None
+
+    results = {}
+    epochs = []
+    config_hashes = {}
+    for yml_file_path in config_paths:
+        spec_output_file = None
+        if write_csv:
+            spec_output_file = spectrum_output_path(
+                yml_file_path, spec_output_folder_path
+            )
+        if spectra_store is not None:
+            config_hashes[yml_file_path] = config_hash(yml_file_path)
+        done = (spec_output_file is None or spec_output_file.exists()) and (
+            spectra_store is None
+            or spectra_store.has_epoch(
+                *epoch_store_key(yml_file_path), config_hashes[yml_file_path]
+            )
+        )
+        if not overwrite and done:
+            results[yml_file_path] = _epoch_result(
+                yml_file_path, spec_output_file, status="skipped"
+            )
+            continue
+        if spec_output_file is not None:
+            spec_output_file.parent.mkdir(parents=True, exist_ok=True)
+            spec_output_file = str(spec_output_file)
+        epochs.append((yml_file_path, spec_output_file))
+
+    def finish_epoch(yml_file_path, result):
+        spectrum_data = result.pop("spectrum_data", None)
+        if spectrum_data is not None:
+            # a spectrum that cannot be stored fails its epoch, not the batch
+            try:
+                spectra_store.append(
+                    *epoch_store_key(yml_file_path),
+                    **spectrum_data,
+                    config_hash=config_hashes[yml_file_path],
+                )
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = (
+                    f"{type(e).__name__}: storing the spectrum failed: {e}\n"
+                    f"{traceback.format_exc()}"
+                )
+        results[yml_file_path] = result
+        if epoch_done_callback is not None:
+            epoch_done_callback(result)
+
+    if chain:
+        to_run = dict(epochs)
+        series = [
+            [
+                (
+                    yml_file_path,
+                    to_run.get(
+                        yml_file_path, results.get(yml_file_path, {}).get("spectrum")
+                    ),
+                    yml_file_path in to_run,
+                )
+                for yml_file_path in paths
+            ]
+            for paths in epoch_series(config_paths)
+        ]
+        series = [
+            series_epochs
+            for series_epochs in series
+            if any(run for _, _, run in series_epochs)
+        ]
+
+    # the cores are split between the workers that are started, no more than the tasks
+    n_workers = max(min(n_workers, len(series) if chain else len(epochs)), 1)
+    if n_threads is None:
+        n_threads = threads_per_worker(n_workers)
+
+    if chain and n_workers == 1:
+        _init_tardis_worker(n_threads)
+        series_results = (
+            run_epoch_series(
+                series_epochs,
+                compare_cold=compare_cold,
+                return_spectrum=return_spectrum,
+            )
+            for series_epochs in series
+        )
+        for series_epochs, epochs_results in zip(series, series_results):
+            _finish_series(series_epochs, epochs_results, finish_epoch)
+    elif chain:
+        with ProcessPoolExecutor(
+            n_workers,
+            initializer=_init_tardis_worker,
+            initargs=(n_threads,),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    run_epoch_series,
+                    series_epochs,
+                    compare_cold=compare_cold,
+                    return_spectrum=return_spectrum,
+                ): series_epochs
+                for series_epochs in series
+            }
+            for future in as_completed(futures):
+                _finish_series(futures[future], future.result(), finish_epoch)
+    elif n_workers == 1:
+        _init_tardis_worker(n_threads)
+        for yml_file_path, spec_output_file in epochs:
+            finish_epoch(
+                yml_file_path,
+                run_epoch_config(
+                    yml_file_path, spec_output_file, return_spectrum=return_spectrum
+                ),
+            )
+    else:
+        with ProcessPoolExecutor(
+            n_workers,
+            initializer=_init_tardis_worker,
+            initargs=(n_threads,),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    run_epoch_config,
+                    yml_file_path,
+                    spec_output_file,
+                    return_spectrum=return_spectrum,
+                ): yml_file_path
+                for yml_file_path, spec_output_file in epochs
+            }
+            for future in as_completed(futures):
+                finish_epoch(futures[future], future.result())
+    return [results[yml_file_path] for yml_file_path in config_paths]
+
+
+def _finish_series(epochs, epochs_results, finish_epoch):
+    """Finish the epochs that ran in a series, see run_epoch_configs"""
+    for (yml_file_path, _, run), result in zip(epochs, epochs_results):
+        if run:
+            finish_epoch(yml_file_path, result)
+
+
+def print_run_report(results, wall_seconds, file=sys.stdout):
+    """
+    Purpose:
+    Print the time and iterations of each epoch, the totals, the time spent loading and
+    copying the atomic data of the workers (see run_atom_data), the iterations saved by
+    the warm starts if they were compared (see run_epoch_series), and the errors of the
+    failed epochs
+    -------------------
+    results: list, the run_epoch_configs results
+    wall_seconds: float, the wall time of the whole batch
+    file: the stream to print to, default sys.stdout
+    -------------------
+    """
+    compared = [
+        result
+        for result in results
+        if result["warm_started"] and result["cold_iterations"] is not None
+    ]
+    name_width = max([len("config")] + [len(result["config"]) for result in results])
+    header = (
+        f"{'config':<{name_width}}  {'status':<7}  {'time (s)':>9}  {'worker':>7}  "
+        f"{'iters':>5}  {'warm':>4}"
+    )
+    if len(compared) > 0:
+        header += f"  {'cold':>5}"
+    print(header, file=file)
+    print("-" * len(header), file=file)
+    for result in results:
+        line = (
+            f"{result['config']:<{name_width}}  {result['status']:<7}  "
+            f"{result['seconds']:>9.2f}  {result['worker'] or '':>7}  "
+            f"{_optional(result['iterations']):>5}  "
+            f"{'yes' if result['warm_started'] else '':>4}"
+        )
+        if len(compared) > 0:
+            line += f"  {_optional(result['cold_iterations']):>5}"
+        print(line, file=file)
+    print("-" * len(header), file=file)
+
+    n_status = {
+        status: sum(result["status"] == status for result in results)
+        for status in ["ok", "skipped", "failed"]
+    }
+    run_seconds = sum(result["seconds"] for result in results)
+    print(
+        f"{len(results)} epochs, {n_status['ok']} ok, {n_status['skipped']} skipped, "
+        f"{n_status['failed']} failed",
+        file=file,
+    )
+    print(
+        f"wall time {wall_seconds:.2f} s, run time {run_seconds:.2f} s "
+        f"({run_seconds / max(wall_seconds, 1e-9):.1f}x parallel)",
+        file=file,
+    )
+    atom_data = {
+        key: sum(result["atom_data"][key] for result in results)
+        for key in ["loads", "load_seconds", "copies", "copy_seconds"]
+    }
+    if atom_data["copies"] > 0:
+        print(
+            f"atomic data: {atom_data['loads']} loads in {atom_data['load_seconds']:.2f} s, "
+            f"{atom_data['copies']} run copies in {atom_data['copy_seconds']:.3f} s "
+            f"({1000 * atom_data['copy_seconds'] / atom_data['copies']:.2f} ms per run)",
+            file=file,
+        )
+    if len(compared) > 0:
+        warm_iterations = sum(result["iterations"] for result in compared)
+        cold_iterations = sum(result["cold_iterations"] for result in compared)
+        print(
+            f"warm starts: {len(compared)} epochs converged in {warm_iterations} "
+            f"iterations instead of {cold_iterations}, "
+            f"{cold_iterations - warm_iterations} saved "
+            f"({(cold_iterations - warm_iterations) / max(cold_iterations, 1):.0%})",
+            file=file,
+        )
+    for result in results:
+        if result["error"] is not None:
+            print(f"\n{result['config']} failed: {result['error']}", file=file)
+
+
+def _optional(value):
+    return "" if value is None else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run TARDIS on many epoch configs over a pool of worker processes"
+    )
+    parser.add_argument(
+        "configs",
+        nargs="+",
+        help="folders of epoch configs or glob patterns of config files",
+    )
+    parser.add_argument(
+        "--output-folder",
+        default="tardis_spectra",
+        help="folder of the spectrum csv files, default tardis_spectra",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="montecarlo threads of each worker, default the cores split between the workers",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="rerun the epochs whose spectrum csv exists or is in the store",
+    )
+    parser.add_argument(
+        "--chain",
+        action="store_true",
+        help="warm start the epochs of each folder from the previous epoch, in time order",
+    )
+    parser.add_argument(
+        "--compare-cold",
+        action="store_true",
+        help="with --chain, also run the warm started epochs from their own model and "
+        "report the iterations saved",
+    )
+    parser.add_argument(
+        "--store",
+        default=None,
+        help="also append the spectra to this HDF5 file, see spectra_store.SpectraStore",
+    )
+    parser.add_argument(
+        "--no-csv",
+        action="store_true",
+        help="with --store, do not write the spectrum csv files",
+    )
+    args = parser.parse_args(argv)
+    if args.compare_cold and not args.chain:
+        parser.error("--compare-cold needs --chain")
+    if args.no_csv and args.store is None:
+        parser.error("--no-csv needs --store")
+
+    config_paths = find_epoch_configs(args.configs)
+    if len(config_paths) == 0:
+        parser.error(f"no epoch configs found in {args.configs}")
+    try:
+        check_unique_model_names(config_paths)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    results = run_epoch_configs(
+        config_paths,
+        args.output_folder,
+        n_workers=args.workers,
+        n_threads=args.threads,
+        overwrite=args.overwrite,
+        chain=args.chain,
+        compare_cold=args.compare_cold,
+        spectra_store=None if args.store is None else SpectraStore(args.store),
+        write_csv=not args.no_csv,
+        epoch_done_callback=lambda result: print(
+            f"{result['config']}: {result['status']} in {result['seconds']:.1f} s",
+            flush=True,
+        ),
+    )
+    print_run_report(results, time.perf_counter() - start)
+    return 1 if any(result["status"] == "failed" for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
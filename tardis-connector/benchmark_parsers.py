@@ -0,0 +1,221 @@
+# Benchmarks for the connector parsers, run with:
+#   python benchmark_parsers.py [path/to/file.xg] [path/to/mesa.dayXXX.data]
+# Without a .xg file, a synthetic SNEC .xg file is generated in a temporary folder.
+# Without a STELLA snapshot, the snapshot of example_stella_explosion is used.
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from snec_to_tardis_parser import (
+    delete_non_increasing_neighbour,
+    read_xg_file,
+    xg_to_dict,
+)
+from stella_utils import read_stella_columns
+from tardis.io.model import read_stella_model
+from tardis_utils import (
+    increasing_subsequence_mask,
+    rebin_shell_profiles,
+    regular_bin_starts,
+    write_csv_rows,
+)
+
+EXAMPLE_STELLA_SNAPSHOT = (
+    Path(__file__).parent
+    / "example_stella_explosion"
+    / "res"
+    / "mesa.day001_post_Lbol_max.data"
+)
+
+
+def write_synthetic_xg(fname, n_times=500, n_zones=1000, seed=0):
+    """Write a SNEC-like .xg file with n_times snapshots of n_zones (mass, value) rows."""
+    rng = np.random.default_rng(seed)
+    mass = np.cumsum(rng.uniform(1e30, 1e31, n_zones))
+    with open(fname, "w") as wf:
+        for time_step in np.linspace(0, 1e7, n_times):
+            wf.write(f'"Time =   {time_step:.10E}\n')
+            values = rng.uniform(1e5, 1e9, n_zones)
+            np.savetxt(wf, np.column_stack([mass, values]), fmt="%.10E")
+            wf.write("\n")
+
+
+def time_function(func, *args, repeat=3):
+    """Return the best wall time (in seconds) of repeated calls and the last result."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_xg_reader(fname, repeat=3):
+    """Compare read_xg_file against xg_to_dict on the same .xg file and check the results match."""
+    t_dict, snec_xg_data = time_function(xg_to_dict, fname, repeat=repeat)
+    t_array, (times, snec_xg_array) = time_function(read_xg_file, fname, repeat=repeat)
+
+    assert np.array_equal(times, np.array(list(snec_xg_data.keys())))
+    for i, data in enumerate(snec_xg_data.values()):
+        assert np.array_equal(snec_xg_array[i], data)
+
+    print(
+        f"{Path(fname).name}: {snec_xg_array.shape[0]} snapshots x {snec_xg_array.shape[1]} zones"
+    )
+    print(f"  xg_to_dict   : {t_dict:.3f} s")
+    print(f"  read_xg_file : {t_array:.3f} s  ({t_dict / t_array:.1f}x faster)")
+
+
+def adversarial_velocity_profiles(n_shells=1000, seed=0):
+    """Velocity profiles that need many passes of delete_non_increasing_neighbour."""
+    rng = np.random.default_rng(seed)
+    velocity = np.linspace(1e8, 1e9, n_shells)
+
+    # a single fast inner shell: every pass only removes one of the shells behind it
+    spike = velocity.copy()
+    spike[n_shells // 10] = 2 * velocity[-1]
+
+    # noisy early-time snapshot
+    noisy = velocity + rng.normal(0, 5 * (velocity[1] - velocity[0]), n_shells)
+
+    # repeated backward steps
+    sawtooth = velocity - 20 * (velocity[1] - velocity[0]) * (np.arange(n_shells) % 10)
+
+    return {"spike": spike, "noisy": noisy, "sawtooth": sawtooth}
+
+
+def filter_with_delete_non_increasing_neighbour(velocity):
+    """The velocity filter of save_tardis_config_and_csvy before increasing_subsequence_mask."""
+    df = pd.DataFrame({"velocity": velocity})
+    while (df["velocity"].diff() <= 0).any():
+        df = delete_non_increasing_neighbour(df, "velocity")
+    return df.index.values
+
+
+def benchmark_increasing_filter(n_shells=1000, repeat=3):
+    """Compare increasing_subsequence_mask against the repeated delete_non_increasing_neighbour."""
+    print(f"monotonic velocity filter on {n_shells} shells:")
+    for name, velocity in adversarial_velocity_profiles(n_shells).items():
+        t_loop, kept_index = time_function(
+            filter_with_delete_non_increasing_neighbour, velocity, repeat=repeat
+        )
+        t_mask, mask = time_function(
+            increasing_subsequence_mask, velocity, repeat=repeat
+        )
+        assert np.array_equal(np.flatnonzero(mask), kept_index)
+        print(
+            f"  {name:>8}: loop {t_loop * 1e3:8.2f} ms, mask {t_mask * 1e3:6.3f} ms"
+            f"  ({t_loop / t_mask:.0f}x faster, {mask.sum()} shells kept)"
+        )
+
+
+def benchmark_rebin(n_shells=1000, n_isotopes=20, num_keep_shells=45, repeat=20):
+    """Compare rebin_shell_profiles against the groupby mean it replaced."""
+    rng = np.random.default_rng(0)
+    df_profiles = pd.DataFrame(
+        rng.uniform(0, 1, (n_shells, n_isotopes + 3)),
+        columns=["velocity", "density", "t_rad"] + [f"X{i}" for i in range(n_isotopes)],
+    )
+    df_profiles["velocity"] = np.linspace(1e8, 1e9, n_shells)
+    shell_gap_length = max(int(np.floor(n_shells / num_keep_shells)), 1)
+
+    t_groupby, df_groupby = time_function(
+        lambda: df_profiles.groupby(np.arange(n_shells) // shell_gap_length).mean(),
+        repeat=repeat,
+    )
+    t_rebin, df_rebin = time_function(
+        lambda: rebin_shell_profiles(
+            df_profiles, regular_bin_starts(n_shells, num_keep_shells)
+        ),
+        repeat=repeat,
+    )
+    t_mass, _ = time_function(
+        lambda: rebin_shell_profiles(
+            df_profiles,
+            regular_bin_starts(n_shells, num_keep_shells),
+            weighting="mass",
+        ),
+        repeat=repeat,
+    )
+    assert np.allclose(df_rebin.values, df_groupby.values, rtol=1e-14)
+    print(
+        f"rebin {n_shells} shells x {n_isotopes + 3} columns to {len(df_rebin)} shells:"
+    )
+    print(f"  groupby mean : {t_groupby * 1e3:.3f} ms")
+    print(
+        f"  reduceat     : {t_rebin * 1e3:.3f} ms  ({t_groupby / t_rebin:.1f}x faster),"
+        f" mass-weighted {t_mass * 1e3:.3f} ms"
+    )
+
+
+def benchmark_stella_reader(fname, repeat=10):
+    """Compare read_stella_columns against read_stella_model on the same STELLA snapshot
+    and check the values match."""
+    t_model, stella_model = time_function(read_stella_model, fname, repeat=repeat)
+    t_columns, (t_max, stella_columns) = time_function(
+        read_stella_columns, fname, repeat=repeat
+    )
+
+    assert t_max == stella_model.metadata["t_max"].value
+    for col, values in stella_columns.items():
+        assert np.array_equal(stella_model.data[col].values, values), col
+
+    print(
+        f"{Path(fname).name}: {stella_model.data.shape[0]} zones, "
+        f"{len(stella_columns)} of {stella_model.data.shape[1]} columns read"
+    )
+    print(f"  read_stella_model   : {t_model * 1e3:.2f} ms")
+    print(
+        f"  read_stella_columns : {t_columns * 1e3:.2f} ms  (speedup {t_model / t_columns:.2f}x)"
+    )
+
+
+def csv_lines_with_to_csv(df_csv):
+    """The csv body of TardisTemplates.write_csvy before write_csv_rows."""
+    csv_lines = df_csv.to_csv(index=False, float_format="%.5e", sep=",").splitlines()
+    return "".join([line + "\n" for line in csv_lines])
+
+
+def csv_text_with_write_csv_rows(df_csv):
+    with io.StringIO() as wf:
+        write_csv_rows(wf, df_csv)
+        return wf.getvalue()
+
+
+def benchmark_csv_writer(n_shells=5000, n_isotopes=300, repeat=3):
+    """Compare write_csv_rows against the to_csv lines it replaced and check the text matches."""
+    rng = np.random.default_rng(0)
+    df_csv = pd.DataFrame(
+        rng.uniform(0, 1, (n_shells, n_isotopes + 3)),
+        columns=["velocity", "density", "t_rad"] + [f"X{i}" for i in range(n_isotopes)],
+    )
+    t_lines, text_lines = time_function(csv_lines_with_to_csv, df_csv, repeat=repeat)
+    t_rows, text_rows = time_function(
+        csv_text_with_write_csv_rows, df_csv, repeat=repeat
+    )
+    assert text_rows == text_lines
+    print(f"csv body of {n_shells} shells x {n_isotopes + 3} columns:")
+    print(f"  to_csv lines   : {t_lines:.3f} s")
+    print(f"  write_csv_rows : {t_rows:.3f} s  ({t_lines / t_rows:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    xg_files = [arg for arg in sys.argv[1:] if arg.endswith(".xg")]
+    stella_files = [arg for arg in sys.argv[1:] if not arg.endswith(".xg")]
+    if len(xg_files) > 0:
+        for xg_file in xg_files:
+            benchmark_xg_reader(xg_file)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xg_file = Path(tmp_dir) / "vel.xg"
+            write_synthetic_xg(xg_file)
+            benchmark_xg_reader(xg_file)
+    benchmark_increasing_filter()
+    benchmark_rebin()
+    benchmark_csv_writer()
+    for stella_file in stella_files or [EXAMPLE_STELLA_SNAPSHOT]:
+        benchmark_stella_reader(stella_file)
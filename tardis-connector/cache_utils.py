@@ -0,0 +1,292 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1 << 20  # read files in 1 MB chunks when hashing
+MANIFEST_FILE_NAME = "conversion_manifest.json"
+
+
+def file_fingerprint(file_path, include_mtime=True):
+    """
+    Purpose:
+    ---------
+    Get the size, modification time and content hash of a file.
+
+    ----------
+    Parameters:
+        file_path: str or Path
+        include_mtime: bool, default True
+            If False, leave out the modification time, so the fingerprint only
+            depends on the file name and content
+
+    ----------
+    Returns:
+        fingerprint: dict
+            name, size (bytes), mtime_ns and sha256 of the file
+    """
+    stat = os.stat(file_path)
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as rf:
+        for chunk in iter(lambda: rf.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+
+    fingerprint = {
+        "name": Path(file_path).name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256.hexdigest(),
+    }
+    if not include_mtime:
+        del fingerprint["mtime_ns"]
+    return fingerprint
+
+
+def cache_key(file_paths, extra=None, include_mtime=True):
+    """
+    Purpose:
+    ---------
+    Build a cache key from the fingerprints of the source files.
+
+    ----------
+    Parameters:
+        file_paths: list
+            The source files that the cached data is parsed from
+        extra: dict or None
+            Additional (json serializable) information that changes the cached data,
+            e.g. the name and version of the parser
+        include_mtime: bool, default True
+            If False, the key only depends on the names and content of the files,
+            see file_fingerprint
+
+    ----------
+    Returns:
+        key: str
+    """
+    payload = {
+        "files": [
+            file_fingerprint(file_path, include_mtime) for file_path in file_paths
+        ],
+        "extra": extra,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def save_array_cache(cache_folder_path, key, arrays):
+    """
+    Purpose:
+    ---------
+    Save a dictionary of numpy arrays as .npy files in cache_folder_path/key.
+
+    The arrays are first written to a temporary folder that is then renamed, so an
+    interrupted write never leaves a partial cache entry behind.
+
+    ----------
+    Parameters:
+        cache_folder_path: str or Path
+        key: str
+            The cache key, see cache_key
+        arrays: dict
+            name -> numpy array
+    """
+    cache_folder_path = Path(cache_folder_path)
+    cache_folder_path.mkdir(parents=True, exist_ok=True)
+    entry_path = cache_folder_path / key
+
+    tmp_entry_path = Path(tempfile.mkdtemp(dir=cache_folder_path, prefix=f".{key}."))
+    try:
+        for name, array in arrays.items():
+            np.save(tmp_entry_path / f"{name}.npy", np.asarray(array))
+        if entry_path.exists():
+            shutil.rmtree(entry_path)
+        os.replace(tmp_entry_path, entry_path)
+    except BaseException:
+        shutil.rmtree(tmp_entry_path, ignore_errors=True)
+        raise
+    logger.info(f"Saved {len(arrays)} arrays to cache {entry_path}")
+
+
+def load_array_cache(cache_folder_path, key, mmap_mode="r"):
+    """
+    Purpose:
+    ---------
+    Load the numpy arrays saved by save_array_cache.
+
+    ----------
+    Parameters:
+        cache_folder_path: str or Path
+        key: str
+            The cache key, see cache_key
+        mmap_mode: str or None, default "r"
+            Passed to np.load, by default the arrays are memory-mapped read-only
+
+    ----------
+    Returns:
+        arrays: dict or None
+            name -> numpy array, None if there is no cache entry for the key
+    """
+    entry_path = Path(cache_folder_path) / key
+    if not entry_path.is_dir():
+        return None
+
+    arrays = {
+        npy_file.stem: np.load(npy_file, mmap_mode=mmap_mode)
+        for npy_file in sorted(entry_path.glob("*.npy"))
+    }
+    logger.info(f"Loaded {len(arrays)} arrays from cache {entry_path}")
+    return arrays
+
+
+class ConversionManifest:
+    """
+    Purpose:
+    ---------
+    Record which inputs each output epoch of a conversion was written from.
+
+    The manifest is a json file in the output folder that maps the name of each
+    epoch to the key of its inputs (see cache_key) and its output files. A re-run
+    can then skip the epochs whose key is unchanged and whose outputs still exist,
+    and regenerate only the stale ones. The manifest is rewritten after every
+    recorded epoch, so an interrupted run resumes where it stopped.
+
+    The manifest also keeps the epochs that were selected from each set of shared
+    inputs (see record_selection), so a re-run can find that all its epochs are up
+    to date before it parses the inputs to select them again.
+
+    ----------
+    Parameters:
+        output_folder_path: str or Path
+            The folder that holds the outputs and the manifest
+    """
+
+    def __init__(self, output_folder_path):
+        self.output_folder_path = Path(output_folder_path)
+        self.manifest_path = self.output_folder_path / MANIFEST_FILE_NAME
+        self.epochs = {}
+        self.selections = {}
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path) as rf:
+                    manifest = json.load(rf)
+                self.epochs = manifest["epochs"]
+                self.selections = manifest.get("selections", {})
+            except (ValueError, KeyError) as e:
+                logger.warning(
+                    f"Ignoring unreadable manifest {self.manifest_path}: {e}"
+                )
+
+    def is_up_to_date(self, epoch_name, key):
+        """
+        Purpose:
+        ---------
+        Whether the epoch was written from the same inputs and its outputs still exist.
+
+        ----------
+        Parameters:
+            epoch_name: str
+            key: str
+                The key of the current inputs of the epoch
+
+        ----------
+        Returns:
+            bool
+        """
+        entry = self.epochs.get(epoch_name)
+        if entry is None or entry["key"] != key:
+            return False
+        return all(
+            (self.output_folder_path / name).exists() for name in entry["outputs"]
+        )
+
+    def record(self, epoch_name, key, output_paths=()):
+        """
+        Purpose:
+        ---------
+        Record that the epoch was written from the inputs with this key and save the
+        manifest.
+
+        ----------
+        Parameters:
+            epoch_name: str
+            key: str
+            output_paths: list
+                The files written for the epoch, empty if the epoch was skipped on
+                purpose
+        """
+        self.epochs[epoch_name] = {
+            "key": key,
+            "outputs": [Path(output_path).name for output_path in output_paths],
+        }
+        self.save()
+
+    def record_selection(self, selection_key, epoch_keys, skipped=()):
+        """
+        Purpose:
+        ---------
+        Record the epochs selected from the shared inputs with this key and save the
+        manifest.
+
+        ----------
+        Parameters:
+            selection_key: str
+                The key of the inputs and options that select the epochs
+            epoch_keys: dict
+                epoch name -> key of the epoch, see record
+            skipped: list
+                The requested epochs that the inputs do not have
+        """
+        self.selections[selection_key] = {
+            "epochs": dict(epoch_keys),
+            "skipped": list(skipped),
+        }
+        self.save()
+
+    def selection_is_up_to_date(self, selection_key):
+        """
+        Purpose:
+        ---------
+        Whether the epochs were selected from the same shared inputs before and every
+        one of them is up to date, see is_up_to_date.
+
+        ----------
+        Parameters:
+            selection_key: str
+
+        ----------
+        Returns:
+            bool
+        """
+        selection = self.selections.get(selection_key)
+        if selection is None or "epochs" not in selection:
+            return False
+        return all(
+            self.is_up_to_date(epoch_name, key)
+            for epoch_name, key in selection["epochs"].items()
+        )
+
+    def save(self):
+        """Write the manifest atomically, so an interruption never leaves it half written."""
+        self.output_folder_path.mkdir(parents=True, exist_ok=True)
+        tmp_fd, tmp_path = tempfile.mkstemp(
+            dir=self.output_folder_path, prefix=f".{MANIFEST_FILE_NAME}."
+        )
+        try:
+            with os.fdopen(tmp_fd, "w") as wf:
+                json.dump(
+                    {"epochs": self.epochs, "selections": self.selections},
+                    wf,
+                    indent=1,
+                    sort_keys=True,
+                )
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,207 @@
+import functools
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import tardis
+from tardis.util.base import atomic_number2element_symbol, is_valid_nuclide_or_elem
+
+logger = logging.getLogger(__name__)
+
+NUCLIDE_TABLE_VERSION = 1  # bump when the way the table is built changes
+NUCLIDE_TABLE_FILE_NAME = "nuclide_table.json"
+MAX_ATOMIC_NUMBER = 118
+DEFAULT_NUCLIDE_CACHE_FOLDER = (
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "tardis-connector"
+)
+
+
+def candidate_mass_numbers(atomic_number):
+    """The mass numbers checked for each element, from A = Z up to A = 3 Z + 8, which
+    covers the known nuclides (e.g. H7, He10, Ni78, U242)"""
+    return range(atomic_number, 3 * atomic_number + 9)
+
+
+class NuclideTable:
+    """
+    Purpose:
+    ---------
+    Constant-time lookups of the nuclide and element symbols used by the parsers.
+    The table maps the atomic number (and mass number) of the SNEC composition
+    headers to the TARDIS symbols, e.g. (28, 56) -> Ni56, the lowercase MESA and
+    STELLA isotope names to the TARDIS symbols, e.g. ni56 -> Ni56, and holds the
+    symbols that tardis.util.base.is_valid_nuclide_or_elem accepts. Build it once
+    with load_nuclide_table, which caches it on disk.
+
+    ----------
+    Parameters:
+        element_symbols: list
+            The element symbol of each atomic number, None where there is none (Z = 0)
+        valid_symbols: iterable
+            The element and nuclide symbols that are valid in TARDIS
+    """
+
+    def __init__(self, element_symbols, valid_symbols):
+        self.element_symbols = list(element_symbols)
+        self.valid_symbols = frozenset(valid_symbols)
+        # the nuclide symbols that were checked, the others are checked when first used
+        self.checked_symbols = frozenset(
+            f"{element_symbol}{mass_number}"
+            for atomic_number, element_symbol in enumerate(self.element_symbols)
+            if element_symbol is not None
+            for mass_number in candidate_mass_numbers(atomic_number)
+        ) | frozenset(symbol for symbol in self.element_symbols if symbol is not None)
+        self.symbols_by_lowercase = {
+            symbol.lower(): symbol for symbol in self.checked_symbols
+        }
+
+    def symbol(self, atomic_number, mass_number=None):
+        """The element symbol of an atomic number, e.g. 28 -> Ni, or with the mass number
+        the nuclide symbol, e.g. (28, 56) -> Ni56"""
+        atomic_number = int(atomic_number)
+        if 0 <= atomic_number < len(self.element_symbols):
+            element_symbol = self.element_symbols[atomic_number]
+        else:
+            element_symbol = None
+        if element_symbol is None:
+            element_symbol = atomic_number2element_symbol(atomic_number)
+        if mass_number is None:
+            return element_symbol
+        return f"{element_symbol}{int(mass_number)}"
+
+    def from_lowercase(self, name):
+        """The TARDIS symbol of a lowercase MESA or STELLA isotope name, e.g. ni56 -> Ni56.
+        Names that are not in the table get their first letter capitalized"""
+        symbol = self.symbols_by_lowercase.get(name.lower())
+        if symbol is None:
+            symbol = name[0].capitalize() + name[1:]
+        return symbol
+
+    def is_valid(self, symbol):
+        """tardis.util.base.is_valid_nuclide_or_elem, from the table for the symbols it
+        checked and otherwise from TARDIS (looked up once per symbol and process)"""
+        if symbol in self.valid_symbols:
+            return True
+        if symbol in self.checked_symbols:
+            return False
+        return _is_valid_nuclide_or_elem_uncached(symbol)
+
+    def to_json(self):
+        return {
+            "version": NUCLIDE_TABLE_VERSION,
+            "tardis_version": _tardis_version(),
+            "element_symbols": self.element_symbols,
+            "valid_symbols": sorted(self.valid_symbols),
+        }
+
+
+@functools.cache
+def _is_valid_nuclide_or_elem_uncached(symbol):
+    return is_valid_nuclide_or_elem(symbol)
+
+
+def _tardis_version():
+    return getattr(tardis, "__version__", "unknown")
+
+
+def build_nuclide_table(max_atomic_number=MAX_ATOMIC_NUMBER):
+    """
+    Purpose:
+    ---------
+    Check the symbols of all the elements up to max_atomic_number and of their
+    candidate nuclides (see candidate_mass_numbers) with TARDIS.
+
+    ----------
+    Parameters:
+        max_atomic_number: int, default MAX_ATOMIC_NUMBER
+            The elements past the last atomic number that TARDIS knows are left out
+
+    ----------
+    Returns:
+        NuclideTable
+    """
+    element_symbols = [None]
+    for atomic_number in range(1, max_atomic_number + 1):
+        try:
+            element_symbols.append(atomic_number2element_symbol(atomic_number))
+        except (KeyError, IndexError):
+            break
+
+    valid_symbols = []
+    for atomic_number, element_symbol in enumerate(element_symbols):
+        if element_symbol is None:
+            continue
+        candidates = [element_symbol] + [
+            f"{element_symbol}{mass_number}"
+            for mass_number in candidate_mass_numbers(atomic_number)
+        ]
+        valid_symbols += [
+            symbol for symbol in candidates if is_valid_nuclide_or_elem(symbol)
+        ]
+    return NuclideTable(element_symbols, valid_symbols)
+
+
+@functools.cache
+def load_nuclide_table(cache_folder_path=DEFAULT_NUCLIDE_CACHE_FOLDER):
+    """
+    Purpose:
+    ---------
+    The NuclideTable, built once and saved in cache_folder_path, then read from there
+    by every process (and once per process) until the TARDIS version changes.
+
+    ----------
+    Parameters:
+        cache_folder_path: str, Path or None, default DEFAULT_NUCLIDE_CACHE_FOLDER
+            The folder of the cached table ($XDG_CACHE_HOME/tardis-connector or
+            ~/.cache/tardis-connector), None to build the table without the disk cache
+
+    ----------
+    Returns:
+        NuclideTable
+    """
+    if cache_folder_path is None:
+        return build_nuclide_table()
+
+    table_path = Path(cache_folder_path) / NUCLIDE_TABLE_FILE_NAME
+    if table_path.exists():
+        try:
+            with open(table_path) as rf:
+                table_json = json.load(rf)
+            if (
+                table_json["version"] == NUCLIDE_TABLE_VERSION
+                and table_json["tardis_version"] == _tardis_version()
+            ):
+                return NuclideTable(
+                    table_json["element_symbols"], table_json["valid_symbols"]
+                )
+            logger.info(f"Rebuilding the outdated nuclide table {table_path}")
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Rebuilding the unreadable nuclide table {table_path}: {e}")
+
+    table = build_nuclide_table()
+    try:
+        save_nuclide_table(table, table_path)
+    except OSError as e:
+        logger.warning(f"Could not save the nuclide table to {table_path}: {e}")
+    return table
+
+
+def save_nuclide_table(table, table_path):
+    """Write the table as json atomically, so other processes never read half of it."""
+    table_path = Path(table_path)
+    table_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        dir=table_path.parent, prefix=f".{table_path.name}."
+    )
+    try:
+        with os.fdopen(tmp_fd, "w") as wf:
+            json.dump(table.to_json(), wf)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates the file readable by the owner only
+        os.replace(tmp_path, table_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"Saved the nuclide table to {table_path}")
@@ -1,6 +1,11 @@
 import glob
 import logging
+import mmap
+import multiprocessing
 import os
+import re
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
@@ -8,16 +13,37 @@ import pandas as pd
 import yaml
 from scipy import interpolate
 
-from tardis_utils import write_tardis_csvy, write_tardis_config
-from tardis.util.base import (
-    atomic_number2element_symbol,
-    is_valid_nuclide_or_elem,
+from cache_utils import ConversionManifest, cache_key, load_array_cache, save_array_cache
+from nuclide_table import load_nuclide_table
+from stage_profiler import (
+    merge_stage_records,
+    profile_stage,
+    profiled,
+    stage_profiling_settings,
+    thread_profiled,
+    worker_stage_records,
+)
+from tardis_utils import (
+    ProfileRemapper,
+    increasing_subsequence_mask,
+    load_tardis_templates,
+    rebin_shell_profiles,
+    regular_bin_starts,
 )
 
 logger = logging.getLogger(__name__)
 
 XG_FILE_NAMES = ["vel", "rho", "temp", "tau"]
 DAT_FILE_NAMES = ["lum_observed", "T_eff", "vel_photo", "lum_photo", "index_photo"]
+XG_TIME_HEADER_RE = re.compile(r"^[^\n]*Time[^\n]*$", re.MULTILINE)
+
+# inputs shared by all epochs written by parse_snec_to_tardis, see save_epochs_in_parallel
+_EPOCH_WORKER_INPUTS = {}
+
+
+def _init_epoch_worker(shared_epoch_inputs):
+    """Set the shared inputs in a worker that does not inherit them (spawn start method)"""
+    _EPOCH_WORKER_INPUTS.update(shared_epoch_inputs)
 
 
 def xg_to_dict(fname):
@@ -51,6 +77,214 @@ def xg_to_dict(fname):
     return snec_xg_data
 
 
+def read_xg_file(fname):
+    """
+    Parse the .xg file from SNEC output into a single 3D array in one pass.
+    Each "Time" block is parsed directly into a preallocated array, instead of
+    building a list of arrays line by line as in xg_to_dict.
+
+    Parameters
+    ----------
+    fname : str
+
+    Returns
+    -------
+    times : numpy array
+        The time of each snapshot, shape (n_times,)
+    snec_xg_array : numpy array
+        The (mass, value) pairs of each snapshot, shape (n_times, n_zones, 2)
+    """
+    with open(fname) as rf:
+        text = rf.read()
+
+    header_starts = [match.start() for match in XG_TIME_HEADER_RE.finditer(text)]
+    if len(header_starts) == 0:
+        raise ValueError(f"No time block found in {fname}")
+    block_ends = header_starts[1:] + [len(text)]
+
+    times = np.empty(len(header_starts), dtype=np.float64)
+    snec_xg_array = None
+    for i, (block_start, block_end) in enumerate(zip(header_starts, block_ends)):
+        header_end = text.find("\n", block_start, block_end)
+        if header_end == -1:
+            header_end = block_end
+        times[i] = float(text[block_start:header_end].split()[-1])
+        block_data = np.fromstring(text[header_end:block_end], sep=" ")
+
+        # the first block sets the number of zones for the preallocated array
+        if snec_xg_array is None:
+            n_zones = block_data.size // 2
+            snec_xg_array = np.empty((len(header_starts), n_zones, 2), dtype=np.float64)
+        if block_data.size != snec_xg_array[i].size:
+            raise ValueError(
+                f"Time block {times[i]} in {fname} has {block_data.size // 2} zones, "
+                f"expected {snec_xg_array.shape[1]}"
+            )
+        snec_xg_array[i] = block_data.reshape(-1, 2)
+
+    return times, snec_xg_array
+
+
+def index_xg_file(fname):
+    """
+    Scan the .xg file from SNEC output once and record where each "Time" block is,
+    without parsing the data, so single snapshots can be read later with read_xg_blocks.
+
+    Parameters
+    ----------
+    fname : str
+
+    Returns
+    -------
+    times : numpy array
+        The time of each snapshot, shape (n_times,)
+    block_offsets : numpy array
+        The byte offsets of the start and end of the data of each snapshot, shape (n_times, 2)
+    """
+    times = []
+    header_starts = []
+    data_starts = []
+    with open(fname, "rb") as rf:
+        if os.fstat(rf.fileno()).st_size == 0:
+            raise ValueError(f"No time block found in {fname}")
+        with mmap.mmap(rf.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            file_size = mm.size()
+            position = mm.find(b"Time")
+            while position != -1:
+                line_start = mm.rfind(b"\n", 0, position) + 1
+                line_end = mm.find(b"\n", position)
+                if line_end == -1:
+                    line_end = file_size
+                times.append(float(mm[line_start:line_end].split()[-1]))
+                header_starts.append(line_start)
+                data_starts.append(line_end)
+                position = mm.find(b"Time", line_end)
+
+    if len(times) == 0:
+        raise ValueError(f"No time block found in {fname}")
+    block_offsets = np.column_stack([data_starts, header_starts[1:] + [file_size]]).astype(np.int64)
+
+    return np.array(times), block_offsets
+
+
+def read_xg_blocks(fname, block_offsets):
+    """
+    Parse only the selected snapshots of the .xg file from SNEC output, seeking to the
+    byte offsets recorded by index_xg_file.
+
+    Parameters
+    ----------
+    fname : str
+    block_offsets : numpy array
+        The (start, end) byte offsets of the selected snapshots, shape (n_selected, 2)
+
+    Returns
+    -------
+    snec_xg_array : numpy array
+        The (mass, value) pairs of the selected snapshots, shape (n_selected, n_zones, 2)
+    """
+    snec_xg_array = None
+    with open(fname, "rb") as rf:
+        for i, (block_start, block_end) in enumerate(block_offsets):
+            rf.seek(block_start)
+            block_data = np.fromstring(rf.read(block_end - block_start).decode(), sep=" ")
+            if snec_xg_array is None:
+                snec_xg_array = np.empty((len(block_offsets), block_data.size // 2, 2))
+            if block_data.size != snec_xg_array[i].size:
+                raise ValueError(
+                    f"Time block at byte {block_start} in {fname} has {block_data.size // 2} "
+                    f"zones, expected {snec_xg_array.shape[1]}"
+                )
+            snec_xg_array[i] = block_data.reshape(-1, 2)
+
+    if snec_xg_array is None:
+        return np.empty((0, 0, 2))
+    return snec_xg_array
+
+
+def load_xg_file(fname, lazy=False):
+    """
+    Load one .xg file from SNEC output for snec_data_to_dict.
+
+    Parameters
+    ----------
+    fname : str
+    lazy : bool, default False
+        If True, only index the file and return the values as an XgSnapshotSeries
+
+    Returns
+    -------
+    times : numpy array
+        The time of every snapshot, including the first one at time 0
+    mass : numpy array
+        The mass grid of the first snapshot, which all the other snapshots are checked against
+    values : numpy array or XgSnapshotSeries
+        The values of the snapshots after the first one, shape (n_times - 1, n_zones)
+    """
+    if lazy:
+        times, block_offsets = index_xg_file(fname)
+        mass = read_xg_blocks(fname, block_offsets[:1])[0, :, 0]
+        return times, mass, XgSnapshotSeries(fname, block_offsets[1:], mass)
+
+    times, snec_xg_array = read_xg_file(fname)
+    mass = snec_xg_array[0, :, 0].copy()
+    # check if the mass grid matches
+    assert np.all(snec_xg_array[1:, :, 0] == mass)
+    return times, mass, np.ascontiguousarray(snec_xg_array[1:, :, 1])
+
+
+class XgSnapshotSeries:
+    """
+    Lazy stand-in for the 2D (n_times, n_zones) array of one .xg file in the SNEC output.
+    Indexing with an integer parses that single snapshot from disk. Indexing with a mask,
+    slice or index array returns a smaller lazy series. np.asarray parses all of them.
+
+    Parameters
+    ----------
+    fname : str
+    block_offsets : numpy array
+        The (start, end) byte offsets of the snapshots in the series, see index_xg_file
+    mass : numpy array
+        The mass grid that every snapshot is checked against
+    """
+
+    def __init__(self, fname, block_offsets, mass):
+        self.fname = fname
+        self.block_offsets = np.asarray(block_offsets, dtype=np.int64).reshape(-1, 2)
+        self.mass = mass
+        self.dtype = np.dtype(np.float64)
+
+    @property
+    def shape(self):
+        return (len(self.block_offsets), len(self.mass))
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return len(self.block_offsets)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._read(self.block_offsets[[key]])[0]
+        selected_offsets = self.block_offsets[np.arange(len(self))[key]]
+        return XgSnapshotSeries(self.fname, selected_offsets, self.mass)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self._read(self.block_offsets)
+        return values if dtype is None else values.astype(dtype)
+
+    @profiled("xg_parse")
+    def _read(self, block_offsets):
+        snec_xg_array = read_xg_blocks(self.fname, block_offsets)
+        if len(block_offsets) == 0:
+            return np.empty((0, len(self.mass)))
+        # check if the mass grid matches
+        assert np.all(snec_xg_array[:, :, 0] == self.mass)
+        return snec_xg_array[:, :, 1]
+
+
 def parse_snec_to_tardis(
     snec_folder_path,
     tardis_example_config_folder_path,
@@ -63,6 +297,10 @@ def parse_snec_to_tardis(
     snec_data_folder_path_comp_boxcar=None,
     use_vel_diff=False,
     num_keep_shells=45,
+    rebin_weighting=None,
+    cache_folder_path=None,
+    n_workers=1,
+    overwrite=False,
 ):
     """
     Purpose:
@@ -114,13 +352,121 @@ def parse_snec_to_tardis(
             otherwise assume homologous for time step except the first one
         num_keep_shells: int
             The ROUGH number of shells to keep in the TARDIS model
+        rebin_weighting: None, "volume" or "mass", default None
+            How the density and composition are averaged when rebinning to num_keep_shells,
+            None for the plain mean of the shells, see tardis_utils.rebin_shell_profiles
+        cache_folder_path: str or None, default None
+            If given, cache the parsed SNEC output in this folder, so repeated conversions
+            of the same SNEC run skip re-parsing the .xg and .dat files
+        n_workers: int, default 1
+            The number of threads used to load the SNEC files and of processes used to
+            write the TARDIS files of the epochs, the output file names do not depend on it
+        overwrite: bool, default False
+            If False, skip the epochs whose outputs were already written from the same SNEC
+            files, templates and options, as recorded in the conversion manifest of
+            tardis_config_output_path (see cache_utils.ConversionManifest).
+            If True, rewrite all the epochs
     ----------
     output: (saved in tardis_config_output_path)
         time_series_log.csv
         tardis_config: yml files at each time
         tardis_model: csvy at each time
 
+    Returns:
+        dict_SNEC_output, df_snec_comps: see load_snec_conversion_inputs. The SNEC output is
+        always parsed, also when every epoch is up to date, see convert_snec_to_tardis to
+        skip it
+
     """
+    dict_SNEC_output, df_snec_comps, _ = _convert_snec_to_tardis(
+        snec_folder_path,
+        tardis_example_config_folder_path,
+        tardis_config_output_path,
+        time_in_days=time_in_days,
+        tau_upper_limit=tau_upper_limit,
+        tau_lower_limit=tau_lower_limit,
+        comps_profile_file_path=comps_profile_file_path,
+        comp_use_boxcared=comp_use_boxcared,
+        snec_data_folder_path_comp_boxcar=snec_data_folder_path_comp_boxcar,
+        use_vel_diff=use_vel_diff,
+        num_keep_shells=num_keep_shells,
+        rebin_weighting=rebin_weighting,
+        cache_folder_path=cache_folder_path,
+        n_workers=n_workers,
+        overwrite=overwrite,
+    )
+    return dict_SNEC_output, df_snec_comps
+
+
+def convert_snec_to_tardis(
+    snec_folder_path,
+    tardis_example_config_folder_path,
+    tardis_config_output_path,
+    overwrite=False,
+    **parser_options,
+):
+    """
+    Purpose:
+    ---------
+    Write the TARDIS config and csvy files of a SNEC model like parse_snec_to_tardis, but
+    only parse the SNEC output when an epoch is not up to date, and report the epochs
+    that fail to convert instead of raising their errors, e.g. for batch conversions.
+
+    ----------
+    Parameters:
+        snec_folder_path: str or Path
+            The path to the folder that contains the SNEC Data and profiles
+        tardis_example_config_folder_path: str or Path
+            The path to the folder that contains the TARDIS example config files
+        tardis_config_output_path: str
+            The folder of the TARDIS files and the conversion manifest
+        overwrite: bool, default False
+            If True, rewrite all the epochs, see parse_snec_to_tardis
+        parser_options:
+            The other keyword arguments of parse_snec_to_tardis
+
+    ----------
+    Returns:
+        dict with the "converted" and "up_to_date" epochs (csvy file names), the
+        "skipped" requested time_in_days that have no SNEC time step within 1 day and the
+        "failed" epochs mapped to their error, like
+        stella_to_tardis_parser.parse_stella_models_to_tardis_configs
+    """
+    _, _, summary = _convert_snec_to_tardis(
+        snec_folder_path,
+        tardis_example_config_folder_path,
+        tardis_config_output_path,
+        overwrite=overwrite,
+        parse_up_to_date=False,
+        isolate_failures=True,
+        **parser_options,
+    )
+    return summary
+
+
+def _convert_snec_to_tardis(
+    snec_folder_path,
+    tardis_example_config_folder_path,
+    tardis_config_output_path,
+    time_in_days=None,
+    tau_upper_limit=1e3,
+    tau_lower_limit=1e-10,
+    comps_profile_file_path=None,
+    comp_use_boxcared=False,
+    snec_data_folder_path_comp_boxcar=None,
+    use_vel_diff=False,
+    num_keep_shells=45,
+    rebin_weighting=None,
+    cache_folder_path=None,
+    n_workers=1,
+    overwrite=False,
+    parse_up_to_date=True,
+    isolate_failures=False,
+):
+    """parse_snec_to_tardis, which also returns the summary of convert_snec_to_tardis.
+    Unless parse_up_to_date, the SNEC output is not parsed (and None, None is returned
+    for it) when every epoch is up to date. With isolate_failures, an epoch that fails
+    is added to the summary instead of raising its error"""
     # get the folder name
     snec_folder_name = str(snec_folder_path).split("/")[-1]
     snec_data_folder_path = snec_folder_path / "output"
@@ -131,7 +477,399 @@ def parse_snec_to_tardis(
     )
     tardis_sample_csvy_path = tardis_example_config_folder_path / "tardis_example_csvy.csvy"
 
-    # read the snec data
+    if tardis_config_output_path is not None:
+        # the manifest key of the SNEC files, templates and options, which are only hashed
+        # here, so convert_snec_to_tardis can return before parsing them when all the
+        # epochs are up to date
+        manifest = ConversionManifest(tardis_config_output_path)
+        snec_comps_profile_file_path, snec_data_folder_path_comp_boxcar = snec_input_paths(
+            snec_folder_path,
+            comps_profile_file_path=comps_profile_file_path,
+            comp_use_boxcared=comp_use_boxcared,
+            snec_data_folder_path_comp_boxcar=snec_data_folder_path_comp_boxcar,
+        )
+        inputs_key = snec_conversion_inputs_key(
+            snec_data_folder_path,
+            snec_comps_profile_file_path,
+            snec_data_folder_path_comp_boxcar,
+            [tardis_sample_csvy_path, tardis_sample_config_path],
+            {
+                "tau_upper_limit": tau_upper_limit,
+                "tau_lower_limit": tau_lower_limit,
+                "num_keep_shells": num_keep_shells,
+                "rebin_weighting": rebin_weighting,
+            },
+        )
+        # the selected epochs also depend on the time mask and the requested days
+        selection_key = cache_key(
+            [],
+            extra={
+                "inputs": inputs_key,
+                "use_vel_diff": use_vel_diff,
+                "time_in_days": (
+                    None if time_in_days is None else [float(time) for time in time_in_days]
+                ),
+            },
+        )
+        if (
+            not parse_up_to_date
+            and not overwrite
+            and manifest.selection_is_up_to_date(selection_key)
+        ):
+            selection = manifest.selections[selection_key]
+            logger.info(
+                f"All {len(selection['epochs'])} epochs of {snec_folder_name} are up to date, "
+                "skipping the conversion"
+            )
+            summary = {
+                "converted": [],
+                "skipped": list(selection["skipped"]),
+                "up_to_date": list(selection["epochs"]),
+                "failed": {},
+            }
+            return None, None, summary
+
+    (
+        dict_SNEC_output,
+        df_snec_comps,
+        snec_comps_profile_file_path,
+        snec_data_folder_path_comp_boxcar,
+    ) = load_snec_conversion_inputs(
+        snec_folder_path,
+        comps_profile_file_path=comps_profile_file_path,
+        comp_use_boxcared=comp_use_boxcared,
+        snec_data_folder_path_comp_boxcar=snec_data_folder_path_comp_boxcar,
+        use_vel_diff=use_vel_diff,
+        lazy=time_in_days is not None,
+        cache_folder_path=cache_folder_path,
+        n_workers=n_workers,
+    )
+
+    summary = {"converted": [], "skipped": [], "up_to_date": [], "failed": {}}
+    if tardis_config_output_path is not None:
+        # create the output folder if not exsit
+        if not os.path.exists(tardis_config_output_path):
+            os.makedirs(tardis_config_output_path)
+
+        # collect the time index and output file names of each epoch to write
+        epochs = [
+            (
+                time_index,
+                f"{tardis_config_output_path}/{csvy_file_name}",
+                f"{tardis_config_output_path}/{config_file_name}",
+                message,
+            )
+            for time_index, csvy_file_name, config_file_name, message in select_snec_epochs(
+                dict_SNEC_output, snec_folder_name, time_in_days
+            )
+        ]
+
+        # skip the epochs that are already written from the same inputs
+        epoch_keys = {
+            new_csvy_path: cache_key(
+                [],
+                extra={"inputs": inputs_key, "time": float(dict_SNEC_output["time"][time_index])},
+            )
+            for time_index, new_csvy_path, _, _ in epochs
+        }
+        if time_in_days is not None:
+            summary["skipped"] = [
+                f"{float(time)} day"
+                for time in time_in_days
+                if snec_time_index(dict_SNEC_output["time"], time) is None
+            ]
+        manifest.record_selection(
+            selection_key,
+            {
+                Path(new_csvy_path).name: epoch_key
+                for new_csvy_path, epoch_key in epoch_keys.items()
+            },
+            skipped=summary["skipped"],
+        )
+        if not overwrite:
+            epochs_to_write = []
+            for epoch in epochs:
+                epoch_name = Path(epoch[1]).name
+                if manifest.is_up_to_date(epoch_name, epoch_keys[epoch[1]]):
+                    summary["up_to_date"].append(epoch_name)
+                else:
+                    epochs_to_write.append(epoch)
+            if len(summary["up_to_date"]) > 0:
+                logger.info(
+                    f"Skipping {len(summary['up_to_date'])} of {len(epochs)} epochs that are "
+                    "up to date"
+                )
+            epochs = epochs_to_write
+
+        def record_epoch(time_index, new_csvy_path, new_config_path):
+            manifest.record(
+                Path(new_csvy_path).name,
+                epoch_keys[new_csvy_path],
+                [new_csvy_path, new_config_path],
+            )
+            summary["converted"].append(Path(new_csvy_path).name)
+
+        def record_failure(time_index, new_csvy_path, new_config_path, error):
+            summary["failed"][Path(new_csvy_path).name] = error
+            logger.error(f"Epoch {Path(new_csvy_path).name} failed to convert: {error}")
+
+        shared_epoch_inputs = {
+            "dict_SNEC_output": dict_SNEC_output,
+            "df_snec_comps": df_snec_comps,
+            "tardis_sample_csvy_path": tardis_sample_csvy_path,
+            "tardis_sample_config_path": tardis_sample_config_path,
+            "templates": load_tardis_templates(tardis_sample_csvy_path, tardis_sample_config_path),
+            "tau_upper_limit": tau_upper_limit,
+            "tau_lower_limit": tau_lower_limit,
+            "num_keep_shells": num_keep_shells,
+            "rebin_weighting": rebin_weighting,
+            "stage_profiling": stage_profiling_settings(),
+        }
+        if n_workers > 1 and len(epochs) > 1:
+            save_epochs_in_parallel(
+                epochs,
+                shared_epoch_inputs,
+                n_workers,
+                epoch_saved_callback=record_epoch,
+                epoch_failed_callback=record_failure if isolate_failures else None,
+            )
+        else:
+            for time_index, new_csvy_path, new_config_path, message in epochs:
+                try:
+                    _save_epoch(time_index, new_csvy_path, new_config_path, shared_epoch_inputs)
+                except Exception as e:
+                    if not isolate_failures:
+                        raise
+                    record_failure(
+                        time_index,
+                        new_csvy_path,
+                        new_config_path,
+                        f"{type(e).__name__}: {e}\n{traceback.format_exc()}",
+                    )
+                    continue
+                record_epoch(time_index, new_csvy_path, new_config_path)
+                if message is not None:
+                    print(message)
+
+        logger.info(
+            f"{len(summary['converted'])} epochs converted, {len(summary['skipped'])} skipped, "
+            f"{len(summary['up_to_date'])} up to date, {len(summary['failed'])} failed"
+        )
+
+    return dict_SNEC_output, df_snec_comps, summary
+
+
+def snec_epoch_models(
+    snec_folder_path,
+    tardis_example_config_folder_path,
+    time_in_days=None,
+    tau_upper_limit=1e3,
+    tau_lower_limit=1e-10,
+    comps_profile_file_path=None,
+    comp_use_boxcared=False,
+    snec_data_folder_path_comp_boxcar=None,
+    use_vel_diff=False,
+    num_keep_shells=45,
+    rebin_weighting=None,
+    cache_folder_path=None,
+    n_workers=1,
+    tardis_config_output_path=None,
+):
+    """
+    Purpose:
+    ---------
+    Yield the TARDIS inputs of each SNEC epoch in memory, the same epochs and models as
+    parse_snec_to_tardis writes, e.g. to run TARDIS on a sweep of epochs without writing
+    and re-reading the config yml files:
+
+        for epoch_model in snec_epoch_models(snec_folder_path, template_folder_path):
+            config, csvy_model_config, model_table = epoch_model.tardis_inputs()
+            workflow = InMemoryInnerVelocitySolverWorkflow.from_csvy_model(
+                config, csvy_model_config, model_table
+            )
+
+    or run_tardis_epoch(epoch_model, spec_output_file), both from tardis_utils, where the
+    workflow is set up on the csvy model in memory.
+
+    ----------
+
+    Parameters
+    ----------
+        snec_folder_path, tardis_example_config_folder_path, time_in_days, tau_upper_limit,
+        tau_lower_limit, comps_profile_file_path, comp_use_boxcared,
+        snec_data_folder_path_comp_boxcar, use_vel_diff, num_keep_shells, rebin_weighting,
+        cache_folder_path, n_workers:
+            see parse_snec_to_tardis
+        tardis_config_output_path: None or str
+            If str -- also write the csvy and config file of each epoch to this folder
+            If None -- no files are written
+
+    ----------
+    Yields:
+        tardis_utils.TardisEpochModel of each epoch, in the order of the epochs
+    """
+    snec_folder_path = Path(snec_folder_path)
+    tardis_example_config_folder_path = Path(tardis_example_config_folder_path)
+    templates = load_tardis_templates(
+        tardis_example_config_folder_path / "tardis_example_csvy.csvy",
+        tardis_example_config_folder_path / "tardis_template_config_SESN.yml",
+    )
+    dict_SNEC_output, df_snec_comps, _, _ = load_snec_conversion_inputs(
+        snec_folder_path,
+        comps_profile_file_path=comps_profile_file_path,
+        comp_use_boxcared=comp_use_boxcared,
+        snec_data_folder_path_comp_boxcar=snec_data_folder_path_comp_boxcar,
+        use_vel_diff=use_vel_diff,
+        lazy=time_in_days is not None,
+        cache_folder_path=cache_folder_path,
+        n_workers=n_workers,
+    )
+    if tardis_config_output_path is not None:
+        os.makedirs(tardis_config_output_path, exist_ok=True)
+
+    for time_index, csvy_file_name, config_file_name, _ in select_snec_epochs(
+        dict_SNEC_output, snec_folder_path.name, time_in_days
+    ):
+        with profile_stage("epoch", epoch=csvy_file_name):
+            epoch_model = snec_epoch_model(
+                dict_SNEC_output,
+                time_index,
+                df_snec_comps,
+                templates,
+                csvy_file_name,
+                config_file_name,
+                tau_upper_limit=tau_upper_limit,
+                tau_lower_limit=tau_lower_limit,
+                num_keep_shells=num_keep_shells,
+                rebin_weighting=rebin_weighting,
+            )
+            if tardis_config_output_path is not None:
+                epoch_model.write(tardis_config_output_path)
+        yield epoch_model
+
+
+def load_snec_conversion_inputs(
+    snec_folder_path,
+    comps_profile_file_path=None,
+    comp_use_boxcared=False,
+    snec_data_folder_path_comp_boxcar=None,
+    use_vel_diff=False,
+    lazy=False,
+    cache_folder_path=None,
+    n_workers=1,
+):
+    """
+    Purpose:
+    ---------
+    Load the SNEC output and the composition profile of a SNEC run and keep the selected
+    (homologous) time steps, the inputs shared by all the epochs of parse_snec_to_tardis
+    and snec_epoch_models.
+
+    ----------
+
+    Parameters
+    ----------
+        snec_folder_path: Path
+            The path to the folder that contains the SNEC Data and profiles
+        comps_profile_file_path, comp_use_boxcared, snec_data_folder_path_comp_boxcar,
+        use_vel_diff, cache_folder_path, n_workers:
+            see parse_snec_to_tardis
+        lazy: bool, default False
+            If True, only parse the snapshots of the .xg files that are used, see
+            snec_data_to_dict
+
+    ----------
+    Returns:
+        dict_SNEC_output: dict
+            The SNEC output at the selected time steps
+        df_snec_comps: dataframe
+            The composition profile on the SNEC mass grid
+        snec_comps_profile_file_path: str
+            The composition profile file used
+        snec_data_folder_path_comp_boxcar: str or None
+            The folder of the boxcar smoothed composition profile used, None if it is not used
+    """
+    snec_data_folder_path = snec_folder_path / "output"
+    snec_comps_profile_file_path, snec_data_folder_path_comp_boxcar = snec_input_paths(
+        snec_folder_path,
+        comps_profile_file_path=comps_profile_file_path,
+        comp_use_boxcared=comp_use_boxcared,
+        snec_data_folder_path_comp_boxcar=snec_data_folder_path_comp_boxcar,
+    )
+
+    # when only some days are converted, only those snapshots are parsed from the .xg files
+    dict_SNEC_output = snec_data_to_dict(
+        snec_data_folder_path,
+        cache_folder_path=cache_folder_path,
+        lazy=lazy,
+        n_workers=n_workers,
+    )
+
+    # read the composition profile
+    if comp_use_boxcared == True:
+        with profile_stage("composition_read"):
+            df_snec_comps = snec_boxcar_comps_profile_to_dataframe(
+                snec_comps_profile_file_path,
+                snec_data_folder_path_comp_boxcar,
+                dict_SNEC_output["mass"],
+                cache_folder_path=cache_folder_path,
+                n_workers=n_workers,
+            )
+    else:
+        with profile_stage("composition_read"):
+            df_comps = snec_comps_profile_to_dataframe(snec_comps_profile_file_path)
+        # interpolate the composition profile to the mass grid of the SNEC output
+        df_snec_comps = interpolate_composition_profile(df_comps, dict_SNEC_output)
+
+    with profile_stage("epoch_selection"):
+        # generate the time mask for the selected time steps
+        selected_time_mask = generate_time_mask(
+            dict_SNEC_output["time"],
+            dict_SNEC_output["vel"],
+            dict_SNEC_output["vel_photo_profile"],
+            use_vel_diff=use_vel_diff,
+        )
+
+        # filter the data to the selected time steps
+        for param in ["time"] + XG_FILE_NAMES + [item + "_itp" for item in DAT_FILE_NAMES]:
+            dict_SNEC_output[param] = dict_SNEC_output[param][selected_time_mask]
+
+    return (
+        dict_SNEC_output,
+        df_snec_comps,
+        snec_comps_profile_file_path,
+        snec_data_folder_path_comp_boxcar,
+    )
+
+
+def snec_input_paths(
+    snec_folder_path,
+    comps_profile_file_path=None,
+    comp_use_boxcared=False,
+    snec_data_folder_path_comp_boxcar=None,
+):
+    """
+    Purpose:
+    ---------
+    Find the composition profile and the boxcar isotope folder of a SNEC run, without
+    reading them.
+
+    ----------
+
+    Parameters
+    ----------
+        snec_folder_path: Path
+            The path to the folder that contains the SNEC Data and profiles
+        comps_profile_file_path, comp_use_boxcared, snec_data_folder_path_comp_boxcar:
+            see parse_snec_to_tardis
+
+    ----------
+    Returns:
+        snec_comps_profile_file_path: str
+            The composition profile file to use
+        snec_data_folder_path_comp_boxcar: str or None
+            The folder of the boxcar smoothed composition profile, None if it is not used
+    """
     if comps_profile_file_path is None:
         try:
             comp_files = glob.glob(f"{snec_folder_path}/input/*.iso.dat")
@@ -143,90 +881,213 @@ def parse_snec_to_tardis(
     else:
         snec_comps_profile_file_path = comps_profile_file_path
 
-    dict_SNEC_output = snec_data_to_dict(snec_data_folder_path)
+    if comp_use_boxcared != True:
+        snec_data_folder_path_comp_boxcar = None
+    elif snec_data_folder_path_comp_boxcar is None:
+        snec_data_folder_path_comp_boxcar = snec_folder_path / "output"
+        print("Using the same folder for boxcar smoothed composition profile.")
+    return snec_comps_profile_file_path, snec_data_folder_path_comp_boxcar
 
-    # read the composition profile
-    if comp_use_boxcared == True:
-        if snec_data_folder_path_comp_boxcar is None:
-            snec_data_folder_path_comp_boxcar = snec_data_folder_path
-            print("Using the same folder for boxcar smoothed composition profile.")
-        df_snec_comps = snec_boxcar_comps_profile_to_dataframe(
-            snec_comps_profile_file_path,
-            snec_data_folder_path_comp_boxcar,
-            dict_SNEC_output["mass"],
-        )
-    else:
-        df_comps = snec_comps_profile_to_dataframe(snec_comps_profile_file_path)
-        # interpolate the composition profile to the mass grid of the SNEC output
-        df_snec_comps = interpolate_composition_profile(df_comps, dict_SNEC_output)
 
-    # generate the time mask for the selected time steps
-    selected_time_mask = generate_time_mask(
-        dict_SNEC_output["time"],
-        dict_SNEC_output["vel"],
-        dict_SNEC_output["vel_photo_profile"],
-        use_vel_diff=use_vel_diff,
-    )
+def select_snec_epochs(dict_SNEC_output, snec_folder_name, time_in_days=None):
+    """
+    Purpose:
+    ---------
+    Select the epochs to convert and name their TARDIS files.
 
-    # filter the data to the selected time steps
-    for param in ["time"] + XG_FILE_NAMES + [item + "_itp" for item in DAT_FILE_NAMES]:
-        dict_SNEC_output[param] = dict_SNEC_output[param][selected_time_mask]
+    ----------
 
-    if tardis_config_output_path is not None:
-        # create the output folder if not exsit
-        if not os.path.exists(tardis_config_output_path):
-            os.makedirs(tardis_config_output_path)
+    Parameters
+    ----------
+        dict_SNEC_output: dict
+            The SNEC output at the selected time steps, see load_snec_conversion_inputs
+        snec_folder_name: str
+            The name of the SNEC run, the prefix of the file names
+        time_in_days: list/array or None, default None
+            see parse_snec_to_tardis
 
-        if time_in_days is None:
-            # write tardis config and csvy file for each time step
-            for time_index, _ in enumerate(dict_SNEC_output["time"]):
-                new_csvy_path = (
-                    f"{tardis_config_output_path}/{snec_folder_name}_tardis_csvy_{time_index}.csvy"
-                )
-                new_config_path = (
-                    f"{tardis_config_output_path}/{snec_folder_name}_tardis_config_{time_index}.yml"
-                )
-                save_tardis_config_and_csvy(
-                    dict_SNEC_output,
+    ----------
+    Returns:
+        list of (time_index, csvy_file_name, config_file_name, message or None) of each epoch
+    """
+    epochs = []
+    if time_in_days is None:
+        # write tardis config and csvy file for each time step
+        for time_index, _ in enumerate(dict_SNEC_output["time"]):
+            csvy_file_name = f"{snec_folder_name}_tardis_csvy_{time_index}.csvy"
+            config_file_name = f"{snec_folder_name}_tardis_config_{time_index}.yml"
+            epochs.append((time_index, csvy_file_name, config_file_name, None))
+    else:
+        # write tardis config and csvy file for the selected time steps only (unit in days)
+        for time in time_in_days:
+            time = float(time)
+            time_index = snec_time_index(dict_SNEC_output["time"], time)
+            if time_index is None:
+                Warning(f"Time {time} day is not found in the SNEC output within +/-1d range.")
+                continue
+            csvy_file_name = f"{snec_folder_name}_tardis_csvy_{time}_day.csvy"
+            config_file_name = f"{snec_folder_name}_tardis_config_{time}_day.yml"
+            epochs.append(
+                (
                     time_index,
-                    df_snec_comps,
-                    tardis_sample_csvy_path,
-                    tardis_sample_config_path,
-                    new_csvy_path,
-                    new_config_path,
-                    tau_upper_limit=tau_upper_limit,
-                    tau_lower_limit=tau_lower_limit,
-                    num_keep_shells=num_keep_shells,
+                    csvy_file_name,
+                    config_file_name,
+                    f"Saved TARDIS config and csvy file for time: {time}",
                 )
-        else:
-            # write tardis config and csvy file for the selected time steps only (unit in days)
-            for time in time_in_days:
-                time = float(time)
-                time_index = np.argmin(np.abs(dict_SNEC_output["time"] - time * 24 * 3600))
-                if np.abs(dict_SNEC_output["time"][time_index] / 24 / 3600 - time) > 1:
-                    Warning(f"Time {time} day is not found in the SNEC output within +/-1d range.")
+            )
+    return epochs
+
+
+def snec_time_index(snec_times, time):
+    """The index of the SNEC time step (in seconds) closest to a time in days, None if there
+    is none within +/-1 day"""
+    time_index = np.argmin(np.abs(snec_times - time * 24 * 3600))
+    if np.abs(snec_times[time_index] / 24 / 3600 - time) > 1:
+        return None
+    return time_index
+
+
+def save_epochs_in_parallel(
+    epochs,
+    shared_epoch_inputs,
+    n_workers,
+    epoch_saved_callback=None,
+    epoch_failed_callback=None,
+):
+    """
+    Purpose:
+    ---------
+    Write the TARDIS config and csvy files of several epochs over a process pool.
+
+    The SNEC arrays are handed to the workers once: they are inherited from this
+    process when the workers are forked, otherwise they are sent to each worker at
+    start up, never per epoch. Messages are printed in the order of the epochs.
+
+    ----------
+
+    Parameters
+    ----------
+        epochs: list
+            (time_index, new_csvy_path, new_config_path, message or None) of each epoch
+        shared_epoch_inputs: dict
+            The inputs shared by all epochs, see _save_epoch
+        n_workers: int
+            The number of worker processes
+        epoch_saved_callback: callable or None, default None
+            Called with (time_index, new_csvy_path, new_config_path) in this process after
+            each epoch is written, e.g. to record it in the conversion manifest
+        epoch_failed_callback: callable or None, default None
+            If given, an epoch that fails does not stop the others, and this is called with
+            (time_index, new_csvy_path, new_config_path, error) in this process instead
+    """
+    shared_epoch_inputs = {
+        **shared_epoch_inputs,
+        "isolate_failures": epoch_failed_callback is not None,
+    }
+    if "fork" in multiprocessing.get_all_start_methods():
+        # the forked workers inherit the module level inputs without pickling
+        _EPOCH_WORKER_INPUTS.update(shared_epoch_inputs)
+        executor = ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context("fork"))
+    else:
+        executor = ProcessPoolExecutor(
+            n_workers, initializer=_init_epoch_worker, initargs=(shared_epoch_inputs,)
+        )
+
+    try:
+        with executor:
+            # map returns the results in the order of the epochs
+            time_indices, new_csvy_paths, new_config_paths, messages = zip(*epochs)
+            results = executor.map(
+                _save_epoch_in_worker, time_indices, new_csvy_paths, new_config_paths
+            )
+            for epoch, message, (stage_records, error) in zip(epochs, messages, results):
+                merge_stage_records(stage_records)
+                if error is not None:
+                    epoch_failed_callback(*epoch[:3], error)
                     continue
-                new_csvy_path = (
-                    f"{tardis_config_output_path}/{snec_folder_name}_tardis_csvy_{time}_day.csvy"
-                )
-                new_config_path = (
-                    f"{tardis_config_output_path}/{snec_folder_name}_tardis_config_{time}_day.yml"
-                )
-                save_tardis_config_and_csvy(
-                    dict_SNEC_output,
-                    time_index,
-                    df_snec_comps,
-                    tardis_sample_csvy_path,
-                    tardis_sample_config_path,
-                    new_csvy_path,
-                    new_config_path,
-                    tau_upper_limit=tau_upper_limit,
-                    tau_lower_limit=tau_lower_limit,
-                    num_keep_shells=num_keep_shells,
-                )
-                print("Saved TARDIS config and csvy file for time:", time)
+                if epoch_saved_callback is not None:
+                    epoch_saved_callback(*epoch[:3])
+                if message is not None:
+                    print(message)
+    finally:
+        _EPOCH_WORKER_INPUTS.clear()
+
+
+def snec_conversion_inputs_key(
+    snec_data_folder_path,
+    snec_comps_profile_file_path,
+    snec_data_folder_path_comp_boxcar,
+    template_paths,
+    options,
+):
+    """
+    Purpose:
+    ---------
+    Hash the content of every input of a SNEC conversion (the SNEC output files, the
+    composition profile, the boxcar isotope files if used and the TARDIS templates) and
+    the parser options into one key for the conversion manifest.
 
-    return dict_SNEC_output, df_snec_comps
+    ----------
+
+    Parameters
+    ----------
+        snec_data_folder_path: str or Path
+            The folder with the .xg and .dat files
+        snec_comps_profile_file_path: str
+        snec_data_folder_path_comp_boxcar: str or None
+            The folder with the iso_id_{n}_init_frac.dat files, None if they are not used
+        template_paths: list
+            The TARDIS template csvy and config files
+        options: dict
+            The (json serializable) parser options that change the outputs
+    """
+    input_files = [f"{snec_data_folder_path}/{param}.xg" for param in XG_FILE_NAMES]
+    input_files += [f"{snec_data_folder_path}/{param}.dat" for param in DAT_FILE_NAMES]
+    input_files.append(snec_comps_profile_file_path)
+    if snec_data_folder_path_comp_boxcar is not None:
+        input_files += sorted(
+            glob.glob(f"{snec_data_folder_path_comp_boxcar}/iso_id_*_init_frac.dat")
+        )
+    input_files += template_paths
+    return cache_key(
+        input_files,
+        extra={"product": "snec_to_tardis", "version": 1, "options": options},
+        include_mtime=False,
+    )
+
+
+def _save_epoch(time_index, new_csvy_path, new_config_path, shared_epoch_inputs=None):
+    """Write one epoch, by default using the inputs shared through _EPOCH_WORKER_INPUTS."""
+    inputs = _EPOCH_WORKER_INPUTS if shared_epoch_inputs is None else shared_epoch_inputs
+    save_tardis_config_and_csvy(
+        inputs["dict_SNEC_output"],
+        time_index,
+        inputs["df_snec_comps"],
+        inputs["tardis_sample_csvy_path"],
+        inputs["tardis_sample_config_path"],
+        new_csvy_path,
+        new_config_path,
+        tau_upper_limit=inputs["tau_upper_limit"],
+        tau_lower_limit=inputs["tau_lower_limit"],
+        num_keep_shells=inputs["num_keep_shells"],
+        rebin_weighting=inputs["rebin_weighting"],
+        templates=inputs["templates"],
+    )
+
+
+def _save_epoch_in_worker(time_index, new_csvy_path, new_config_path):
+    """_save_epoch in a worker process, returns the records of its stages if they are
+    profiled (see stage_profiler.worker_stage_records) and the error of the epoch if it
+    failed and the failures are isolated, see save_epochs_in_parallel"""
+    error = None
+    with worker_stage_records(_EPOCH_WORKER_INPUTS.get("stage_profiling")) as stage_records:
+        try:
+            _save_epoch(time_index, new_csvy_path, new_config_path)
+        except Exception as e:
+            if not _EPOCH_WORKER_INPUTS.get("isolate_failures", False):
+                raise
+            error = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+    return stage_records, error
 
 
 def save_tardis_config_and_csvy(
@@ -240,62 +1101,128 @@ def save_tardis_config_and_csvy(
     tau_upper_limit=False,
     tau_lower_limit=False,
     num_keep_shells=60,
+    rebin_weighting=None,
+    templates=None,
 ):
+    # parse the templates here if they are not parsed once by the caller
+    if templates is None:
+        templates = load_tardis_templates(tardis_sample_csvy_path, tardis_sample_config_path)
+
+    with profile_stage("epoch", epoch=new_csvy_path.split("/")[-1]):
+        epoch_model = snec_epoch_model(
+            dict_SNEC_output,
+            time_index,
+            df_snec_comps,
+            templates,
+            new_csvy_path.split("/")[-1],
+            new_config_path.split("/")[-1],
+            tau_upper_limit=tau_upper_limit,
+            tau_lower_limit=tau_lower_limit,
+            num_keep_shells=num_keep_shells,
+            rebin_weighting=rebin_weighting,
+        )
+        epoch_model.write_csvy(new_csvy_path)
+        epoch_model.write_config(new_config_path)
+
+
+def snec_epoch_model(
+    dict_SNEC_output,
+    time_index,
+    df_snec_comps,
+    templates,
+    csvy_file_name,
+    config_file_name,
+    tau_upper_limit=False,
+    tau_lower_limit=False,
+    num_keep_shells=60,
+    rebin_weighting=None,
+):
+    """
+    Purpose:
+    ---------
+    Map one SNEC epoch to its TARDIS inputs in memory, see save_tardis_config_and_csvy for
+    the files and tardis_utils.TardisEpochModel.
+
+    ----------
+
+    Parameters
+    ----------
+        dict_SNEC_output: dict
+            The SNEC output at the selected time steps, see snec_data_to_dict
+        time_index: int
+            The index of the epoch in dict_SNEC_output["time"]
+        df_snec_comps: dataframe
+            The composition profile on the SNEC mass grid
+        templates: tardis_utils.TardisTemplates
+            The parsed TARDIS templates
+        csvy_file_name: str
+            The csvy file name of the epoch, written in the csvy headers and the config
+        config_file_name: str
+            The config file name of the epoch
+        tau_upper_limit, tau_lower_limit, num_keep_shells, rebin_weighting:
+            see parse_snec_to_tardis
+
+    ----------
+    Returns:
+        tardis_utils.TardisEpochModel
+    """
     # get the time in day
     time_in_day = dict_SNEC_output["time"][time_index] / (60 * 60 * 24)
 
-    # attached velocity, density, t_rad, dilution_factor, and composition profile data into a df
-    df_profiles_non_comp = pd.DataFrame(
-        {
-            "velocity": dict_SNEC_output["vel"][time_index],
-            "density": dict_SNEC_output["rho"][time_index],
-            "t_rad": dict_SNEC_output["temp"][time_index],
-            "tau": dict_SNEC_output["tau"][time_index],
-        },
-    )
-    df_profiles = df_profiles_non_comp.join(df_snec_comps.reset_index(drop=True))
+    with profile_stage("tau_homology_filter"):
+        # attached velocity, density, t_rad, dilution_factor, and composition profile data into a df
+        df_profiles_non_comp = pd.DataFrame(
+            {
+                "velocity": dict_SNEC_output["vel"][time_index],
+                "density": dict_SNEC_output["rho"][time_index],
+                "t_rad": dict_SNEC_output["temp"][time_index],
+                "tau": dict_SNEC_output["tau"][time_index],
+            },
+        )
+        df_profiles = df_profiles_non_comp.join(df_snec_comps.reset_index(drop=True))
 
-    # limit the shells numebers -- computational cost - This need to filtered before anything else ensure the index is correct
-    if tau_upper_limit is not False:
-        df_profiles = df_profiles.loc[df_profiles["tau"] <= tau_upper_limit]
-    if tau_lower_limit is not False:
-        df_profiles = df_profiles.loc[df_profiles["tau"] >= tau_lower_limit]
-    if "tau" in df_profiles.columns:
-        df_profiles = df_profiles.drop(columns=["tau"])
+        # limit the shells numebers -- computational cost - This need to filtered before anything else ensure the index is correct
+        if tau_upper_limit is not False:
+            df_profiles = df_profiles.loc[df_profiles["tau"] <= tau_upper_limit]
+        if tau_lower_limit is not False:
+            df_profiles = df_profiles.loc[df_profiles["tau"] >= tau_lower_limit]
+        if "tau" in df_profiles.columns:
+            df_profiles = df_profiles.drop(columns=["tau"])
 
-    # filter out the zero density and velocity shells on the outer region
-    df_profiles = df_profiles.loc[(df_profiles.density > 0) & (df_profiles.velocity > 0)]
+        # filter out the zero density and velocity shells on the outer region
+        df_profiles = df_profiles.loc[(df_profiles.density > 0) & (df_profiles.velocity > 0)]
 
-    # # filter out the inner shells that's purposely replaced with pure He
-    # df_profiles = df_profiles.loc[df_profiles.He4 < 1]
+        # # filter out the inner shells that's purposely replaced with pure He
+        # df_profiles = df_profiles.loc[df_profiles.He4 < 1]
 
-    # filter out the outer shells that has t_radiative too low for TARDIS -> but this cause trouble though so replace low T shells with 500K instead
-    df_profiles = df_profiles.loc[df_profiles.t_rad > 0]
+        # filter out the outer shells that has t_radiative too low for TARDIS -> but this cause trouble though so replace low T shells with 500K instead
+        df_profiles = df_profiles.loc[df_profiles.t_rad > 0]
 
-    # discard the shells that has velocity backwards (which technically is in non-homologous expansion, but we can cut those out if there are only a few of them)
-    while (df_profiles["velocity"].diff() <= 0).any():
-        df_profiles = delete_non_increasing_neighbour(df_profiles, "velocity")
+        # discard the shells that has velocity backwards (which technically is in non-homologous expansion, but we can cut those out if there are only a few of them)
+        df_profiles = df_profiles.loc[increasing_subsequence_mask(df_profiles["velocity"].values)]
 
-    # discard the element columns that has all zero values
-    df_profiles = df_profiles.loc[:, (df_profiles != 0).any(axis=0)]
+        # discard the element columns that has all zero values
+        df_profiles = df_profiles.loc[:, (df_profiles != 0).any(axis=0)]
 
     if num_keep_shells is not None:
-        shell_gap_length = max([int(np.floor(df_profiles.shape[0] / num_keep_shells)), 1])
-        df_csv = df_profiles.groupby(np.arange(len(df_profiles)) // shell_gap_length).mean()
+        df_csv = rebin_shell_profiles(
+            df_profiles,
+            regular_bin_starts(df_profiles.shape[0], num_keep_shells),
+            weighting=rebin_weighting,
+        )
     else:
         df_csv = df_profiles
 
-    # write the tardis csvy file
+    # the tardis csvy headers
     modify_csvy_headers = {
-        "name": new_csvy_path.split("/")[-1],
+        "name": csvy_file_name,
         "model_density_time_0": f"{time_in_day:.3f} day",
         "model_isotope_time_0": "0.0 s",
         # "v_inner_boundary": f"{dict_SNEC_output['vel_photo_itp'][time_index]:.6e} cm/s", # as of April2025, the v_inner workflow csvy model HAVE to the use the first shell to start to avoid dim error
         "v_inner_boundary": f"{df_profiles['velocity'].min():.6e} cm/s",
     }
-    write_tardis_csvy(tardis_sample_csvy_path, modify_csvy_headers, df_csv, new_csvy_path)
 
-    # write the tardis config file
+    # the tardis config parameters
     modify_parameters = {
         "supernova": {
             "luminosity_requested": f"{dict_SNEC_output['lum_observed_itp'][time_index]} erg/s",
@@ -303,15 +1230,17 @@ def save_tardis_config_and_csvy(
         },
         "plasma": {"initial_t_inner": f"{dict_SNEC_output['T_eff_itp'][time_index]} K"},
     }
-    write_tardis_config(
-        tardis_sample_config_path,
-        modify_parameters,
-        new_config_path,
-        csvy_model_path=new_csvy_path.split("/")[-1],
+    return templates.epoch_model(
+        modify_csvy_headers, df_csv, modify_parameters, csvy_file_name, config_file_name
     )
 
 
 def delete_non_increasing_neighbour(df, col_name):
+    """
+    Drop the rows whose col_name value is not larger than the previous row, one pass only.
+    Kept as the reference for tardis_utils.increasing_subsequence_mask, which gives the
+    result of repeating this until col_name is strictly increasing.
+    """
     subdf = df[(df[col_name].diff() > 0)]
     if df.iloc[0][col_name] < subdf.iloc[0][col_name]:
         subdf = pd.concat([df.iloc[:1], subdf])
@@ -362,7 +1291,9 @@ def generate_time_mask(time, velocity_arrays, vel_photo_profile, use_vel_diff=Fa
     return selected_time_mask
 
 
-def snec_data_to_dict(snec_data_folder_path):
+def snec_data_to_dict(
+    snec_data_folder_path, cache_folder_path=None, lazy=False, n_workers=1, use_processes=False
+):
     """
     Purpose:
     ---------
@@ -375,54 +1306,96 @@ def snec_data_to_dict(snec_data_folder_path):
     ----------
         snec_data_folder_path: str
             The path to the folder that contains the Data output from SNEC
+        cache_folder_path: str or None, default None
+            If given, the parsed output is cached as .npy files in this folder and
+            memory-mapped on later calls, as long as the SNEC files are unchanged
+        lazy: bool, default False
+            If True (and no cache_folder_path is given), only index the .xg files; the
+            vel/rho/temp/tau entries are then XgSnapshotSeries that parse a snapshot
+            from disk when it is accessed
+        n_workers: int, default 1
+            If larger than 1, load the .xg and .dat files concurrently with a thread pool
+        use_processes: bool, default False
+            If True (and n_workers > 1), parse the .xg files in a process pool instead
 
     ----------
     output:
         A dictionary contains selected information of the SNEC output
     """
-    dict_SNEC_output = {"vel": [], "rho": [], "temp": [], "tau": []}
+    xg_files = [f"{snec_data_folder_path}/{param}.xg" for param in XG_FILE_NAMES]
+    dat_files = [f"{snec_data_folder_path}/{param}.dat" for param in DAT_FILE_NAMES]
+
+    if cache_folder_path is not None:
+        key = cache_key(xg_files + dat_files, extra={"product": "snec_data_to_dict", "version": 1})
+        with profile_stage("snec_cache_read"):
+            cached_arrays = load_array_cache(cache_folder_path, key)
+        if cached_arrays is not None:
+            return unflatten_snec_output(cached_arrays)
+        # the cache needs the full arrays
+        lazy = False
+
+    # load all the files, concurrently if asked to. The .dat reads overlap the .xg parse,
+    # so they are timed in their threads
+    if n_workers > 1:
+        with ThreadPoolExecutor(n_workers) as thread_executor:
+            xg_executor = ProcessPoolExecutor(n_workers) if use_processes else thread_executor
+            read_dat_file = thread_profiled("dat_read", np.loadtxt)
+            try:
+                with profile_stage("xg_parse"):
+                    xg_futures = [
+                        xg_executor.submit(load_xg_file, fname, lazy) for fname in xg_files
+                    ]
+                    dat_futures = [
+                        thread_executor.submit(read_dat_file, fname) for fname in dat_files
+                    ]
+                    xg_results = [future.result() for future in xg_futures]
+                dat_results = [future.result() for future in dat_futures]
+            finally:
+                if use_processes:
+                    xg_executor.shutdown()
+    else:
+        with profile_stage("xg_parse"):
+            xg_results = [load_xg_file(fname, lazy) for fname in xg_files]
+        dat_results = []
+        for fname in dat_files:
+            with profile_stage("dat_read"):
+                dat_results.append(np.loadtxt(fname))
+
+    dict_SNEC_output = {}
 
     # read in the time steps that larger than 0 seconds (skipping the first time step)
-    for i, param in enumerate(XG_FILE_NAMES):
-        param_data = xg_to_dict(f"{snec_data_folder_path}/{param}.xg")
+    for param, (param_times, param_mass, param_values) in zip(XG_FILE_NAMES, xg_results):
         if param == "vel":
-            dict_SNEC_output["time"] = np.array(list(param_data.keys()))[
-                1:
-            ]  # the first time step is time 0
-            dict_SNEC_output["mass"] = param_data[0].T[0]
+            dict_SNEC_output["time"] = param_times[1:]  # the first time step is time 0
+            dict_SNEC_output["mass"] = param_mass
         else:
             # check if the simulation time matches
-            assert np.array_equal(dict_SNEC_output["time"], np.array(list(param_data.keys()))[1:])
-
-        for time, data in param_data.items():
-            if time > 0:
-                # check if the mass grid matches
-                assert np.array_equal(dict_SNEC_output["mass"], data.T[0])
-                dict_SNEC_output[param].append(data.T[1])
-
-        dict_SNEC_output[param] = np.array(dict_SNEC_output[param])
-
-    for i, param in enumerate(DAT_FILE_NAMES):
-        param_data = np.loadtxt(f"{snec_data_folder_path}/{param}.dat")
-        # check if the simulation time matches
-        dict_SNEC_output[param + "_profile"] = {
-            "time": param_data.T[0],
-            param: param_data.T[1],
-        }
-        # interpolate the data to the time grid
-        f_itp = interpolate.interp1d(
-            param_data.T[0],
-            param_data.T[1],
-            kind="linear",
-            fill_value=(
-                param_data.T[1][0],
-                param_data.T[1][-1],
-            ),
-            bounds_error=False,
-        )
-        dict_SNEC_output[param + "_itp"] = f_itp(dict_SNEC_output["time"])
-        if param == "index_photo":
-            dict_SNEC_output[param + "_itp"] = dict_SNEC_output[param + "_itp"].astype(int)
+            assert np.array_equal(dict_SNEC_output["time"], param_times[1:])
+            # check if the mass grid matches
+            assert np.array_equal(dict_SNEC_output["mass"], param_mass)
+        dict_SNEC_output[param] = param_values
+
+    with profile_stage("dat_interpolation"):
+        for param, param_data in zip(DAT_FILE_NAMES, dat_results):
+            # check if the simulation time matches
+            dict_SNEC_output[param + "_profile"] = {
+                "time": param_data.T[0],
+                param: param_data.T[1],
+            }
+            # interpolate the data to the time grid
+            f_itp = interpolate.interp1d(
+                param_data.T[0],
+                param_data.T[1],
+                kind="linear",
+                fill_value=(
+                    param_data.T[1][0],
+                    param_data.T[1][-1],
+                ),
+                bounds_error=False,
+            )
+            dict_SNEC_output[param + "_itp"] = f_itp(dict_SNEC_output["time"])
+            if param == "index_photo":
+                dict_SNEC_output[param + "_itp"] = dict_SNEC_output[param + "_itp"].astype(int)
 
     # # get the minimum above-zero photospheric velocity
     # if cut_inner_region:
@@ -440,9 +1413,66 @@ def snec_data_to_dict(snec_data_folder_path):
     #     for i, param in enumerate(xg_params):
     #         dict_SNEC_output[param] = dict_SNEC_output[param][:, cut_index:]
 
+    if cache_folder_path is not None:
+        with profile_stage("snec_cache_write"):
+            save_array_cache(cache_folder_path, key, flatten_snec_output(dict_SNEC_output))
+
     return dict_SNEC_output
 
 
+def flatten_snec_output(dict_SNEC_output):
+    """
+    Purpose:
+    ---------
+    Flatten the nested *_profile dictionaries of the SNEC output, so every entry is a
+    single array that can be saved to the cache.
+    """
+    flat_arrays = {}
+    for key, value in dict_SNEC_output.items():
+        if key.endswith("_profile"):
+            for profile_key, profile_value in value.items():
+                flat_arrays[f"{key}.{profile_key}"] = profile_value
+        else:
+            flat_arrays[key] = value
+    return flat_arrays
+
+
+def unflatten_snec_output(flat_arrays):
+    """
+    Purpose:
+    ---------
+    Rebuild the SNEC output dictionary from the arrays saved by flatten_snec_output.
+    """
+    dict_SNEC_output = {}
+    for key, value in flat_arrays.items():
+        if "." in key:
+            key, profile_key = key.split(".")
+            dict_SNEC_output.setdefault(key, {})[profile_key] = value
+        else:
+            dict_SNEC_output[key] = value
+    return dict_SNEC_output
+
+
+def snec_element_symbols(atomic_numbers, mass_numbers):
+    """
+    Purpose:
+    ---------
+    Convert the (atomic number, mass number) header rows of the SNEC composition profile
+    to the TARDIS nuclide symbols, e.g. (28, 56) -> Ni56, with the nuclide table (see
+    nuclide_table.load_nuclide_table), and warn about the ones TARDIS does not know.
+    """
+    nuclide_table = load_nuclide_table()
+    element_symbols = [
+        nuclide_table.symbol(atomic_number, mass_number)
+        for atomic_number, mass_number in zip(atomic_numbers, mass_numbers)
+    ]
+    # check if the nuiclide is valid
+    for element_symbol in element_symbols:
+        if not nuclide_table.is_valid(element_symbol):
+            logger.warning(f"{element_symbol} is not valid nuiclide in tardis database.")
+    return element_symbols
+
+
 def snec_comps_profile_to_dataframe(snec_comps_profile_file_path):
     """
     Purpose:
@@ -455,15 +1485,7 @@ def snec_comps_profile_to_dataframe(snec_comps_profile_file_path):
         mass_numbers = np.array(lines[1].split()).astype(float).astype(int)
         atomic_numbers = np.array(lines[2].split()).astype(float).astype(int)
 
-    # Convert the atomic numbers to element symbols
-    element_symbols = [
-        atomic_number2element_symbol(atomic_number) + str(mass_number)
-        for atomic_number, mass_number in zip(atomic_numbers[1:], mass_numbers[1:])
-    ]
-    # check if the nuiclide is valid
-    for element_symbol in element_symbols:
-        if is_valid_nuclide_or_elem(element_symbol) == False:
-            Warning(f"{element_symbol} is not valid nuiclide in tardis database.")
+    element_symbols = snec_element_symbols(atomic_numbers[1:], mass_numbers[1:])
 
     # Read the remaining lines into a DataFrame
     df_abundance = pd.read_csv(
@@ -478,12 +1500,31 @@ def snec_comps_profile_to_dataframe(snec_comps_profile_file_path):
 
 
 def snec_boxcar_comps_profile_to_dataframe(
-    snec_comps_profile_file_path, snec_data_folder_path, snec_mass_grid
+    snec_comps_profile_file_path,
+    snec_data_folder_path,
+    snec_mass_grid,
+    cache_folder_path=None,
+    n_workers=1,
 ):
     """
     Purpose:
     ---------
     Parse the SNEC composition profile that are artificially smoothed by boxcar to a dataframe.
+
+    ----------
+
+    Parameters
+    ----------
+        snec_comps_profile_file_path: str
+            The composition profile file used in SNEC, for the isotope names
+        snec_data_folder_path: str
+            The path to the folder that contains the iso_id_{n}_init_frac.dat files
+        snec_mass_grid: array
+            The mass grid of the SNEC output, used as the index
+        cache_folder_path: str or None, default None
+            If given, cache the parsed mass fractions in this folder, see load_boxcar_comps
+        n_workers: int, default 1
+            The number of threads used to read the isotope files
     """
     # Read the file and extract the second and third lines into arrays
     with open(snec_comps_profile_file_path) as file:
@@ -491,32 +1532,99 @@ def snec_boxcar_comps_profile_to_dataframe(
         mass_numbers = np.array(lines[1].split()).astype(int)
         atomic_numbers = np.array(lines[2].split()).astype(int)
 
-    # Convert the atomic numbers to element symbols
-    element_symbols = [
-        atomic_number2element_symbol(atomic_number) + str(mass_number)
-        for atomic_number, mass_number in zip(atomic_numbers[1:], mass_numbers[1:])
-    ]
+    element_symbols = snec_element_symbols(atomic_numbers[1:], mass_numbers[1:])
 
-    # get composition profile by isotopes
-    df_abundance = pd.DataFrame(index=snec_mass_grid, columns=element_symbols)
-    for i, element_symbol in enumerate(element_symbols):
-        # check if the nuiclide is valid
-        if is_valid_nuclide_or_elem(element_symbol) == False:
-            Warning(f"{element_symbol} is not valid nuiclide in tardis database.")
-
-        # Read the smoothed composition profile from the snec data folder
-        iso_id = i + 2  # +2 due to 1.fortran start with 1, 2. first col is neutrinos
-        file = f"{snec_data_folder_path}/iso_id_{iso_id}_init_frac.dat"
-        df_init_frac = pd.read_csv(
-            file,
-            sep=r"\s+",
-            header=None,
-        )
-        df_abundance[element_symbol] = df_init_frac[1].values
+    # get composition profile by isotopes, all the isotope files are read in one go
+    _, boxcar_comps = load_boxcar_comps(
+        snec_data_folder_path,
+        len(element_symbols),
+        cache_folder_path=cache_folder_path,
+        n_workers=n_workers,
+    )
+    df_abundance = pd.DataFrame(boxcar_comps, index=snec_mass_grid, columns=element_symbols)
 
     return df_abundance
 
 
+def read_boxcar_iso_file(fname):
+    """
+    Parse one iso_id_{n}_init_frac.dat file from SNEC into a (n_zones, 2) array of
+    (mass, mass fraction) rows.
+    """
+    with open(fname) as rf:
+        iso_data = np.fromstring(rf.read(), sep=" ")
+    if iso_data.size % 2 != 0:
+        raise ValueError(f"{fname} does not have two columns (mass, mass fraction)")
+    return iso_data.reshape(-1, 2)
+
+
+def load_boxcar_comps(snec_data_folder_path, n_isotopes, cache_folder_path=None, n_workers=1):
+    """
+    Purpose:
+    ---------
+    Read the boxcar smoothed mass fractions of all the isotopes (iso_id_2_init_frac.dat to
+    iso_id_{n_isotopes + 1}_init_frac.dat, iso_id 1 is the neutrons) into one array, and
+    check that all the isotope files share the same mass grid.
+
+    ----------
+
+    Parameters
+    ----------
+        snec_data_folder_path: str
+            The path to the folder that contains the iso_id_{n}_init_frac.dat files
+        n_isotopes: int
+        cache_folder_path: str or None, default None
+            If given, the arrays are cached as .npy files in this folder (the same cache as
+            snec_data_to_dict), as long as the isotope files are unchanged
+        n_workers: int, default 1
+            If larger than 1, read the isotope files concurrently with a thread pool
+
+    ----------
+    output:
+        mass: array of shape (n_zones,)
+        boxcar_comps: float64 array of shape (n_zones, n_isotopes)
+    """
+    # +2 due to 1.fortran start with 1, 2. first col is neutrinos
+    iso_files = [
+        f"{snec_data_folder_path}/iso_id_{iso_id}_init_frac.dat"
+        for iso_id in range(2, n_isotopes + 2)
+    ]
+
+    if cache_folder_path is not None:
+        key = cache_key(iso_files, extra={"product": "load_boxcar_comps", "version": 1})
+        cached_arrays = load_array_cache(cache_folder_path, key)
+        if cached_arrays is not None:
+            return cached_arrays["mass"], cached_arrays["boxcar_comps"]
+
+    if n_workers > 1:
+        with ThreadPoolExecutor(n_workers) as executor:
+            iso_results = executor.map(read_boxcar_iso_file, iso_files)
+            mass, boxcar_comps = _stack_boxcar_comps(iso_files, iso_results)
+    else:
+        mass, boxcar_comps = _stack_boxcar_comps(iso_files, map(read_boxcar_iso_file, iso_files))
+
+    if cache_folder_path is not None:
+        save_array_cache(cache_folder_path, key, {"mass": mass, "boxcar_comps": boxcar_comps})
+
+    return mass, boxcar_comps
+
+
+def _stack_boxcar_comps(iso_files, iso_results):
+    """Copy the mass fraction column of each parsed isotope file into a preallocated array."""
+    mass = None
+    boxcar_comps = None
+    for i, (fname, iso_data) in enumerate(zip(iso_files, iso_results)):
+        if boxcar_comps is None:
+            mass = iso_data[:, 0].copy()
+            boxcar_comps = np.empty((mass.size, len(iso_files)), dtype=np.float64)
+        # check if the mass grid matches
+        assert np.array_equal(mass, iso_data[:, 0]), f"The mass grid of {fname} does not match"
+        boxcar_comps[:, i] = iso_data[:, 1]
+    if boxcar_comps is None:
+        raise ValueError("No isotope file to read")
+    return mass, boxcar_comps
+
+
 def interpolate_composition_profile(df_comps, dict_SNEC_output):
     """
     Purpose:
@@ -545,19 +1653,13 @@ def interpolate_composition_profile(df_comps, dict_SNEC_output):
     # Get the composition profile data
     profile_data = df_comps.drop(columns=["mass", "radius", "neutron"])
 
-    # Interpolate the composition profile to the data mass grid
-    df_interpolated_comps = pd.DataFrame(index=data_mass_grid, columns=profile_data.columns)
-    for column in profile_data.columns:
-        f_itp = interpolate.interp1d(
-            profile_mass_grid,
-            profile_data[column],
-            kind="linear",
-            fill_value=(
-                profile_data[column].values[0],
-                profile_data[column].values[-1],
-            ),
-            bounds_error=False,
-        )
-        df_interpolated_comps[column] = f_itp(data_mass_grid)
+    # Interpolate the whole composition profile to the data mass grid at once
+    remapper = ProfileRemapper(profile_mass_grid, profile_data.values)
+    df_interpolated_comps = pd.DataFrame(
+        remapper.remap(data_mass_grid),
+        index=data_mass_grid,
+        columns=profile_data.columns,
+        dtype=np.float64,
+    )
 
     return df_interpolated_comps
@@ -0,0 +1,260 @@
+import logging
+from pathlib import Path
+
+import h5py
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SPECTRA_CHUNK_EPOCHS = 8  # epochs per HDF5 chunk of the luminosity densities
+SPECTRA_COMPRESSION = "gzip"
+SPECTRA_COMPRESSION_LEVEL = 4
+# the values stored with each spectrum, name -> (dtype, fill value of a missing value, unit)
+EPOCH_COLUMNS = {
+    "time_explosion": (np.float64, np.nan, "day"),
+    "t_inner": (np.float64, np.nan, "K"),
+    "v_inner_boundary": (np.float64, np.nan, "cm/s"),
+    "luminosity_requested": (np.float64, np.nan, "erg/s"),
+    "iterations": (np.int64, -1, None),
+    "config_hash": (h5py.string_dtype(), "", None),
+}
+
+
+class SpectraStore:
+    """
+    Purpose:
+    ---------
+    One HDF5 file with the TARDIS spectra of many models and epochs, instead of one
+    spectrum csv per epoch. Each model is a group with its wavelength grid and an
+    (n_epochs, n_wavelengths) luminosity_density dataset that grows by one row per
+    epoch, chunked along the epochs and compressed. The epoch names and the values of
+    each epoch (time_explosion, the converged t_inner and v_inner_boundary,
+    luminosity_requested, iterations and the config hash, see EPOCH_COLUMNS) are kept
+    in one dataset per value, in the row order of the spectra. The rows are sorted by
+    time_explosion.
+
+    The file is opened for each call, so a store can be passed to other processes, but
+    only one process may write to it at a time (in batch_run_tardis the main process
+    writes the spectra that its workers return).
+
+    ----------
+    Parameters:
+        store_path: str or Path
+            The path to the HDF5 file, created when the first spectrum is appended
+    """
+
+    def __init__(self, store_path):
+        self.store_path = Path(store_path)
+
+    def append(self, model, epoch, wavelength, luminosity_density, **epoch_values):
+        """
+        Purpose:
+        ---------
+        Add the spectrum of an epoch to a model, or replace it if the model already has
+        the epoch. The row is inserted in time_explosion order, whatever the order the
+        epochs are appended in, and an epoch without a time goes after the others.
+
+        ----------
+        Parameters:
+            model: str
+                The model name, e.g. the folder name of its configs
+            epoch: str
+                The epoch name, e.g. the config file name without suffix
+            wavelength: array
+                The wavelengths in Angstrom, the same for all the epochs of a model
+            luminosity_density: array
+                The luminosity density in erg/s/Angstrom at each wavelength
+            epoch_values:
+                The values of the epoch, see EPOCH_COLUMNS, the missing ones are stored
+                as NaN, -1 or ""
+        """
+        unknown_columns = set(epoch_values) - set(EPOCH_COLUMNS)
+        if len(unknown_columns) > 0:
+            raise KeyError(f"Unknown epoch values {sorted(unknown_columns)}")
+        wavelength = np.asarray(wavelength, dtype=np.float64)
+        luminosity_density = np.asarray(luminosity_density, dtype=np.float64)
+        if luminosity_density.shape != wavelength.shape:
+            raise ValueError(
+                f"{model} {epoch}: {luminosity_density.shape[0]} luminosity densities for "
+                f"{wavelength.shape[0]} wavelengths"
+            )
+
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        with h5py.File(self.store_path, "a") as store:
+            if model not in store:
+                _create_model_group(store.create_group(model), wavelength)
+            group = store[model]
+            if not np.array_equal(group["wavelength"][()], wavelength):
+                raise ValueError(
+                    f"{model} {epoch}: the wavelengths differ from the other epochs of "
+                    f"the model in {self.store_path}"
+                )
+
+            epochs = group["epoch"].asstr()[()].tolist()
+            if epoch in epochs:
+                logger.info(
+                    f"Replacing the spectrum of {model} {epoch} in {self.store_path}"
+                )
+                _remove_row(group, epochs.index(epoch))
+            time_explosion = epoch_values.get("time_explosion")
+            row = _insert_row(
+                group, np.nan if time_explosion is None else time_explosion
+            )
+            group["epoch"][row] = epoch
+            group["luminosity_density"][row] = luminosity_density
+            for name, (_, fill_value, _) in EPOCH_COLUMNS.items():
+                value = epoch_values.get(name)
+                group[name][row] = fill_value if value is None else value
+
+    def models(self):
+        """The model names in the store"""
+        if not self.store_path.exists():
+            return []
+        with h5py.File(self.store_path, "r") as store:
+            return list(store.keys())
+
+    def epochs(self, model):
+        """The epoch names of a model, in the row order of its spectra (by time)"""
+        if model not in self.models():
+            return []
+        with h5py.File(self.store_path, "r") as store:
+            return store[model]["epoch"].asstr()[()].tolist()
+
+    def has_epoch(self, model, epoch, config_hash=None):
+        """If the store has the spectrum of an epoch, and if config_hash is given, of the
+        same config"""
+        if not self.store_path.exists():
+            return False
+        with h5py.File(self.store_path, "r") as store:
+            if model not in store:
+                return False
+            epochs = store[model]["epoch"].asstr()[()].tolist()
+            if epoch not in epochs:
+                return False
+            if config_hash is None:
+                return True
+            return (
+                store[model]["config_hash"].asstr()[epochs.index(epoch)] == config_hash
+            )
+
+    def epoch_table(self, model):
+        """
+        Purpose:
+        ---------
+        The values of the epochs of a model, see EPOCH_COLUMNS.
+
+        ----------
+        Returns:
+            dataframe, one row per epoch in the row order of the spectra, with the epoch
+            name in the "epoch" column
+        """
+        with h5py.File(self.store_path, "r") as store:
+            group = store[model]
+            df_epochs = pd.DataFrame({"epoch": group["epoch"].asstr()[()]})
+            for name in EPOCH_COLUMNS:
+                dataset = group[name]
+                if h5py.check_string_dtype(dataset.dtype) is not None:
+                    dataset = dataset.asstr()
+                df_epochs[name] = dataset[()]
+        return df_epochs
+
+    def load_spectra(self, model, out=None):
+        """
+        Purpose:
+        ---------
+        The spectra of all the epochs of a model as one (n_epochs, n_wavelengths) array.
+        The block is decompressed straight into the returned array, without an
+        intermediate copy per epoch. To reuse a buffer across models or calls, pass it as
+        out.
+
+        ----------
+        Parameters:
+            model: str
+            out: float64 array of shape (n_epochs, n_wavelengths) or None
+                The array to read the spectra into, None to allocate one
+
+        ----------
+        Returns:
+            wavelength: array, of shape (n_wavelengths,)
+            luminosity_density: array, of shape (n_epochs, n_wavelengths), in
+                time_explosion order, row i is the spectrum of epoch_table(model).iloc[i]
+        """
+        with h5py.File(self.store_path, "r") as store:
+            group = store[model]
+            wavelength = group["wavelength"][()]
+            dataset = group["luminosity_density"]
+            if out is None:
+                out = np.empty(dataset.shape, dtype=np.float64)
+            elif out.shape != dataset.shape or out.dtype != np.float64:
+                raise ValueError(
+                    f"out has the shape {out.shape} and dtype {out.dtype}, the spectra of "
+                    f"{model} have the shape {dataset.shape} and dtype float64"
+                )
+            if dataset.shape[0] > 0:
+                dataset.read_direct(out)
+        return wavelength, out
+
+    def load_spectrum(self, model, epoch):
+        """The wavelength and luminosity_density arrays of one epoch"""
+        epochs = self.epochs(model)
+        if epoch not in epochs:
+            raise KeyError(f"{model} has no epoch {epoch} in {self.store_path}")
+        with h5py.File(self.store_path, "r") as store:
+            group = store[model]
+            return group["wavelength"][()], group["luminosity_density"][
+                epochs.index(epoch)
+            ]
+
+
+def _create_model_group(group, wavelength):
+    """Create the empty, resizable datasets of a model, see SpectraStore"""
+    group.create_dataset("wavelength", data=wavelength)
+    group["wavelength"].attrs["unit"] = "Angstrom"
+    group.create_dataset(
+        "luminosity_density",
+        shape=(0, wavelength.shape[0]),
+        maxshape=(None, wavelength.shape[0]),
+        dtype=np.float64,
+        chunks=(SPECTRA_CHUNK_EPOCHS, wavelength.shape[0]),
+        compression=SPECTRA_COMPRESSION,
+        compression_opts=SPECTRA_COMPRESSION_LEVEL,
+        shuffle=True,
+    )
+    group["luminosity_density"].attrs["unit"] = "erg / (Angstrom s)"
+    group.create_dataset(
+        "epoch", shape=(0,), maxshape=(None,), dtype=h5py.string_dtype(), chunks=True
+    )
+    for name, (dtype, _, unit) in EPOCH_COLUMNS.items():
+        group.create_dataset(
+            name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=True
+        )
+        if unit is not None:
+            group[name].attrs["unit"] = unit
+
+
+def _datasets_by_row(group):
+    """The datasets of a model with one row per epoch"""
+    return [group[name] for name in ["epoch", "luminosity_density", *EPOCH_COLUMNS]]
+
+
+def _remove_row(group, row):
+    """Remove a row from all the datasets of a model, moving the later rows up"""
+    n_rows = group["epoch"].shape[0]
+    for dataset in _datasets_by_row(group):
+        if row < n_rows - 1:
+            dataset[row : n_rows - 1] = dataset[row + 1 : n_rows]
+        dataset.resize(n_rows - 1, axis=0)
+
+
+def _insert_row(group, time_explosion):
+    """Open an empty row in all the datasets of a model at the position of time_explosion
+    among the sorted times of its epochs (NaN sorts last), returns the row"""
+    times = group["time_explosion"][()]
+    n_rows = times.shape[0]
+    row = int(np.searchsorted(times, time_explosion, side="right"))
+    for dataset in _datasets_by_row(group):
+        dataset.resize(n_rows + 1, axis=0)
+        if row < n_rows:
+            dataset[row + 1 : n_rows + 1] = dataset[row:n_rows]
+    return row
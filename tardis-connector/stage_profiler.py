@@ -0,0 +1,357 @@
+import contextlib
+import functools
+import json
+import logging
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# the labels a stage takes from the stage it runs in, unless it is given its own
+STAGE_LABELS = ("model", "epoch")
+RECORD_COLUMNS = ("stage", *STAGE_LABELS, "seconds", "peak_memory_mb")
+
+# the profiler of this process, None while stage profiling is off
+_ACTIVE_PROFILER = None
+_NOT_PROFILED = contextlib.nullcontext()
+
+
+class StageProfiler:
+    """
+    Purpose:
+    ---------
+    The wall time and peak memory of each stage of a conversion, e.g. the .xg parse,
+    the composition remap or the csvy write of an epoch.
+
+    Stages are entered with profile_stage or the profiled decorator, and nest: a stage
+    run inside another one takes its model and epoch labels. The peak memory of a stage
+    is the most memory (traced by tracemalloc, numpy arrays included) allocated on top of
+    what was allocated when the stage started. Stages are timed in the thread that runs
+    the conversion, the functions run in the thread pools of the loaders are timed with
+    thread_profiled.
+
+    ----------
+    Parameters:
+        trace_memory: bool, default True
+            Record the peak memory of each stage, tracemalloc has to be tracing (see
+            profile_stages). Tracing slows the allocations down, so the times are a bit
+            longer
+        labels: dict or None, default None
+            The model and epoch of the stages that are not run in another stage
+    """
+
+    def __init__(self, trace_memory=True, labels=None):
+        self.trace_memory = trace_memory
+        self.labels = {label: (labels or {}).get(label) for label in STAGE_LABELS}
+        self.records = []
+        self._stack = []
+
+    def current_labels(self):
+        """The model and epoch of the stage that is running"""
+        if len(self._stack) == 0:
+            return dict(self.labels)
+        return {label: self._stack[-1][label] for label in STAGE_LABELS}
+
+    @contextlib.contextmanager
+    def stage(self, name, **labels):
+        """Time the with block as one run of the stage name, see profile_stage"""
+        frame = {"stage": name, **self.current_labels()}
+        for label in STAGE_LABELS:
+            if labels.get(label) is not None:
+                frame[label] = labels[label]
+        if self.trace_memory:
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            self._update_peak_memory(peak_memory)
+            frame["start_memory"] = frame["peak_memory"] = current_memory
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if self.trace_memory:
+                self._update_peak_memory(tracemalloc.get_traced_memory()[1])
+            self._stack.pop()
+            self.records.append(
+                {
+                    "stage": name,
+                    **{label: frame[label] for label in STAGE_LABELS},
+                    "seconds": seconds,
+                    "peak_memory_mb": (
+                        (frame["peak_memory"] - frame["start_memory"]) / 2**20
+                        if self.trace_memory
+                        else None
+                    ),
+                }
+            )
+
+    def record(self, name, seconds, labels):
+        """Add a run of the stage name that was timed outside of stage, e.g. in a thread
+        of a pool, without its peak memory, see thread_profiled"""
+        self.records.append(
+            {
+                "stage": name,
+                **{label: labels.get(label) for label in STAGE_LABELS},
+                "seconds": seconds,
+                "peak_memory_mb": None,
+            }
+        )
+
+    def _update_peak_memory(self, peak_memory):
+        """Fold the traced peak since the last reset into all the open stages, then reset
+        it, so a nested stage does not hide the peaks of the stages around it"""
+        for frame in self._stack:
+            frame["peak_memory"] = max(frame["peak_memory"], peak_memory)
+        tracemalloc.reset_peak()
+
+    def records_table(self):
+        """The records as a dataframe, one row per run of a stage, see RECORD_COLUMNS"""
+        return pd.DataFrame(self.records, columns=list(RECORD_COLUMNS))
+
+    def summary_table(self):
+        """The runs, total, mean and longest time and the largest peak memory of each
+        stage, the slowest stage in total first"""
+        df_records = self.records_table()
+        df_records["peak_memory_mb"] = df_records["peak_memory_mb"].astype(float)
+        df_summary = df_records.groupby("stage", sort=False).agg(
+            runs=("seconds", "size"),
+            total_seconds=("seconds", "sum"),
+            mean_seconds=("seconds", "mean"),
+            max_seconds=("seconds", "max"),
+            peak_memory_mb=("peak_memory_mb", "max"),
+        )
+        return df_summary.sort_values("total_seconds", ascending=False).reset_index()
+
+    def write_report(self, report_path):
+        """Write the records to report_path, a .csv file with one row per run of a stage,
+        or otherwise a json file with the "summary" of each stage and the "records"
+        """
+        report_path = Path(report_path)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        if report_path.suffix == ".csv":
+            self.records_table().to_csv(report_path, index=False)
+        else:
+            df_summary = self.summary_table().astype(object)
+            report = {
+                "summary": df_summary.where(df_summary.notna(), None).to_dict(
+                    "records"
+                ),
+                "records": self.records,
+            }
+            with open(report_path, "w") as wf:
+                json.dump(report, wf, indent=1)
+        logger.info(f"Wrote the stage profile to {report_path}")
+
+    def log_summary(self, log=logger):
+        """Log the summary_table and the slowest epoch"""
+        if len(self.records) == 0:
+            log.info("No stages were profiled")
+            return
+        header = (
+            f"{'stage':<24} {'runs':>6} {'total (s)':>10} {'mean (ms)':>10} "
+            f"{'max (ms)':>10} {'peak (MB)':>10}"
+        )
+        lines = [header]
+        for row in self.summary_table().itertuples():
+            peak_memory = (
+                "-" if pd.isna(row.peak_memory_mb) else f"{row.peak_memory_mb:.1f}"
+            )
+            lines.append(
+                f"{row.stage:<24} {row.runs:>6} {row.total_seconds:>10.3f} "
+                f"{row.mean_seconds * 1e3:>10.2f} {row.max_seconds * 1e3:>10.2f} "
+                f"{peak_memory:>10}"
+            )
+        # the parsers run all the stages of an epoch in one "epoch" stage
+        df_epochs = self.records_table()
+        df_epochs = df_epochs[df_epochs["stage"] == "epoch"]
+        if len(df_epochs) > 0:
+            slowest = df_epochs.loc[df_epochs["seconds"].idxmax()]
+            lines.append(
+                f"{len(df_epochs)} epochs, slowest {slowest['epoch']} "
+                f"({slowest['seconds']:.3f} s)"
+            )
+        log.info("Stage profile:\n" + "\n".join(lines))
+
+
+def profile_stage(name, **labels):
+    """
+    Purpose:
+    ---------
+    The context manager that profiles its with block as a run of the stage name, or
+    does nothing while stage profiling is off.
+
+    ----------
+    Parameters:
+        name: str
+            The stage name, e.g. "xg_parse" or "rebin"
+        labels:
+            The model and epoch of the stage, by default those of the stage it runs in
+    """
+    if _ACTIVE_PROFILER is None:
+        return _NOT_PROFILED
+    return _ACTIVE_PROFILER.stage(name, **labels)
+
+
+def profiled(name):
+    """Decorate a function to profile each call as a run of the stage name, see
+    profile_stage"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE_PROFILER is None:
+                return func(*args, **kwargs)
+            with _ACTIVE_PROFILER.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def thread_profiled(name, func, **labels):
+    """
+    Purpose:
+    ---------
+    func, or while stage profiling is on, func wrapped to record each call as a run of the
+    stage name, for the functions submitted to a thread pool, where profile_stage cannot
+    be used. The model and epoch are those of the stage that wraps func. The runs have no
+    peak memory, since tracemalloc does not tell the allocations of the threads apart.
+
+    ----------
+    Parameters:
+        name: str
+            The stage name, e.g. "dat_read"
+        func: callable
+        labels:
+            The model and epoch of the stage, by default those of the stage it runs in
+
+    ----------
+    Returns:
+        callable, func itself while stage profiling is off
+    """
+    if _ACTIVE_PROFILER is None:
+        return func
+    profiler = _ACTIVE_PROFILER
+    stage_labels = profiler.current_labels()
+    for label in STAGE_LABELS:
+        if labels.get(label) is not None:
+            stage_labels[label] = labels[label]
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.record(name, time.perf_counter() - start, stage_labels)
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def profile_stages(report_path=None, trace_memory=True, log=logger):
+    """
+    Purpose:
+    ---------
+    Profile the stages of the conversions run in the with block, e.g.
+
+        with profile_stages("stage_profile.json"):
+            parse_snec_to_tardis(...)
+
+    The summary is logged and the report written when the block ends, also if it fails.
+
+    ----------
+    Parameters:
+        report_path: str, Path or None, default None
+            The .json or .csv report to write, see StageProfiler.write_report, None to
+            only log the summary
+        trace_memory: bool, default True
+            Also record the peak memory of each stage
+        log: logging.Logger
+            The logger of the summary
+
+    ----------
+    Yields:
+        profiler: StageProfiler
+    """
+    global _ACTIVE_PROFILER
+    if _ACTIVE_PROFILER is not None:
+        raise RuntimeError("Stage profiling is already on in this process")
+    profiler = StageProfiler(trace_memory=trace_memory)
+    started_tracing = trace_memory and _start_tracing()
+    _ACTIVE_PROFILER = profiler
+    try:
+        yield profiler
+    finally:
+        _ACTIVE_PROFILER = None
+        if started_tracing:
+            tracemalloc.stop()
+        profiler.log_summary(log)
+        if report_path is not None:
+            profiler.write_report(report_path)
+
+
+def stage_profiling_settings():
+    """None while stage profiling is off, otherwise the settings that a worker process
+    passes to worker_stage_records to profile its part of the conversion, with the model
+    and epoch of the stage that hands the work out"""
+    if _ACTIVE_PROFILER is None:
+        return None
+    return {
+        "trace_memory": _ACTIVE_PROFILER.trace_memory,
+        "labels": _ACTIVE_PROFILER.current_labels(),
+    }
+
+
+@contextlib.contextmanager
+def worker_stage_records(settings):
+    """
+    Purpose:
+    ---------
+    Profile the stages of the with block in a worker process, where the profiler of the
+    main process is not running (a forked worker only has a copy of it).
+
+    ----------
+    Parameters:
+        settings: dict or None
+            See stage_profiling_settings, None to not profile
+
+    ----------
+    Yields:
+        records: list or None
+            The records of the stages, for the worker to return to the main process,
+            which adds them with merge_stage_records. None if settings is None
+    """
+    global _ACTIVE_PROFILER
+    if settings is None:
+        yield None
+        return
+    previous_profiler = _ACTIVE_PROFILER
+    profiler = StageProfiler(**settings)
+    started_tracing = profiler.trace_memory and _start_tracing()
+    _ACTIVE_PROFILER = profiler
+    try:
+        yield profiler.records
+    finally:
+        _ACTIVE_PROFILER = previous_profiler
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def merge_stage_records(records):
+    """Add the records returned by a worker (see worker_stage_records) to the profiler of
+    this process"""
+    if _ACTIVE_PROFILER is not None and records is not None:
+        _ACTIVE_PROFILER.records.extend(records)
+
+
+def _start_tracing():
+    """Start tracemalloc if it is not tracing yet, returns if it was started here"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start()
+    return True
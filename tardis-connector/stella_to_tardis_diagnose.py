@@ -1,40 +1,263 @@
 import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.pyplot import cm
 
 import astropy.units as u
 
-from tardis.io.model import read_stella_model
 from tardis.util.base import is_valid_nuclide_or_elem
 
+from stella_utils import as_stella_run
+
+DECIMATION_METHODS = ("minmax", "lttb")
+
+
+def decimate_min_max(y, max_points):
+    """
+    Purpose:
+    Indices of a min/max decimation of a curve: the points are split into
+    (max_points - 2) // 2 consecutive buckets and the minimum and maximum of each bucket
+    are kept, plus the first and last point, so every spike of the curve survives
+    -------------------
+    y: array-like, the values of the curve, in plotting order
+    max_points: int, the maximum number of points to keep, at least 4 (the first and last
+        point and the min and max of one bucket)
+    -------------------
+
+    Returns
+    -------------------
+    indices: int numpy array, sorted indices of the kept points
+    """
+    if max_points < 4:
+        raise ValueError(
+            f"min/max decimation keeps at least 4 points, got {max_points}"
+        )
+    y = np.asarray(y, dtype=np.float64)
+    n = y.size
+    if n <= max_points:
+        return np.arange(n)
+    n_buckets = (max_points - 2) // 2
+    bucket = np.arange(n) * n_buckets // n
+    # sort by (bucket, value), the first and last of each bucket are its min and max
+    order = np.lexsort((y, bucket))
+    bucket_starts = np.searchsorted(bucket[order], np.arange(n_buckets))
+    bucket_ends = np.r_[bucket_starts[1:], n] - 1
+    return np.unique(
+        np.concatenate([[0, n - 1], order[bucket_starts], order[bucket_ends]])
+    )
+
+
+def decimate_lttb(x, y, max_points):
+    """
+    Purpose:
+    Indices of a Largest-Triangle-Three-Buckets decimation of a curve (Steinarsson
+    2013): the first and last point are kept, and from each of the max_points - 2
+    buckets in between the point that makes the largest triangle with the point kept
+    from the previous bucket and the mean of the next bucket
+    -------------------
+    x: array-like, the x values of the curve, in plotting order
+    y: array-like, the y values of the curve
+    max_points: int, the number of points to keep, at least 3
+    -------------------
+
+    Returns
+    -------------------
+    indices: int numpy array, sorted indices of the kept points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if max_points < 3:
+        raise ValueError(f"LTTB decimation keeps at least 3 points, got {max_points}")
+    n = x.size
+    if n <= max_points:
+        return np.arange(n)
+
+    bucket_edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp)
+    indices = np.empty(max_points, dtype=np.intp)
+    indices[0] = 0
+    indices[-1] = n - 1
+    for i in range(max_points - 2):
+        start, end = bucket_edges[i], bucket_edges[i + 1]
+        if i + 2 < max_points - 1:
+            next_start, next_end = end, bucket_edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        x_next = x[next_start:next_end].mean()
+        y_next = y[next_start:next_end].mean()
+        x_prev, y_prev = x[indices[i]], y[indices[i]]
+        # twice the triangle areas, the factor does not change the argmax
+        areas = np.abs(
+            (x_prev - x_next) * (y[start:end] - y_prev)
+            - (x_prev - x[start:end]) * (y_next - y_prev)
+        )
+        indices[i + 1] = start + np.argmax(areas)
+    return indices
+
+
+def decimate_curve(x, y, max_points, method="minmax", log_y=True):
+    """
+    Purpose:
+    Decimate a curve for plotting with decimate_min_max or decimate_lttb
+    -------------------
+    x, y: array-like, the curve
+    max_points: int or None, the maximum number of points to keep, None to keep all
+    method: str, "minmax" or "lttb"
+    log_y: boolean, if True then the triangles of LTTB are measured on log10(y) (for
+        the log-scaled axes of the profile plots), min/max does not depend on it
+    -------------------
+
+    Returns
+    -------------------
+    x, y: numpy arrays of the kept points
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if max_points is None:
+        return x, y
+    if method == "minmax":
+        indices = decimate_min_max(y, max_points)
+    elif method == "lttb":
+        y_shape = y
+        if log_y and np.all(y > 0):
+            y_shape = np.log10(y)
+        indices = decimate_lttb(x, y_shape, max_points)
+    else:
+        raise ValueError(f"method must be one of {DECIMATION_METHODS}, got {method!r}")
+    return x[indices], y[indices]
+
+
+def profile_curves(
+    stella_model_path,
+    x_col,
+    y_col_s,
+    tau_upper_limit=False,
+    tardis_config_folder=None,
+    max_points=None,
+    decimation="minmax",
+):
+    """
+    Purpose:
+    The (decimated) profile curves that plot_profile_data draws, for each day the full
+    curve and the part with tau <= tau_upper_limit of every y column. Only the x_col,
+    y_col_s and tau columns of the snapshots are used
+    -------------------
+    stella_model_path: str or stella_utils.StellaRun, see plot_profile_data
+    x_col: str, x axis in the plot
+    y_col_s: list, y axes in the plot
+    tau_upper_limit: float or False, False for no tau filter
+    tardis_config_folder: str or None, if given only the days converted to tardis
+        configuration files are used
+    max_points: int or None, the maximum number of points of each curve, None to keep
+        the full resolution
+    decimation: str, "minmax" or "lttb", see decimate_curve
+    -------------------
+
+    Returns
+    -------------------
+    days_str: list, the day strings of the curves
+    curves: list of dict, for each day y_col -> (x_full, y_full, x_filtered, y_filtered),
+        the filtered curve is None if tau_upper_limit is False
+    """
+    stella_run = as_stella_run(stella_model_path)
+    if tardis_config_folder is not None:
+        tardis_csvy_files = sorted(glob.glob(f"{tardis_config_folder}/*.csvy"))
+        # stripp the days from the csvy files
+        days_str = [
+            csvy_file.split("/")[-1].split("_")[1] for csvy_file in tardis_csvy_files
+        ]
+    else:
+        days_str = stella_run.days_str
+
+    # only the plotted columns of the stella models
+    plot_columns = list(dict.fromkeys([x_col, *y_col_s]))
+    if tau_upper_limit is not False and "tau" not in plot_columns:
+        plot_columns.append("tau")
+
+    curves = []
+    for day_str in days_str:
+        _, stella_columns = stella_run.snapshot(day_str, columns=plot_columns)
+        if tau_upper_limit is not False:
+            keep = stella_columns["tau"] <= tau_upper_limit
+        day_curves = {}
+        for y_col in y_col_s:
+            x_full, y_full = decimate_curve(
+                stella_columns[x_col], stella_columns[y_col], max_points, decimation
+            )
+            if tau_upper_limit is not False:
+                x_filtered, y_filtered = decimate_curve(
+                    stella_columns[x_col][keep],
+                    stella_columns[y_col][keep],
+                    max_points,
+                    decimation,
+                )
+            else:
+                x_filtered, y_filtered = None, None
+            day_curves[y_col] = (x_full, y_full, x_filtered, y_filtered)
+        curves.append(day_curves)
+    return days_str, curves
+
+
+def _draw_profile_panel(ax, days_str, curves, y_col, tau_upper_limit, color_set):
+    """Draw the curves of one y column of profile_curves on ax"""
+    for i, day_str in enumerate(days_str):
+        x_full, y_full, x_filtered, y_filtered = curves[i][y_col]
+        ax.plot(x_full, y_full, color=color_set[i], alpha=0.3, ls="--")
+        if tau_upper_limit is not False:
+            if y_col == "tau" and i == 0:
+                ax.axhline(y=tau_upper_limit, color="k", linestyle="--", lw=0.5)
+            ax.plot(
+                x_filtered,
+                y_filtered,
+                color=color_set[i],
+                alpha=0.7,
+                label=f"Day {float(day_str)}",
+            )
+    ax.set_yscale("log")
+    ax.set_ylabel(y_col, fontsize=16)
+    ax.tick_params(axis="both", which="major", labelsize=14)
+    ax.grid(alpha=0.3)
+
 
 def plot_profile_data(
-    stella_model_path, x_col, y_col_s, tau_upper_limit=False, tardis_config_folder=None
+    stella_model_path,
+    x_col,
+    y_col_s,
+    tau_upper_limit=False,
+    tardis_config_folder=None,
+    max_points=None,
+    decimation="minmax",
 ):
     """Plot the profiles of the stella model and resulant tardis mapping
 
     Parameters
     ----------
-    stella_model_path : str
-        path to the folder where holds the stella models
+    stella_model_path : str or stella_utils.StellaRun
+        path to the folder where holds the stella models, or its StellaRun to reuse
+        the snapshots it already read
     tardis_config_folder : str
         path to the folder where holds the tardis configuration files
     x_col : str, x axis in the plot
     y_col_s : list, y axis in the plot
+    max_points : int or None
+        the maximum number of points of each curve, None (default) to plot the full
+        resolution, e.g. 500 for runs with many days
+    decimation : str
+        "minmax" (default) or "lttb", how the curves are decimated, see decimate_curve
     """
-    if tardis_config_folder is not None:
-        tardis_csvy_files = sorted(glob.glob(f"{tardis_config_folder}/*.csvy"))
-        # stripp the days from the csvy files
-        days_str = [
-            csvy_file.split("/")[-1].split("_")[1] for csvy_file in tardis_csvy_files
-        ]
-    else:
-        profile_files = sorted(glob.glob(f"{stella_model_path}/res/mesa.day*"))
-        days_str = [
-            file.split("/")[-1].split("_")[0].split("day")[1] for file in profile_files
-        ]
+    days_str, curves = profile_curves(
+        stella_model_path,
+        x_col,
+        y_col_s,
+        tau_upper_limit=tau_upper_limit,
+        tardis_config_folder=tardis_config_folder,
+        max_points=max_points,
+        decimation=decimation,
+    )
 
     # generate a color set for each day
     color_set = cm.cool(np.linspace(0, 1, len(days_str)))
@@ -42,77 +265,115 @@ def plot_profile_data(
     fig, axes = plt.subplots(
         len(y_col_s), 1, figsize=(8, 2.5 * len(y_col_s)), sharex=True
     )
+    axes = np.atleast_1d(axes)
     fig.subplots_adjust(hspace=0)
-
-    for i, day_str in enumerate(days_str):
-        stella_model = read_stella_model(
-            f"{stella_model_path}/res/mesa.day{day_str}_post_Lbol_max.data"
+    for j, y_col in enumerate(y_col_s):
+        _draw_profile_panel(
+            axes[j], days_str, curves, y_col, tau_upper_limit, color_set
         )
-        for j, y_col in enumerate(y_col_s):
-            axes[j].plot(
-                stella_model.data[x_col],
-                stella_model.data[y_col],
-                color=color_set[i],
-                alpha=0.3,
-                ls="--",
-            )
-        if tau_upper_limit is not False:
-            if ("tau" in y_col_s) and i == 0:
-                axes[y_col_s.index("tau")].axhline(
-                    y=tau_upper_limit, color="k", linestyle="--", lw=0.5
-                )
-            df_model_stella = stella_model.data[
-                stella_model.data["tau"] <= tau_upper_limit
-            ]
-            for j, y_col in enumerate(y_col_s):
-                axes[j].plot(
-                    df_model_stella[x_col],
-                    df_model_stella[y_col],
-                    color=color_set[i],
-                    alpha=0.7,
-                    label=f"Day {float(day_str)}",
-                )
-        else:
-            df_model_stella = stella_model.data
 
     axes[0].legend(loc="upper right", fontsize=10, bbox_to_anchor=(1.2, 1))
     axes[-1].set_xlabel(x_col, fontsize=16)
-    for i, ax in enumerate(axes):
-        ax.set_yscale("log")
-        ax.set_ylabel(y_col_s[i], fontsize=16)
-        ax.tick_params(axis="both", which="major", labelsize=14)
-        ax.grid(alpha=0.3)
 
     return fig
 
 
+def _render_profile_panel(panel):
+    """Render one panel of save_profile_panels into its file, in a worker process"""
+    output_path, x_col, y_col, days_str, curves, tau_upper_limit, dpi = panel
+    # a bare Figure does not touch the pyplot state, so it is safe in worker processes
+    fig = Figure(figsize=(8, 4))
+    ax = fig.add_subplot()
+    color_set = cm.cool(np.linspace(0, 1, len(days_str)))
+    _draw_profile_panel(ax, days_str, curves, y_col, tau_upper_limit, color_set)
+    if tau_upper_limit is not False:
+        ax.legend(loc="upper left", fontsize=8, bbox_to_anchor=(1.01, 1))
+    ax.set_xlabel(x_col, fontsize=16)
+    fig.savefig(output_path, dpi=dpi, bbox_inches="tight")
+    return output_path
+
+
+def save_profile_panels(
+    stella_model_path,
+    x_col,
+    y_col_s,
+    output_folder_path,
+    tau_upper_limit=False,
+    tardis_config_folder=None,
+    max_points=1000,
+    decimation="minmax",
+    file_format="png",
+    dpi=100,
+    n_workers=1,
+):
+    """
+    Purpose:
+    Save each panel of plot_profile_data as its own figure file, e.g.
+    {output_folder_path}/profile_avg_density.png. The snapshots are read and the curves
+    decimated once in this process, and the panels are rendered by n_workers worker
+    processes, which only receive the decimated curves
+    -------------------
+    stella_model_path: str or stella_utils.StellaRun, see plot_profile_data
+    x_col: str, x axis in the plots
+    y_col_s: list, one figure for each y column
+    output_folder_path: str, folder path to save the figures
+    tau_upper_limit, tardis_config_folder: see plot_profile_data
+    max_points: int or None, default 1000, the maximum number of points of each curve
+    decimation: str, "minmax" or "lttb"
+    file_format: str, default "png", the file extension passed to savefig
+    dpi: int, default 100
+    n_workers: int, default 1, the number of processes rendering the panels
+    -------------------
+
+    Returns
+    -------------------
+    output_paths: list, the saved figure files in the order of y_col_s
+    """
+    days_str, curves = profile_curves(
+        stella_model_path,
+        x_col,
+        y_col_s,
+        tau_upper_limit=tau_upper_limit,
+        tardis_config_folder=tardis_config_folder,
+        max_points=max_points,
+        decimation=decimation,
+    )
+    os.makedirs(output_folder_path, exist_ok=True)
+    panels = [
+        (
+            os.path.join(output_folder_path, f"profile_{y_col}.{file_format}"),
+            x_col,
+            y_col,
+            days_str,
+            [{y_col: day_curves[y_col]} for day_curves in curves],
+            tau_upper_limit,
+            dpi,
+        )
+        for y_col in y_col_s
+    ]
+    if n_workers <= 1 or len(panels) <= 1:
+        return [_render_profile_panel(panel) for panel in panels]
+    with ProcessPoolExecutor(min(n_workers, len(panels))) as executor:
+        return list(executor.map(_render_profile_panel, panels))
+
+
 def plot_bolometric_LC(
     STELLA_model_folder,
     L_NUC_RATIO_UPPER_LIMIT=None,
     tardis_config_folder=None,
     ax=None,
 ):
-    lbol_file = f"{STELLA_model_folder}/res/mesa.lbol_lnuc.txt"
-    df_bol = pd.read_csv(
-        lbol_file,
-        sep=r"\s+",
-        skiprows=1,
-        header=None,
-        names=["time", "logL_bol", "logL_nuc"],
-    )
-    df_bol_with_uBVri = pd.read_csv(
-        f"{STELLA_model_folder}/res/mesa.lbol",
-        sep=r"\s+",
-    )
+    """Plot the bolometric light curve of the stella model, STELLA_model_folder can be the
+    path to the stella model folder or its stella_utils.StellaRun"""
+    stella_run = as_stella_run(STELLA_model_folder)
+    df_bol = stella_run.lbol_lnuc
+    df_bol_with_uBVri = stella_run.lbol
     if ax is None:
         fig, axes = plt.subplots(2, 1, figsize=(8, 12))
         ax = axes[0]
 
     if L_NUC_RATIO_UPPER_LIMIT is not None:
-        df_bol["L_nuc_ratio"] = 10 ** (df_bol["logL_nuc"] - df_bol["logL_bol"])
-        max_photospheric_day = df_bol.time.values[
-            df_bol["L_nuc_ratio"].values <= L_NUC_RATIO_UPPER_LIMIT
-        ][-1]
+        max_photospheric_day = stella_run.max_photospheric_day(L_NUC_RATIO_UPPER_LIMIT)
         df_bol = df_bol[df_bol["time"] <= max_photospheric_day + 10]
         ax.axvline(max_photospheric_day, color="k", ls="--", label="Photospheric limit")
 
@@ -123,11 +384,17 @@ def plot_bolometric_LC(
             float(csvy_file.split("/")[-1].split("_")[1])
             for csvy_file in tardis_csvy_files
         ]
-        for day in days_tardis:
-            day_index = np.argmin(np.abs(df_bol["time"].values - day))
-            ax.scatter(
-                day, df_bol["logL_bol"].values[day_index], marker="o", color="tab:blue"
-            )
+        # the plotted times are a prefix of the time-sorted table, so the nearest plotted
+        # time is the nearest time of the whole table clipped to the plotted ones
+        day_indices = np.minimum(
+            stella_run.nearest_lbol_lnuc_index(days_tardis), len(df_bol) - 1
+        )
+        ax.scatter(
+            days_tardis,
+            df_bol["logL_bol"].values[day_indices],
+            marker="o",
+            color="tab:blue",
+        )
 
     # plot the bolometric luminosity
     ax.plot(df_bol["time"], df_bol["logL_bol"], label="logL_bol")
@@ -1,18 +1,42 @@
 import logging
-import glob
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import sys
 import numpy as np
 import pandas as pd
-from scipy import interpolate
 
-from tardis.io.model import read_stella_model
-
-from tardis_utils import write_tardis_csvy, write_tardis_config
+from cache_utils import ConversionManifest, cache_key
+from nuclide_table import load_nuclide_table
+from stage_profiler import (
+    merge_stage_records,
+    profile_stage,
+    profiled,
+    stage_profiling_settings,
+    worker_stage_records,
+)
+from stella_utils import STELLA_PARSER_COLUMNS, as_stella_run
+from tardis_utils import (
+    ProfileRemapper,
+    load_tardis_templates,
+    increasing_subsequence_mask,
+    rebin_shell_profiles,
+    regular_bin_starts,
+)
 import astropy.units as u
 
 logger = logging.getLogger(__name__)
 
+# inputs shared by all days converted by parse_stella_models_to_tardis_configs, see convert_days_in_parallel
+_DAY_WORKER_INPUTS = {}
+
+
+def _init_day_worker(shared_day_inputs):
+    """Set the shared inputs in a worker that does not inherit them (spawn start method)"""
+    _DAY_WORKER_INPUTS.update(shared_day_inputs)
+
+
 ##########################################
 ###### Key options that affect the parser
 INTERPOLATE_MASS_FRACTIONS = True  # boolean, if True then interpolate the mass fractions from MESA profile onto STELLA mass grid
@@ -27,6 +51,7 @@ TAU_LOWER_LIMIT = (
     False  # False or float, filter out the shells that has tau larger than this value
 )
 SHRINK_SHELL_NUMBER = False  # False or int, if int then end up with this int as total shell numbers that keep the velocity range but lower the grid resolution
+SHRINK_SHELL_WEIGHTING = None  # None, "volume" or "mass", how density and composition are averaged when shrinking the shell number, None for the plain mean
 L_NUC_RATIO_UPPER_LIMIT = 0.8  # default 0.8, criteria to determine if the photosphere holds, means L_nuc/L_bol <= 0.8
 LOGGING_LEVEL = logging.INFO
 ##########################################
@@ -42,13 +67,16 @@ def parse_stella_models_to_tardis_configs(
     tau_upper_limit=TAU_UPPER_LIMIT,
     tau_lower_limit=TAU_LOWER_LIMIT,
     shrink_shell_number=SHRINK_SHELL_NUMBER,
+    shrink_shell_weighting=SHRINK_SHELL_WEIGHTING,
     l_nuc_ratio_upper_limit=L_NUC_RATIO_UPPER_LIMIT,
+    n_workers=1,
+    overwrite=False,
 ):
     """
     Purpose:
     Parse the Stella model outputs (time series) to TARDIS config files with csvy format
     -------------------
-    stella_folder_path: str, folder path to the stella model, need the res folder and other essential files
+    stella_folder_path: str or stella_utils.StellaRun, folder path to the stella model, need the res folder and other essential files. A StellaRun shares its cached tables and snapshots with other uses of the run, e.g. the plots of stella_to_tardis_diagnose
     tardis_example_config_folder_path: str, folder path to the tardis example config files
     tardis_config_output_folder_path: default None, will create a tardis_configs folder in stella model, path to save the tardis config
     interpolate_mass_fractions: boolean, if True then interpolate the mass fractions from MESA profile onto STELLA mass grid
@@ -56,24 +84,178 @@ def parse_stella_models_to_tardis_configs(
     max_nonhomologous_shells: int, if active if skip_nonhomologous_models is True, the maximum number of non-homologous shells to skip
     tau_upper_limit: False or float, filter out the shells that has tau larger than this value
     shrink_shell_number: False or int, if int then truncate the shell number to this value by skipping even number of shells in between
+    shrink_shell_weighting: None, "volume" or "mass", how density and composition are averaged when shrinking the shell number, see tardis_utils.rebin_shell_profiles
     l_nuc_ratio_upper_limit: float, criteria to determine if the photosphere holds, a fraction between 0 - 1, L_nuc/L_bol <= 0.8 is the default
+    n_workers: int, default 1, if larger than 1 then convert the days over this number of processes
+    overwrite: boolean, default False, if False then skip the days already converted from the same stella/MESA files, templates and options, as recorded in the conversion manifest of the output folder (see cache_utils.ConversionManifest)
     -------------------
 
     Returns
     -------------------
     Convert the stella model to a tardis config with csvy format, saving at
+    tardis_config_output_folder_path. A day that fails to convert does not stop the others,
+    returns a summary dict with the "converted", "skipped", "up_to_date" and "failed" (day -> error) days
     """
 
+    stella_run = as_stella_run(stella_folder_path)
+    stella_folder_path = stella_run.stella_folder_path
+    shared_day_inputs, days_stella_profiles_photospheric = (
+        load_stella_conversion_inputs(
+            stella_run,
+            tardis_example_config_folder_path,
+            interpolate_mass_fractions=interpolate_mass_fractions,
+            skip_nonhomologous_models=skip_nonhomologous_models,
+            max_nonhomologous_shells=max_nonhomologous_shells,
+            tau_upper_limit=tau_upper_limit,
+            tau_lower_limit=tau_lower_limit,
+            shrink_shell_number=shrink_shell_number,
+            shrink_shell_weighting=shrink_shell_weighting,
+            l_nuc_ratio_upper_limit=l_nuc_ratio_upper_limit,
+        )
+    )
+    days_stella_profiles_str = shared_day_inputs["days_stella_profiles_str"]
+    templates = shared_day_inputs["templates"]
+
+    # make the output folder if it doesn't exist yet
+    if tardis_config_output_folder_path is None:
+        logger.info(
+            f"No config output folder path provided. Defaulting to {stella_folder_path}/tardis_configs"
+        )
+        tardis_config_output_folder_path = Path(f"{stella_folder_path}/tardis_configs")
+    tardis_config_output_folder_path = Path(tardis_config_output_folder_path)
+    tardis_config_output_folder_path.mkdir(parents=True, exist_ok=True)
+    shared_day_inputs["tardis_config_output_folder_path"] = (
+        tardis_config_output_folder_path
+    )
+
+    # skip the days that are already converted from the same inputs
+    manifest = ConversionManifest(tardis_config_output_folder_path)
+    shared_input_files = [
+        stella_run.lbol_lnuc_file,
+        templates.tardis_sample_csvy_path,
+        templates.tardis_sample_config_path,
+    ]
+    if interpolate_mass_fractions:
+        shared_input_files.append(f"{stella_folder_path}/profile1.data")
+    shared_inputs_key = cache_key(
+        shared_input_files,
+        extra={
+            "product": "stella_to_tardis",
+            "version": 1,
+            "options": {
+                "interpolate_mass_fractions": interpolate_mass_fractions,
+                "skip_nonhomologous_models": skip_nonhomologous_models,
+                "max_nonhomologous_shells": max_nonhomologous_shells,
+                "tau_upper_limit": tau_upper_limit,
+                "tau_lower_limit": tau_lower_limit,
+                "shrink_shell_number": shrink_shell_number,
+                "shrink_shell_weighting": shrink_shell_weighting,
+            },
+        },
+        include_mtime=False,
+    )
+
+    days = []
+    day_keys = {}
+    day_results = []
+    for day_index, day in enumerate(days_stella_profiles_photospheric):
+        day_str = days_stella_profiles_str[day_index]
+        day_keys[day_str] = cache_key(
+            [stella_run.snapshot_file(day_str)],
+            extra={"inputs": shared_inputs_key, "day": day_str},
+            include_mtime=False,
+        )
+        if not overwrite and manifest.is_up_to_date(
+            f"Day_{day_str}", day_keys[day_str]
+        ):
+            day_results.append((day_str, "up_to_date", None))
+        else:
+            days.append((day_index, day))
+
+    # screen the days on tau and cell_center_v only, before parsing them in full
+    if skip_nonhomologous_models is not False and len(days) > 0:
+        accepted, n_nonhomologous_shells = screen_stella_days(
+            stella_run,
+            [days_stella_profiles_str[day_index] for day_index, _ in days],
+            tau_upper_limit=tau_upper_limit,
+            tau_lower_limit=tau_lower_limit,
+            max_nonhomologous_shells=max_nonhomologous_shells,
+        )
+        for (day_index, day), day_accepted, n_shells in zip(
+            days, accepted, n_nonhomologous_shells
+        ):
+            if day_accepted:
+                continue
+            logger.warning(
+                f"Day {day} has more than {max_nonhomologous_shells} non-homologous shells ({n_shells}), skipping the model"
+            )
+            day_str = days_stella_profiles_str[day_index]
+            manifest.record(f"Day_{day_str}", day_keys[day_str])
+            day_results.append((day_str, "skipped", None))
+        days = [day for day, day_accepted in zip(days, accepted) if day_accepted]
+
+    def record_day(day_str, status):
+        if status == "converted":
+            manifest.record(
+                f"Day_{day_str}",
+                day_keys[day_str],
+                [
+                    f"Day_{day_str}_mesa_stella_model.csvy",
+                    f"Day_{day_str}_mesa_stella_tardis.yml",
+                ],
+            )
+        elif status == "skipped":
+            manifest.record(f"Day_{day_str}", day_keys[day_str])
+
+    if n_workers > 1 and len(days) > 1:
+        shared_day_inputs["stage_profiling"] = stage_profiling_settings()
+        day_results += convert_days_in_parallel(
+            days, shared_day_inputs, n_workers, day_done_callback=record_day
+        )
+    else:
+        for day_index, day in days:
+            day_result = _convert_day_safely(day_index, day, shared_day_inputs)
+            record_day(*day_result[:2])
+            day_results.append(day_result)
+
+    return summarize_day_results(day_results)
+
+
+def load_stella_conversion_inputs(
+    stella_folder_path,
+    tardis_example_config_folder_path,
+    interpolate_mass_fractions=INTERPOLATE_MASS_FRACTIONS,
+    skip_nonhomologous_models=SKIP_NONHOMOLOGOUS_MODELS,
+    max_nonhomologous_shells=MAX_NONHOMOLOGOUS_SHELLS,
+    tau_upper_limit=TAU_UPPER_LIMIT,
+    tau_lower_limit=TAU_LOWER_LIMIT,
+    shrink_shell_number=SHRINK_SHELL_NUMBER,
+    shrink_shell_weighting=SHRINK_SHELL_WEIGHTING,
+    l_nuc_ratio_upper_limit=L_NUC_RATIO_UPPER_LIMIT,
+):
+    """
+    Purpose:
+    Check the files of a stella run and load the inputs shared by all its days: the
+    templates, the MESA composition remapper and the bolometric luminosities, see
+    parse_stella_models_to_tardis_configs for the parameters
+    -------------------
+
+    Returns
+    -------------------
+    shared_day_inputs: dict, the inputs of stella_day_model, without the output folder
+    days_stella_profiles_photospheric: float array, the days within the photospheric limit
+    """
     ###  check all the required files exist in the folder
     # check the stella model files
-    stella_output_files = sorted(glob.glob(f"{stella_folder_path}/res/mesa.day*"))
-    if len(stella_output_files) == 0:
+    stella_run = as_stella_run(stella_folder_path)
+    stella_folder_path = stella_run.stella_folder_path
+    if len(stella_run.snapshot_files) == 0:
         raise FileNotFoundError(
             f"No stella model files found in {stella_folder_path}/res"
         )
 
     # check the stella mesa.lbol_lnuc.txt file
-    L_bol_file = f"{stella_folder_path}/res/mesa.lbol_lnuc.txt"
+    L_bol_file = stella_run.lbol_lnuc_file
     if not Path(L_bol_file).exists():
         raise FileNotFoundError(
             f"No mesa.lbol_lnuc.txt file found in the folder: {stella_folder_path}/res"
@@ -84,13 +266,19 @@ def parse_stella_models_to_tardis_configs(
         mesa_profile_file = f"{stella_folder_path}/profile1.data"
         if not Path(mesa_profile_file).exists():
             raise FileNotFoundError(
-                f"No mesa profile1.data file found in the folder: {stella_folder_path}/res"
+                f"No mesa profile1.data file found in the folder: {stella_folder_path}, "
+                "set interpolate_mass_fractions to False to use the stella composition"
             )
 
-    # check if the tardis examples files exsits
+    # check if the tardis examples files exsits, the template config has the same name
+    # as for the SNEC parser, or its former name
     tardis_sample_config_path = (
-        f"{tardis_example_config_folder_path}/tardis_example_config_SESN.yml"
+        f"{tardis_example_config_folder_path}/tardis_template_config_SESN.yml"
     )
+    if not Path(tardis_sample_config_path).exists():
+        tardis_sample_config_path = (
+            f"{tardis_example_config_folder_path}/tardis_example_config_SESN.yml"
+        )
     tardis_sample_csvy_path = (
         f"{tardis_example_config_folder_path}/tardis_example_csvy.csvy"
     )
@@ -104,45 +292,351 @@ def parse_stella_models_to_tardis_configs(
             f"No tardis example csvy file found in the folder: {tardis_example_config_folder_path}"
         )
 
-    # make the output folder if it doesn't exist yet
-    if tardis_config_output_folder_path is None:
-        logger.info(
-            f"No config output folder path provided. Defaulting to {stella_folder_path}/tardis_configs"
-        )
-        tardis_config_output_folder_path = Path(f"{stella_folder_path}/tardis_configs")
-    tardis_config_output_folder_path.mkdir(parents=True, exist_ok=True)
+    # parse the templates once for all the days
+    templates = load_tardis_templates(
+        tardis_sample_csvy_path, tardis_sample_config_path
+    )
+
+    # read the mesa profile composition once and build the remapper onto stella mass grids
+    if interpolate_mass_fractions:
+        with profile_stage("composition_read"):
+            df_profile = pd.read_csv(mesa_profile_file, sep=r"\s+", skiprows=5)
+
+            # get the isotopes from the composition columns
+            composition_columns_profile = [
+                col
+                for col in df_profile.columns
+                if col[0].isalpha()
+                and col[-1].isdigit()
+                and "_" not in col
+                and col not in ["gamma1", "pnhe4"]
+            ]
+
+            # MESA going inwards, the mass fractions outside the MESA grid hold the edge values
+            mesa_remapper = ProfileRemapper(
+                df_profile["mass"].astype(np.float64).values[::-1],
+                df_profile[composition_columns_profile].astype(np.float64).values[::-1],
+            )
+        nuclide_table = load_nuclide_table()
+        mesa_isotopes_for_tardis = [
+            nuclide_table.from_lowercase(isotope)
+            for isotope in composition_columns_profile
+        ]
 
     #######
     # extract the maximum day within photospheric assumption using l_nuc_ratio_upper_limit
-    df_bol = pd.read_csv(
-        L_bol_file,
-        sep=r"\s+",
-        skiprows=1,
-        header=None,
-        names=["time", "logL_bol", "logL_nuc"],
-    )
-    df_bol["L_nuc_ratio"] = 10 ** (df_bol["logL_nuc"] - df_bol["logL_bol"])
-    max_photospheric_day = df_bol.time.values[
-        df_bol["L_nuc_ratio"].values <= l_nuc_ratio_upper_limit
-    ][-1]
+    df_bol = stella_run.lbol_lnuc
+    max_photospheric_day = stella_run.max_photospheric_day(l_nuc_ratio_upper_limit)
 
     # extract the days that have available stella profiles
-    days_stella_profiles_str = [
-        file.split("/")[-1].split("_")[0].split("day")[1]
-        for file in stella_output_files
-    ]
-    days_stella_profiles = np.array([float(item) for item in days_stella_profiles_str])
+    days_stella_profiles_str = stella_run.days_str
+    days_stella_profiles = stella_run.days
     days_stella_profiles_photospheric = days_stella_profiles[
         days_stella_profiles <= max_photospheric_day
     ]
 
     ###### Read the stella model and convert to tardis config
-    # loop through each profile check if they are monotonically increasing
-    for day_index, day in enumerate(days_stella_profiles_photospheric):
-        # read the stella model
-        stella_model = read_stella_model(stella_output_files[day_index])
-        df_stella_data = stella_model.data
+    # the inputs shared by all the days, each day is converted by convert_stella_day
+    shared_day_inputs = {
+        "stella_run": stella_run,
+        "days_stella_profiles_str": days_stella_profiles_str,
+        # the bolometric luminosity at each day, and the earliest time of the Lbol table
+        "L_bol_at_days": 10
+        ** df_bol["logL_bol"].values[
+            stella_run.nearest_lbol_lnuc_index(days_stella_profiles_photospheric)
+        ],
+        "lbol_start_time": df_bol["time"].min(),
+        "templates": templates,
+        "interpolate_mass_fractions": interpolate_mass_fractions,
+        "skip_nonhomologous_models": skip_nonhomologous_models,
+        "max_nonhomologous_shells": max_nonhomologous_shells,
+        "tau_upper_limit": tau_upper_limit,
+        "tau_lower_limit": tau_lower_limit,
+        "shrink_shell_number": shrink_shell_number,
+        "shrink_shell_weighting": shrink_shell_weighting,
+    }
+    if interpolate_mass_fractions:
+        shared_day_inputs["mesa_remapper"] = mesa_remapper
+        shared_day_inputs["mesa_isotopes_for_tardis"] = mesa_isotopes_for_tardis
+        shared_day_inputs["composition_columns_profile"] = composition_columns_profile
+    return shared_day_inputs, days_stella_profiles_photospheric
+
+
+def stella_day_models(
+    stella_folder_path,
+    tardis_example_config_folder_path,
+    interpolate_mass_fractions=INTERPOLATE_MASS_FRACTIONS,
+    skip_nonhomologous_models=SKIP_NONHOMOLOGOUS_MODELS,
+    max_nonhomologous_shells=MAX_NONHOMOLOGOUS_SHELLS,
+    tau_upper_limit=TAU_UPPER_LIMIT,
+    tau_lower_limit=TAU_LOWER_LIMIT,
+    shrink_shell_number=SHRINK_SHELL_NUMBER,
+    shrink_shell_weighting=SHRINK_SHELL_WEIGHTING,
+    l_nuc_ratio_upper_limit=L_NUC_RATIO_UPPER_LIMIT,
+    tardis_config_output_folder_path=None,
+):
+    """
+    Purpose:
+    Yield the tardis inputs of each stella day in memory, the same days and models as
+    parse_stella_models_to_tardis_configs writes, e.g. to run TARDIS on a sweep of days
+    without writing and re-reading the config yml files:
+
+        for day_model in stella_day_models(stella_folder_path, template_folder_path):
+            config, csvy_model_config, model_table = day_model.tardis_inputs()
+            workflow = InMemoryInnerVelocitySolverWorkflow.from_csvy_model(
+                config, csvy_model_config, model_table
+            )
+
+    or run_tardis_epoch(day_model, spec_output_file), both from tardis_utils, where the
+    workflow is set up on the csvy model in memory. The non-homologous days are skipped, an error in a
+    day is raised
+    -------------------
+    stella_folder_path ... l_nuc_ratio_upper_limit: see parse_stella_models_to_tardis_configs
+    tardis_config_output_folder_path: default None, if given then also write the csvy and config file of each day to this folder, no files are written otherwise
+    -------------------
+
+    Yields
+    -------------------
+    tardis_utils.TardisEpochModel of each converted day, in the order of the days, the
+    same as snec_to_tardis_parser.snec_epoch_models
+    """
+    shared_day_inputs, days_stella_profiles_photospheric = (
+        load_stella_conversion_inputs(
+            stella_folder_path,
+            tardis_example_config_folder_path,
+            interpolate_mass_fractions=interpolate_mass_fractions,
+            skip_nonhomologous_models=skip_nonhomologous_models,
+            max_nonhomologous_shells=max_nonhomologous_shells,
+            tau_upper_limit=tau_upper_limit,
+            tau_lower_limit=tau_lower_limit,
+            shrink_shell_number=shrink_shell_number,
+            shrink_shell_weighting=shrink_shell_weighting,
+            l_nuc_ratio_upper_limit=l_nuc_ratio_upper_limit,
+        )
+    )
+    days_stella_profiles_str = shared_day_inputs["days_stella_profiles_str"]
+    if tardis_config_output_folder_path is not None:
+        Path(tardis_config_output_folder_path).mkdir(parents=True, exist_ok=True)
+
+    days = list(enumerate(days_stella_profiles_photospheric))
+    # screen the days on tau and cell_center_v only, before parsing them in full
+    if skip_nonhomologous_models is not False and len(days) > 0:
+        accepted, _ = screen_stella_days(
+            shared_day_inputs["stella_run"],
+            [days_stella_profiles_str[day_index] for day_index, _ in days],
+            tau_upper_limit=tau_upper_limit,
+            tau_lower_limit=tau_lower_limit,
+            max_nonhomologous_shells=max_nonhomologous_shells,
+        )
+        days = [day for day, day_accepted in zip(days, accepted) if day_accepted]
+
+    for day_index, day in days:
+        day_str = days_stella_profiles_str[day_index]
+        with profile_stage("epoch", epoch=f"Day_{day_str}"):
+            day_model = stella_day_model(day_index, day, shared_day_inputs)
+            if day_model is not None and tardis_config_output_folder_path is not None:
+                day_model.write(tardis_config_output_folder_path)
+        if day_model is None:
+            continue
+        yield day_model
+
+
+@profiled("homology_screen")
+def screen_stella_days(
+    stella_run,
+    days_str,
+    tau_upper_limit=TAU_UPPER_LIMIT,
+    tau_lower_limit=TAU_LOWER_LIMIT,
+    max_nonhomologous_shells=MAX_NONHOMOLOGOUS_SHELLS,
+):
+    """
+    Purpose:
+    Cheap first pass over the stella days, reading only the tau and cell_center_v columns,
+    to find the days that pass the homology criterion of convert_stella_day before they are
+    parsed in full. A day that cannot be read is accepted, so its error is reported when it
+    is converted.
+    -------------------
+    stella_run: stella_utils.StellaRun, the stella run, the screened snapshots stay in its cache
+    days_str: list, the day strings of the days to screen
+    tau_upper_limit: False or float, the tau cut applied before counting the shells
+    tau_lower_limit: False or float, the tau cut applied before counting the shells
+    max_nonhomologous_shells: int, the days with more non-homologous shells are rejected
+    -------------------
+
+    Returns
+    -------------------
+    accepted: boolean array, one per day
+    n_nonhomologous_shells: int array, one per day (0 for the days that cannot be read)
+    """
+    cell_center_v_s = []
+    tau_s = []
+    for day_str in days_str:
+        try:
+            _, stella_columns = stella_run.snapshot(
+                day_str, columns=["cell_center_v", "tau"]
+            )
+        except Exception:
+            stella_columns = {"cell_center_v": np.zeros(0), "tau": np.zeros(0)}
+        cell_center_v_s.append(stella_columns["cell_center_v"])
+        tau_s.append(stella_columns["tau"])
+
+    n_nonhomologous_shells = count_nonhomologous_shells(
+        cell_center_v_s, tau_s, tau_upper_limit, tau_lower_limit
+    )
+    return n_nonhomologous_shells <= max_nonhomologous_shells, n_nonhomologous_shells
+
+
+def count_nonhomologous_shells(
+    cell_center_v_s, tau_s, tau_upper_limit=False, tau_lower_limit=False
+):
+    """
+    Purpose:
+    Count the non-homologous shells of many days in one batched array operation, the same
+    count as convert_stella_day: the center velocities are shifted to the inner boundaries,
+    the tau cuts are applied, and the shells whose velocity is lower than the previous kept
+    shell are counted.
+    -------------------
+    cell_center_v_s: list, the cell_center_v array of each day
+    tau_s: list, the tau array of each day
+    tau_upper_limit: False or float
+    tau_lower_limit: False or float
+    -------------------
+
+    Returns
+    -------------------
+    int array, the number of non-homologous shells of each day
+    """
+    n_days = len(cell_center_v_s)
+    n_zones = max([len(cell_center_v) for cell_center_v in cell_center_v_s] + [1])
+
+    # pad the days to the same number of zones
+    cell_center_v = np.zeros((n_days, n_zones))
+    tau = np.zeros((n_days, n_zones))
+    valid = np.zeros((n_days, n_zones - 1), dtype=bool)
+    for i, (day_cell_center_v, day_tau) in enumerate(zip(cell_center_v_s, tau_s)):
+        cell_center_v[i, : len(day_cell_center_v)] = day_cell_center_v
+        tau[i, : len(day_tau)] = day_tau
+        valid[i, : len(day_cell_center_v) - 1] = True
+
+    # shift the center v to boundary v, the last cell is dropped
+    v_inner_edge = (cell_center_v[:, :-1] + cell_center_v[:, 1:]) / 2
+    tau = tau[:, :-1]
+    keep = valid
+    if tau_upper_limit is not False:
+        keep = keep & (tau <= tau_upper_limit)
+    if tau_lower_limit is not False:
+        keep = keep & (tau >= tau_lower_limit)
+
+    # the index of the previous kept shell of each shell, -1 if there is none
+    kept_index = np.where(keep, np.arange(n_zones - 1), -1)
+    last_kept_index = np.maximum.accumulate(kept_index, axis=1)
+    previous_kept_index = np.concatenate(
+        [np.full((n_days, 1), -1), last_kept_index[:, :-1]], axis=1
+    )
+    previous_v = np.take_along_axis(
+        v_inner_edge, np.clip(previous_kept_index, 0, None), axis=1
+    )
+    backwards = keep & (previous_kept_index >= 0) & (v_inner_edge - previous_v < 0)
+    return backwards.sum(axis=1)
+
+
+def _convert_day_safely(day_index, day, shared_day_inputs=None):
+    """Run convert_stella_day, returning the error instead of raising it so one bad day
+    does not stop the other days."""
+    inputs = _DAY_WORKER_INPUTS if shared_day_inputs is None else shared_day_inputs
+    day_str = inputs["days_stella_profiles_str"][day_index]
+    try:
+        return day_str, convert_stella_day(day_index, day, inputs), None
+    except Exception as e:
+        return day_str, "failed", f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+
+
+def _convert_day_in_worker(day_index, day):
+    """_convert_day_safely in a worker process, returns its result and the records of its
+    stages if they are profiled, see stage_profiler.worker_stage_records"""
+    with worker_stage_records(
+        _DAY_WORKER_INPUTS.get("stage_profiling")
+    ) as stage_records:
+        day_result = _convert_day_safely(day_index, day)
+    return day_result, stage_records
 
+
+def convert_stella_day(day_index, day, shared_day_inputs):
+    """
+    Purpose:
+    Convert one stella snapshot (day) to a tardis config and csvy file
+    -------------------
+    day_index: int, index of the day in the stella output files
+    day: float, the day of the stella snapshot
+    shared_day_inputs: dict, the inputs shared by all the days, see parse_stella_models_to_tardis_configs
+    -------------------
+
+    Returns
+    -------------------
+    "converted", or "skipped" if the model is not homologous enough
+    """
+    tardis_config_output_folder_path = shared_day_inputs[
+        "tardis_config_output_folder_path"
+    ]
+    day_str = shared_day_inputs["days_stella_profiles_str"][day_index]
+    with profile_stage("epoch", epoch=f"Day_{day_str}"):
+        day_model = stella_day_model(day_index, day, shared_day_inputs)
+        if day_model is None:
+            return "skipped"
+
+        day_model.write_config(
+            tardis_config_output_folder_path / day_model.config_file_name
+        )
+        day_model.write_csvy(
+            tardis_config_output_folder_path / day_model.csvy_file_name
+        )
+        logger.info(
+            f"Day {shared_day_inputs['days_stella_profiles_str'][day_index]} model converted to TARDIS config and csvy format, {tardis_config_output_folder_path.name}/{day_model.csvy_file_name} and .yml"
+        )
+        return "converted"
+
+
+def stella_day_model(day_index, day, shared_day_inputs):
+    """
+    Purpose:
+    Map one stella snapshot (day) to its tardis inputs in memory, see
+    tardis_utils.TardisEpochModel
+    -------------------
+    day_index: int, index of the day in the stella output files
+    day: float, the day of the stella snapshot
+    shared_day_inputs: dict, the inputs shared by all the days, see load_stella_conversion_inputs
+    -------------------
+
+    Returns
+    -------------------
+    tardis_utils.TardisEpochModel, or None if the model is not homologous enough
+    """
+    stella_run = shared_day_inputs["stella_run"]
+    days_stella_profiles_str = shared_day_inputs["days_stella_profiles_str"]
+    templates = shared_day_inputs["templates"]
+    interpolate_mass_fractions = shared_day_inputs["interpolate_mass_fractions"]
+    skip_nonhomologous_models = shared_day_inputs["skip_nonhomologous_models"]
+    max_nonhomologous_shells = shared_day_inputs["max_nonhomologous_shells"]
+    tau_upper_limit = shared_day_inputs["tau_upper_limit"]
+    tau_lower_limit = shared_day_inputs["tau_lower_limit"]
+    shrink_shell_number = shared_day_inputs["shrink_shell_number"]
+    shrink_shell_weighting = shared_day_inputs["shrink_shell_weighting"]
+    nuclide_table = load_nuclide_table()
+    if interpolate_mass_fractions:
+        mesa_remapper = shared_day_inputs["mesa_remapper"]
+        mesa_isotopes_for_tardis = shared_day_inputs["mesa_isotopes_for_tardis"]
+        composition_columns_profile = shared_day_inputs["composition_columns_profile"]
+
+    with profile_stage("snapshot_read"):
+        # read the stella model, only the columns needed for TARDIS
+        t_max, stella_columns = stella_run.snapshot(
+            days_stella_profiles_str[day_index],
+            columns=STELLA_PARSER_COLUMNS,
+            composition=True,
+        )
+        df_stella_data = pd.DataFrame(stella_columns, copy=True)
+
+    with profile_stage("tau_homology_filter"):
         # shift the center v to boundary v (TARDIS take inner boundary and center density)
         v_inner_edge = (
             df_stella_data["cell_center_v"].values[:-1]
@@ -173,152 +667,187 @@ def parse_stella_models_to_tardis_configs(
                 logger.warning(
                     f"Day {day} has more than {max_nonhomologous_shells} non-homologous shells, skipping the model"
                 )
-                continue
+                return None
             else:
                 # filter out the non homologous shells
-                df_stella_data = df_stella_data.drop(
-                    non_homologous_shell, axis=0
-                ).reset_index(drop=True)
-
-        # check if the user want to shrink the shell number
-        if shrink_shell_number is not False:
-            no_group_shells = int(df_stella_data.shape[0] / shrink_shell_number)
-            df_stella_data = df_stella_data.groupby(
-                np.arange(len(df_stella_data)) // no_group_shells
-            ).mean()
-
-        # filter out the columns that are not needed for TARDIS
-        matter_columns = ["cell_center_v", "avg_density", "radiation_temperature"]
-        composition_columns_stella = [
-            col
-            for col in df_stella_data.columns
-            if col[0].isalpha() and col[-1].isdigit()
-        ]
+                df_stella_data = df_stella_data[
+                    increasing_subsequence_mask(df_stella_data["cell_center_v"].values)
+                ].reset_index(drop=True)
 
-        # interpolate the mass fractions based on MESA profile instead of using STELLA composition
-        if interpolate_mass_fractions:
-            df_stella_for_tardis = df_stella_data[matter_columns].copy()
+    # check if the user want to shrink the shell number
+    composition_columns_stella = [
+        col for col in df_stella_data.columns if col[0].isalpha() and col[-1].isdigit()
+    ]
+    if shrink_shell_number is not False:
+        df_stella_data = rebin_shell_profiles(
+            df_stella_data,
+            regular_bin_starts(df_stella_data.shape[0], shrink_shell_number),
+            weighting=shrink_shell_weighting,
+            composition_columns=composition_columns_stella,
+            velocity_column="cell_center_v",
+            density_column="avg_density",
+            velocity_boundary="inner",
+        )
 
-            # read the mesa profile composition
-            df_profile = pd.read_csv(mesa_profile_file, sep=r"\s+", skiprows=5)
+    # filter out the columns that are not needed for TARDIS
+    matter_columns = ["cell_center_v", "avg_density", "radiation_temperature"]
 
-            # get the isotopes from the composition columns
-            composition_columns_profile = [
-                col
-                for col in df_profile.columns
-                if col[0].isalpha()
-                and col[-1].isdigit()
-                and "_" not in col
-                and col not in ["gamma1", "pnhe4"]
-            ]
-
-            # interpolate the mass fractions from mesa profile onto stella mass grid
-            for isotope in composition_columns_profile:
-                # first get a function that represents the MESA profile mass fraction
-                mesa_mass_grid = (
-                    df_profile["mass"].astype(np.float64).values[::-1]
-                )  # MESA going inwards
-                mesa_mass_fraction = df_profile[isotope].astype(np.float64).values[::-1]
-                f_itp = interpolate.interp1d(
-                    mesa_mass_grid,
-                    mesa_mass_fraction,
-                    kind="linear",
-                    bounds_error=False,
-                    fill_value=(mesa_mass_grid[0], mesa_mass_grid[-1]),
-                )
-
-                # interpolate onto the stella mass grid
-                stella_mass_grid = df_stella_data["cell_center_m"].astype(
-                    np.float64
-                ).values * u.g.to(
-                    u.Msun
-                )  # Stella has unit of g but MESA has units of Msun
-                itp_mass_fraction = f_itp(stella_mass_grid)
-                df_stella_for_tardis.loc[:, isotope[0].capitalize() + isotope[1:]] = (
-                    itp_mass_fraction
-                )
+    # interpolate the mass fractions based on MESA profile instead of using STELLA composition
+    if interpolate_mass_fractions:
+        df_stella_for_tardis = df_stella_data[matter_columns].copy()
+
+        # interpolate the mass fractions of all isotopes from mesa profile onto stella mass grid
+        stella_mass_grid = df_stella_data["cell_center_m"].astype(
+            np.float64
+        ).values * u.g.to(u.Msun)  # Stella has unit of g but MESA has units of Msun
+        df_stella_for_tardis[mesa_isotopes_for_tardis] = mesa_remapper.remap(
+            stella_mass_grid
+        )
 
-            # Stella seems to have na23 which is not in the appro21 net in MESA
-            stella_unique_isotopes = [
-                isotope
-                for isotope in composition_columns_stella
-                if isotope not in composition_columns_profile
-            ]
-            for isotope in stella_unique_isotopes:
-                df_stella_for_tardis.loc[:, isotope[0].capitalize() + isotope[1:]] = (
-                    df_stella_data[isotope]
-                )
-        else:
-            df_stella_for_tardis = df_stella_data[
-                matter_columns + composition_columns_stella
-            ]
-            df_stella_for_tardis = df_stella_for_tardis.rename(
-                columns={
-                    col: col[0].capitalize() + col[1:]
-                    for col in composition_columns_stella
-                }
+        # Stella seems to have na23 which is not in the appro21 net in MESA
+        stella_unique_isotopes = [
+            isotope
+            for isotope in composition_columns_stella
+            if isotope not in composition_columns_profile
+        ]
+        for isotope in stella_unique_isotopes:
+            df_stella_for_tardis.loc[:, nuclide_table.from_lowercase(isotope)] = (
+                df_stella_data[isotope]
             )
-
-        # update the column names
+    else:
+        df_stella_for_tardis = df_stella_data[
+            matter_columns + composition_columns_stella
+        ]
         df_stella_for_tardis = df_stella_for_tardis.rename(
             columns={
-                "cell_center_v": "velocity",
-                "avg_density": "density",
-                "radiation_temperature": "t_rad",
+                col: nuclide_table.from_lowercase(col)
+                for col in composition_columns_stella
             }
-        ).reset_index(drop=True)
-
-        # get the bolometric luminosity at the chosen day
-        L_bol_at_chosen_day = (
-            10 ** df_bol["logL_bol"].values[df_bol["time"].sub(day).abs().idxmin()]
         )
 
-        # extract the time of the data relative to SBO
-        day_since_SBO = stella_model.metadata["t_max"].value - df_bol["time"].min()
-
-        # roughly estimate the photosphere index using tau = 2/3 for initial T_inner
-        ph_idx = df_stella_data.index[df_stella_data["tau"].sub(1).abs().idxmin()]
-        T_inner_guess = df_stella_data.loc[ph_idx, "radiation_temperature"]
-
-        # get the day str that matches the stella output
-        day_str = days_stella_profiles_str[day_index]
-
-        # write the tardis config file
-        modify_parameters = {
-            "supernova": {
-                "luminosity_requested": f"{L_bol_at_chosen_day} erg/s",
-                "time_explosion": f"{day_since_SBO:.4f} day",
-            },
-            "plasma": {"initial_t_inner": f"{T_inner_guess} K"},
+    # update the column names
+    df_stella_for_tardis = df_stella_for_tardis.rename(
+        columns={
+            "cell_center_v": "velocity",
+            "avg_density": "density",
+            "radiation_temperature": "t_rad",
         }
+    ).reset_index(drop=True)
+
+    # get the bolometric luminosity at the chosen day
+    L_bol_at_chosen_day = shared_day_inputs["L_bol_at_days"][day_index]
+
+    # extract the time of the data relative to SBO
+    day_since_SBO = t_max - shared_day_inputs["lbol_start_time"]
+
+    # roughly estimate the photosphere index using tau = 2/3 for initial T_inner
+    ph_idx = df_stella_data.index[df_stella_data["tau"].sub(1).abs().idxmin()]
+    T_inner_guess = df_stella_data.loc[ph_idx, "radiation_temperature"]
+
+    # get the day str that matches the stella output
+    day_str = days_stella_profiles_str[day_index]
+
+    # the tardis config parameters
+    modify_parameters = {
+        "supernova": {
+            "luminosity_requested": f"{L_bol_at_chosen_day} erg/s",
+            "time_explosion": f"{day_since_SBO:.4f} day",
+        },
+        "plasma": {"initial_t_inner": f"{T_inner_guess} K"},
+    }
+
+    # the tardis csvy headers
+    modify_csvy_headers = {
+        "name": "mesa_stella_model.csvy",
+        "model_density_time_0": f"{day_since_SBO:.4f} day",
+        "model_isotope_time_0": "0.0 s",
+        "description": "mesa stella model converted to csvy format for tardis simulation",
+        "v_inner_boundary": f"{df_stella_for_tardis['velocity'].min():.5e} cm/s",
+    }
+    return templates.epoch_model(
+        modify_csvy_headers,
+        df_stella_for_tardis,
+        modify_parameters,
+        csvy_file_name=f"Day_{day_str}_mesa_stella_model.csvy",
+        config_file_name=f"Day_{day_str}_mesa_stella_tardis.yml",
+    )
 
-        write_tardis_config(
-            tardis_sample_config_path,
-            modify_parameters,
-            output_config_path=tardis_config_output_folder_path
-            / f"Day_{day_str}_mesa_stella_tardis.yml",
-            csvy_model_path=f"Day_{day_str}_mesa_stella_model.csvy",
-        )
 
-        # write the tardis csvy file
-        modify_csvy_headers = {
-            "name": "mesa_stella_model.csvy",
-            "model_density_time_0": f"{day_since_SBO:.4f} day",
-            "model_isotope_time_0": "0.0 s",
-            "description": "mesa stella model converted to csvy format for tardis simulation",
-            "v_inner_boundary": f"{df_stella_for_tardis['velocity'].min():.5e} cm/s",
-        }
-        write_tardis_csvy(
-            tardis_sample_csvy_path,
-            modify_csvy_headers,
-            df_stella_for_tardis,
-            output_csvy_path=tardis_config_output_folder_path
-            / f"Day_{day_str}_mesa_stella_model.csvy",
+def convert_days_in_parallel(
+    days, shared_day_inputs, n_workers, day_done_callback=None
+):
+    """
+    Purpose:
+    Convert several stella days over a process pool. The shared inputs (the MESA
+    composition remapper, the Lbol table and the templates) are handed to the workers once,
+    inherited when the workers are forked, otherwise sent to each worker at start up.
+    -------------------
+    days: list, (day_index, day) of each day to convert
+    shared_day_inputs: dict, the inputs shared by all the days, see convert_stella_day
+    n_workers: int, the number of worker processes
+    day_done_callback: callable or None, called with (day_str, status) in this process after each day, e.g. to record it in the conversion manifest
+    -------------------
+
+    Returns
+    -------------------
+    list of (day_str, status, error or None) in the order of the days
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        # the forked workers inherit the module level inputs without pickling
+        _DAY_WORKER_INPUTS.update(shared_day_inputs)
+        executor = ProcessPoolExecutor(
+            n_workers, mp_context=multiprocessing.get_context("fork")
         )
-        logger.info(
-            f"Day {day_str} model converted to TARDIS config and csvy format, {tardis_config_output_folder_path.name}/Day_{day_str}_mesa_stella_model.csvy and .yml"
+    else:
+        executor = ProcessPoolExecutor(
+            n_workers,
+            initializer=_init_day_worker,
+            initargs=(shared_day_inputs,),
         )
 
+    try:
+        with executor:
+            day_indices, day_values = zip(*days)
+            day_results = []
+            for day_result, stage_records in executor.map(
+                _convert_day_in_worker, day_indices, day_values
+            ):
+                merge_stage_records(stage_records)
+                if day_done_callback is not None:
+                    day_done_callback(*day_result[:2])
+                day_results.append(day_result)
+            return day_results
+    finally:
+        _DAY_WORKER_INPUTS.clear()
+
+
+def summarize_day_results(day_results):
+    """
+    Purpose:
+    Log a summary of the converted, skipped, up to date and failed days
+    -------------------
+    day_results: list, (day_str, status, error or None) of each day
+    -------------------
+
+    Returns
+    -------------------
+    dict with the "converted", "skipped" and "up_to_date" day strings and the "failed" day strings mapped to their error
+    """
+    summary = {"converted": [], "skipped": [], "up_to_date": [], "failed": {}}
+    for day_str, status, error in day_results:
+        if status == "failed":
+            summary["failed"][day_str] = error
+            logger.error(f"Day {day_str} failed to convert: {error}")
+        else:
+            summary[status].append(day_str)
+
+    logger.info(
+        f"{len(summary['converted'])} days converted, {len(summary['skipped'])} skipped, {len(summary['up_to_date'])} up to date, {len(summary['failed'])} failed"
+    )
+    if len(summary["failed"]) > 0:
+        logger.error(f"Failed days: {', '.join(summary['failed'])}")
+    return summary
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=LOGGING_LEVEL)
@@ -0,0 +1,313 @@
+import collections
+import glob
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STELLA_METADATA_ROWS = 4  # days post max Lbol, zones, inner boundary mass, total mass
+STELLA_HEADER_ROW = 5  # the column names, the zone data follows after a blank line
+STELLA_PARSER_COLUMNS = [
+    "cell_center_m",
+    "cell_center_v",
+    "avg_density",
+    "radiation_temperature",
+    "tau",
+]
+
+
+def stella_column_names(header_line):
+    """
+    Purpose:
+    Convert the column header of a STELLA mesa.day* file to the column names used by
+    tardis.io.model.read_stella_model, e.g. "cell center v (cm/s)" -> "cell_center_v"
+    -------------------
+    header_line: str, the column header line of the file
+    -------------------
+
+    Returns
+    -------------------
+    list of the column names, in the order of the file
+    """
+    column_names = re.split(r"\s{2,}", header_line.strip())
+    return [
+        re.sub(r"\s*\(.*\)", "", column_name).replace(" ", "_")
+        for column_name in column_names
+    ]
+
+
+def is_stella_composition_column(column_name):
+    """The composition columns of a STELLA snapshot are the isotopes, e.g. h1, ni56"""
+    return column_name[0].isalpha() and column_name[-1].isdigit()
+
+
+def read_stella_columns(fname, columns=STELLA_PARSER_COLUMNS, composition=True):
+    """
+    Purpose:
+    Read only the needed columns of a STELLA mesa.day* snapshot straight into numpy
+    arrays, instead of the full DataFrame and metadata of read_stella_model. The values
+    are parsed the same way as read_stella_model, so they are identical.
+    -------------------
+    fname: str, path to the mesa.day* file
+    columns: list or None, the column names to read, default STELLA_PARSER_COLUMNS (what
+        the stella_to_tardis_parser needs), None for all the columns
+    composition: boolean, if True then also read all the composition columns
+    -------------------
+
+    Returns
+    -------------------
+    t_max: float, the days post max Lbol of the snapshot (metadata["t_max"] in read_stella_model)
+    stella_columns: dict, column name -> float64 numpy array of shape (zones,), in the
+        order of the file
+    """
+    with open(fname) as rf:
+        t_max, n_zones, column_names = _read_stella_header(rf)
+        if columns is None:
+            columns = column_names
+
+        missing_columns = [col for col in columns if col not in column_names]
+        if len(missing_columns) > 0:
+            raise KeyError(f"Columns {missing_columns} not found in {fname}")
+        read_columns = [
+            col
+            for col in column_names
+            if col in columns or (composition and is_stella_composition_column(col))
+        ]
+
+        # continue from the end of the header, the first column of the zone data is
+        # the zone number, which has no header
+        df_columns = pd.read_csv(
+            rf,
+            sep=r"\s+",
+            header=None,
+            usecols=[column_names.index(col) + 1 for col in read_columns],
+            dtype=np.float64,
+            na_filter=False,
+        )
+    if df_columns.shape[0] != n_zones:
+        raise ValueError(
+            f"{fname} has {df_columns.shape[0]} zones but its header says {n_zones}"
+        )
+
+    stella_columns = {
+        col: df_columns[column_names.index(col) + 1].to_numpy(dtype=np.float64)
+        for col in read_columns
+    }
+    return t_max, stella_columns
+
+
+def read_stella_column_names(fname):
+    """The column names of a STELLA mesa.day* snapshot, in the order of the file"""
+    with open(fname) as rf:
+        return _read_stella_header(rf)[2]
+
+
+def _read_stella_header(rf):
+    """Read the header of an open mesa.day* file, returns t_max, the number of zones and
+    the column names, and leaves rf at the end of the header"""
+    header_lines = [rf.readline() for _ in range(STELLA_HEADER_ROW + 1)]
+    t_max = float(header_lines[0].split()[-1])
+    n_zones = int(header_lines[1].split()[-1])
+    return t_max, n_zones, stella_column_names(header_lines[STELLA_HEADER_ROW])
+
+
+def stella_day_str(stella_output_file):
+    """The day string of a STELLA snapshot file, e.g. res/mesa.day013_post_Lbol_max.data -> 013"""
+    return str(stella_output_file).split("/")[-1].split("_")[0].split("day")[1]
+
+
+class StellaRun:
+    """
+    Purpose:
+    Catalog of the products in the res folder of a STELLA run. The days of the
+    mesa.day* snapshots are indexed once, the mesa.lbol_lnuc.txt and mesa.lbol tables
+    are read once when first used, and the snapshots are read lazily and kept in an
+    LRU cache, so converting and plotting the same run do not repeat the I/O. Only the
+    requested columns of a snapshot are read, the columns requested later are read and
+    added to its cached columns.
+    A StellaRun can be passed instead of the folder path to
+    stella_to_tardis_parser.parse_stella_models_to_tardis_configs and the plotting
+    functions of stella_to_tardis_diagnose.
+    -------------------
+    stella_folder_path: str or Path, folder path to the stella model, with the res folder
+    snapshot_cache_size: int, default 32, the number of snapshots kept in memory
+    """
+
+    def __init__(self, stella_folder_path, snapshot_cache_size=32):
+        self.stella_folder_path = Path(stella_folder_path)
+        self.snapshot_cache_size = snapshot_cache_size
+        self.snapshot_files = sorted(
+            glob.glob(f"{self.stella_folder_path}/res/mesa.day*")
+        )
+        self.days_str = [stella_day_str(file) for file in self.snapshot_files]
+        self.days = np.array([float(day_str) for day_str in self.days_str])
+        self._snapshot_file_by_day_str = dict(zip(self.days_str, self.snapshot_files))
+        self._init_cache()
+
+    def _init_cache(self):
+        # day string -> the cached columns of the snapshot, the least recently used first
+        self._snapshots = collections.OrderedDict()
+        self._tables = {}
+
+    def __getstate__(self):
+        # the cached tables and snapshots are not sent to other processes
+        state = self.__dict__.copy()
+        del state["_snapshots"]
+        del state["_tables"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    @property
+    def lbol_lnuc_file(self):
+        return self.stella_folder_path / "res" / "mesa.lbol_lnuc.txt"
+
+    @property
+    def lbol_file(self):
+        return self.stella_folder_path / "res" / "mesa.lbol"
+
+    @property
+    def lbol_lnuc(self):
+        """The mesa.lbol_lnuc.txt table (time, logL_bol, logL_nuc) with the L_nuc_ratio column"""
+        if "lbol_lnuc" not in self._tables:
+            df_bol = pd.read_csv(
+                self.lbol_lnuc_file,
+                sep=r"\s+",
+                skiprows=1,
+                header=None,
+                names=["time", "logL_bol", "logL_nuc"],
+            )
+            df_bol["L_nuc_ratio"] = 10 ** (df_bol["logL_nuc"] - df_bol["logL_bol"])
+            self._tables["lbol_lnuc"] = df_bol
+        return self._tables["lbol_lnuc"]
+
+    @property
+    def lbol(self):
+        """The mesa.lbol table, with the UBVRI and bolometric luminosities"""
+        if "lbol" not in self._tables:
+            self._tables["lbol"] = pd.read_csv(self.lbol_file, sep=r"\s+")
+        return self._tables["lbol"]
+
+    def nearest_lbol_lnuc_index(self, times):
+        """
+        Purpose:
+        The row index of the mesa.lbol_lnuc.txt table closest in time to each of the
+        times, the same as df_bol["time"].sub(time).abs().idxmin() for every time but
+        with one sorted lookup for all of them
+        -------------------
+        times: float or array-like, days post max Lbol
+        -------------------
+
+        Returns
+        -------------------
+        int or int array
+        """
+        if "lbol_lnuc_lookup" not in self._tables:
+            self._tables["lbol_lnuc_lookup"] = _NearestTimeLookup(
+                self.lbol_lnuc["time"].values
+            )
+        return self._tables["lbol_lnuc_lookup"](times)
+
+    def max_photospheric_day(self, l_nuc_ratio_upper_limit):
+        """The last time in mesa.lbol_lnuc.txt with L_nuc/L_bol <= l_nuc_ratio_upper_limit"""
+        df_bol = self.lbol_lnuc
+        return df_bol["time"].values[
+            df_bol["L_nuc_ratio"].values <= l_nuc_ratio_upper_limit
+        ][-1]
+
+    def snapshot_file(self, day_str):
+        return self._snapshot_file_by_day_str[day_str]
+
+    def snapshot(self, day_str, columns=None, composition=False):
+        """
+        Purpose:
+        The columns of the snapshot of a day. Only the columns that are not cached yet are
+        read with read_stella_columns, the others are served from the LRU cache
+        -------------------
+        day_str: str, the day string of the snapshot, see days_str
+        columns: list or None, the columns to return, None for all of them
+        composition: boolean, if True then also return all the composition columns
+        -------------------
+
+        Returns
+        -------------------
+        t_max: float, the days post max Lbol of the snapshot
+        stella_columns: dict, column name -> float64 numpy array, in the order of the file.
+            The arrays are shared with the cache and must not be modified in place
+        """
+        snapshot = self._snapshots.get(day_str)
+        if snapshot is None:
+            snapshot = {
+                "t_max": None,
+                "column_names": read_stella_column_names(self.snapshot_file(day_str)),
+                "columns": {},
+                "composition": False,
+            }
+        column_names = snapshot["column_names"]
+        if columns is None:
+            columns = column_names
+            composition = False
+        missing_columns = [col for col in columns if col not in snapshot["columns"]]
+        read_composition = composition and not snapshot["composition"]
+        if len(missing_columns) > 0 or read_composition:
+            t_max, stella_columns = read_stella_columns(
+                self.snapshot_file(day_str),
+                columns=missing_columns,
+                composition=read_composition,
+            )
+            snapshot["t_max"] = t_max
+            snapshot["columns"].update(stella_columns)
+            snapshot["composition"] = snapshot["composition"] or read_composition
+
+        # the cache keeps the snapshot_cache_size most recently used snapshots
+        self._snapshots[day_str] = snapshot
+        self._snapshots.move_to_end(day_str)
+        while len(self._snapshots) > self.snapshot_cache_size:
+            self._snapshots.popitem(last=False)
+
+        stella_columns = {
+            col: snapshot["columns"][col]
+            for col in column_names
+            if col in columns or (composition and is_stella_composition_column(col))
+        }
+        return snapshot["t_max"], stella_columns
+
+
+class _NearestTimeLookup:
+    """Nearest-time index lookup over a fixed time column, sorted once. Ties go to the
+    smaller row index, as in pd.Series.idxmin"""
+
+    def __init__(self, times):
+        times = np.asarray(times, dtype=np.float64)
+        self.order = np.argsort(times, kind="stable")
+        self.sorted_times = times[self.order]
+        # the first row of each run of equal times
+        self.first_equal = self.order[
+            np.searchsorted(self.sorted_times, self.sorted_times, side="left")
+        ]
+
+    def __call__(self, times):
+        times = np.asarray(times, dtype=np.float64)
+        n = self.sorted_times.size
+        upper = np.clip(
+            np.searchsorted(self.sorted_times, times, side="left"), 0, n - 1
+        )
+        lower = np.clip(upper - 1, 0, n - 1)
+        upper_distance = np.abs(self.sorted_times[upper] - times)
+        lower_distance = np.abs(self.sorted_times[lower] - times)
+        upper_index = self.first_equal[upper]
+        lower_index = self.first_equal[lower]
+        use_lower = (lower_distance < upper_distance) | (
+            (lower_distance == upper_distance) & (lower_index < upper_index)
+        )
+        return np.where(use_lower, lower_index, upper_index)
+
+
+def as_stella_run(stella_folder_path):
+    """Return the StellaRun of a folder, or the StellaRun itself if one is given"""
+    if isinstance(stella_folder_path, StellaRun):
+        return stella_folder_path
+    return StellaRun(stella_folder_path)
@@ -1,21 +1,145 @@
-import yaml
+import copy
+import functools
+import io
+import logging
+import os
+
+import astropy.units as u
+from astropy import constants as const
+import numpy as np
 import pandas as pd
+import yaml
 
-from tardis.util.base import is_valid_nuclide_or_elem
+from nuclide_table import load_nuclide_table
+from stage_profiler import profiled
 
+import tardis
+from tardis.workflows.simple_tardis_workflow import SimpleTARDISWorkflow
 from tardis.workflows.v_inner_solver import InnerVelocitySolverWorkflow
 from tardis.io.configuration.config_reader import Configuration
+from tardis.io.configuration.config_validator import validate_dict
+from tardis.io.model.parse_atom_data import parse_atom_data
+from tardis.io.model.parse_composition_configuration import parse_composition_from_csvy
+from tardis.io.model.parse_geometry_configuration import parse_geometry_from_csvy
+from tardis.io.model.parse_packet_source_configuration import parse_packet_source_from_config
+from tardis.io.model.parse_radiation_field_configuration import (
+    parse_radiation_field_state_from_csvy,
+)
+from tardis.io.util import YAMLLoader
+from tardis.model import SimulationState
+from tardis.plasma.assembly import PlasmaSolverFactory
+from tardis.simulation.convergence import ConvergenceSolver
+from tardis.spectrum.base import SpectrumSolver
+from tardis.transport.montecarlo.base import MonteCarloTransportSolver
 
+logger = logging.getLogger(__name__)
 
-def run_tardis_from_yml(yml_file_path, spec_output_file, n_threads=1):
+# the schema that SimulationState.from_csvy validates the csvy headers with
+CSVY_MODEL_SCHEMA_PATH = os.path.join(
+    os.path.dirname(tardis.__file__), "io", "configuration", "schemas", "csvy_model.yml"
+)
+
+
+def run_tardis_from_yml(yml_file_path, spec_output_file, n_threads=1, atom_data=None):
     # read in comfig from yml file
     config = Configuration.from_yaml(yml_file_path)
+    return run_tardis_workflow(config, spec_output_file, n_threads=n_threads, atom_data=atom_data)
+
+
+def run_tardis_epoch(
+    epoch_model,
+    spec_output_file,
+    n_threads=1,
+    csvy_model_path=None,
+    atom_data=None,
+    warm_start=None,
+):
+    """
+    Purpose:
+    ---------
+    Run TARDIS on a TardisEpochModel, without writing and re-reading its config yml file
+    and csvy model file: the workflow is set up on the inputs in memory, see
+    InMemoryInnerVelocitySolverWorkflow. Writing the csvy model file is optional.
+    With warm_start, the run starts from the converged state of the previous epoch of the
+    time series instead of the initial_t_inner and t_rad of the model, see TardisWarmStart.
+
+    ----------
+    Parameters:
+        epoch_model: TardisEpochModel
+        spec_output_file: str
+            The path to save the spectrum csv
+        n_threads: int
+            The number of montecarlo threads
+        csvy_model_path: str or None
+            If given, the csvy model is also written to (and kept at) this path
+        atom_data: tardis AtomData or None
+            Preloaded atomic data for this run only, see inner_velocity_solver_workflow
+        warm_start: TardisWarmStart or None
+            The converged state of the previous epoch, None to start from the model
+
+    ----------
+    Returns:
+        TardisWarmStart, the converged state of this epoch
+    """
+    if warm_start is not None:
+        epoch_model = warm_start.seed(epoch_model)
+    if csvy_model_path is not None:
+        epoch_model.write_csvy(csvy_model_path)
+
+    config, csvy_model_config, csvy_model_data = epoch_model.tardis_inputs(
+        csvy_model_path=csvy_model_path
+    )
+    return run_tardis_workflow(
+        config,
+        spec_output_file,
+        n_threads=n_threads,
+        atom_data=atom_data,
+        warm_start=warm_start,
+        csvy_model=(csvy_model_config, csvy_model_data),
+    )
+
+
+def run_tardis_workflow(
+    config,
+    spec_output_file,
+    n_threads=1,
+    atom_data=None,
+    warm_start=None,
+    csvy_model=None,
+):
+    """
+    Purpose:
+    ---------
+    Run the v_inner workflow of TARDIS on a Configuration with a csvy model and save the
+    formal integral spectrum to spec_output_file.
+
+    ----------
+    Parameters:
+        config: tardis.io.configuration.config_reader.Configuration
+        spec_output_file: str or None
+            The path to save the spectrum csv, None to only return the spectrum
+        n_threads: int
+            The number of montecarlo threads
+        atom_data: tardis AtomData or None
+            Preloaded atomic data for this run only, see inner_velocity_solver_workflow
+        warm_start: TardisWarmStart or None
+            If given, the v_inner solver starts from its inner boundary velocity instead
+            of the estimate from the initial optical depths. The temperatures are seeded
+            through the model and config, see TardisWarmStart.seed
+        csvy_model: tuple or None
+            The csvy headers and model table in memory (TardisEpochModel.tardis_csvy_model),
+            None to read the csvy_model file of the config
+
+    ----------
+    Returns:
+        TardisWarmStart, the converged state and the spectrum of the run
+    """
     config.montecarlo.nthreads = n_threads
 
     # run the v_inner workflow
-    workflow = InnerVelocitySolverWorkflow(
-        config, tau=2.0 / 3, mean_optical_depth="rosseland", csvy=True
-    )
+    workflow = inner_velocity_solver_workflow(config, atom_data=atom_data, csvy_model=csvy_model)
+    if warm_start is not None:
+        warm_start.seed_workflow(workflow)
     workflow.run()
 
     # save the spectrum
@@ -28,16 +152,948 @@ def run_tardis_from_yml(yml_file_path, spec_output_file, n_threads=1):
         ::-1
     ]  # in Angstrom , [::-1] to make it in increasing order in wavelength
     lum_dens = spectrum.luminosity_density_lambda.value[::-1]  # in erg/s/Angstrom/cm^2
-    pd.DataFrame({"wavelength": wavelength, "luminosity_density": lum_dens}).to_csv(
-        spec_output_file, index=False
+    if spec_output_file is not None:
+        pd.DataFrame({"wavelength": wavelength, "luminosity_density": lum_dens}).to_csv(
+            spec_output_file, index=False
+        )
+    return TardisWarmStart.from_workflow(
+        workflow, config, wavelength=wavelength, luminosity_density=lum_dens
+    )
+
+
+def inner_velocity_solver_workflow(config, atom_data=None, csvy_model=None):
+    """
+    Purpose:
+    ---------
+    Set up the v_inner workflow of TARDIS on a Configuration with a csvy model.
+
+    ----------
+    Parameters:
+        config: tardis.io.configuration.config_reader.Configuration
+        atom_data: tardis AtomData or None
+            Preloaded atomic data of the config for this run only, None to read the atomic
+            data file. The plasma of the run prepares (modifies) its atomic data, see
+            atom_data_for_run to run on preloaded atomic data more than once
+        csvy_model: tuple or None
+            The csvy headers and model table in memory (TardisEpochModel.tardis_csvy_model),
+            None to read the csvy_model file of the config
+
+    ----------
+    Returns:
+        InMemoryInnerVelocitySolverWorkflow
+    """
+    if atom_data is None:
+        atom_data = parse_atom_data(config)
+    if csvy_model is None:
+        simulation_state = SimulationState.from_csvy(config, atom_data=atom_data)
+    else:
+        simulation_state = simulation_state_from_csvy_model(config, *csvy_model, atom_data)
+    return InMemoryInnerVelocitySolverWorkflow(
+        config, simulation_state, atom_data, tau=2.0 / 3, mean_optical_depth="rosseland"
+    )
+
+
+def atom_data_for_run(atom_data):
+    """
+    Purpose:
+    ---------
+    A copy of preloaded atomic data for one run, e.g. of the atomic data that a worker
+    loads once (batch_run_tardis). The plasma of a run prepares its atomic data: it
+    selects the lines, levels and macro atom data of the elements of the model and sets
+    them as attributes of the AtomData, which can be prepared only once. The copy is a new
+    AtomData with shallow copies of the tables, which share their values with atom_data,
+    so only the attributes are copied and not the tables of the whole atomic data file.
+
+    ----------
+    Parameters:
+        atom_data: tardis AtomData
+            Atomic data that no plasma has prepared
+
+    ----------
+    Returns:
+        tardis AtomData
+    """
+    run_atom_data = copy.copy(atom_data)
+    for name, value in vars(atom_data).items():
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            setattr(run_atom_data, name, value.copy(deep=False))
+    return run_atom_data
+
+
+def simulation_state_from_csvy_model(config, csvy_model_config, csvy_model_data, atom_data):
+    """
+    Purpose:
+    ---------
+    Build the TARDIS SimulationState of a csvy model in memory, the same way as
+    SimulationState.from_csvy builds it from the csvy_model file of a Configuration: the
+    csvy headers are validated against the csvy schema of TARDIS, then the geometry,
+    composition, packet source and radiation field are parsed from the headers and the
+    model table.
+
+    ----------
+    Parameters:
+        config: tardis.io.configuration.config_reader.Configuration
+        csvy_model_config: dict
+            The csvy headers, see TardisEpochModel.tardis_csvy_model
+        csvy_model_data: dataframe
+            The model table
+        atom_data: tardis AtomData
+
+    ----------
+    Returns:
+        tardis.model.SimulationState
+    """
+    csvy_model_config = Configuration(
+        validate_dict(csvy_model_config, schemapath=CSVY_MODEL_SCHEMA_PATH)
+    )
+    time_explosion = config.supernova.time_explosion.cgs
+    geometry = parse_geometry_from_csvy(config, csvy_model_config, csvy_model_data, time_explosion)
+    composition = parse_composition_from_csvy(
+        atom_data, csvy_model_config, csvy_model_data, time_explosion, geometry
+    )
+    packet_source = parse_packet_source_from_config(config, geometry, legacy_mode_enabled=False)
+    radiation_field_state = parse_radiation_field_state_from_csvy(
+        config, csvy_model_config, csvy_model_data, geometry, packet_source
+    )
+    return SimulationState(
+        geometry=geometry,
+        composition=composition,
+        radiation_field_state=radiation_field_state,
+        time_explosion=time_explosion,
+        packet_source=packet_source,
+        electron_densities=None,
+    )
+
+
+class InMemoryInnerVelocitySolverWorkflow(InnerVelocitySolverWorkflow):
+    """
+    Purpose:
+    ---------
+    The v_inner workflow of TARDIS set up on a SimulationState and atomic data that are
+    passed in, in place of the csvy model file and the atomic data file that
+    InnerVelocitySolverWorkflow reads when it is set up. The setup is the one of
+    SimpleTARDISWorkflow and InnerVelocitySolverWorkflow in the TARDIS release of
+    containers/tardis.dockerfile without the two readers, the run is the one of TARDIS:
+
+        config, csvy_model_config, model_table = epoch_model.tardis_inputs()
+        workflow = InMemoryInnerVelocitySolverWorkflow.from_csvy_model(
+            config, csvy_model_config, model_table, atom_data=atom_data
+        )
+        workflow.run()
+
+    ----------
+    Parameters:
+        configuration: tardis.io.configuration.config_reader.Configuration
+        simulation_state: tardis.model.SimulationState
+        atom_data: tardis AtomData
+            The atomic data of simulation_state, which the plasma of the run prepares
+            (modifies), so it is not shared with other runs
+        tau: float
+            The optical depth at the inner boundary that the v_inner solver converges to
+        mean_optical_depth: str
+            The mean opacity of the optical depth, "rosseland" or "planck"
+    """
+
+    def __init__(
+        self,
+        configuration,
+        simulation_state,
+        atom_data,
+        tau=2.0 / 3,
+        mean_optical_depth="rosseland",
+    ):
+        # the logging setup of the workflows, above the setup of SimpleTARDISWorkflow
+        super(SimpleTARDISWorkflow, self).__init__(
+            configuration, self.log_level, self.specific_log_level
+        )
+        self.simulation_state = simulation_state
+
+        plasma_solver_factory = PlasmaSolverFactory(atom_data, configuration)
+        plasma_solver_factory.prepare_factory(
+            simulation_state.abundance.index,
+            "tardis.plasma.properties.property_collections",
+            configuration,
+        )
+        self.plasma_solver = plasma_solver_factory.assemble(
+            simulation_state.calculate_elemental_number_density(atom_data.atom_data.mass),
+            simulation_state.radiation_field_state,
+            simulation_state.time_explosion,
+            simulation_state._electron_densities,
+        )
+        self.transport_solver = MonteCarloTransportSolver.from_config(
+            configuration,
+            packet_source=simulation_state.packet_source,
+            enable_virtual_packet_logging=self.enable_virtual_packet_logging,
+        )
+
+        # luminosity filter frequencies
+        supernova = configuration.supernova
+        self.luminosity_nu_start = supernova.luminosity_wavelength_end.to(u.Hz, u.spectral())
+        if u.isclose(supernova.luminosity_wavelength_start, 0 * u.angstrom):
+            self.luminosity_nu_end = np.inf * u.Hz
+        else:
+            self.luminosity_nu_end = (const.c / supernova.luminosity_wavelength_start).to(u.Hz)
+
+        # montecarlo and spectrum settings
+        montecarlo = configuration.montecarlo
+        self.total_iterations = int(montecarlo.iterations)
+        self.real_packet_count = int(montecarlo.no_of_packets)
+        final_iteration_packet_count = montecarlo.last_no_of_packets
+        if final_iteration_packet_count is None or final_iteration_packet_count < 0:
+            final_iteration_packet_count = self.real_packet_count
+        self.final_iteration_packet_count = int(final_iteration_packet_count)
+        self.virtual_packet_count = int(montecarlo.no_of_virtual_packets)
+        self.integrated_spectrum_settings = configuration.spectrum.integrated
+        self.spectrum_solver = SpectrumSolver.from_config(configuration)
+
+        # convergence settings and solvers
+        self.consecutive_converges_count = 0
+        self.converged = False
+        self.completed_iterations = 0
+        self.luminosity_requested = supernova.luminosity_requested.cgs
+        self.convergence_strategy = montecarlo.convergence_strategy
+        self.convergence_solvers = {
+            "t_radiative": ConvergenceSolver(self.convergence_strategy.t_rad),
+            "dilution_factor": ConvergenceSolver(self.convergence_strategy.w),
+            "t_inner": ConvergenceSolver(self.convergence_strategy.t_inner),
+            "v_inner_boundary": ConvergenceSolver(self.convergence_strategy.v_inner_boundary),
+        }
+
+        # start the v_inner solver from the estimate of the initial optical depths
+        self.mean_optical_depth = mean_optical_depth.lower()
+        self.TAU_TARGET = np.log(tau)
+        self.simulation_state.geometry.v_inner_boundary = self.estimate_v_inner()
+        self.simulation_state.blackbody_packet_source.radius = self.simulation_state.r_inner[0]
+
+    @classmethod
+    def from_csvy_model(
+        cls, configuration, csvy_model_config, csvy_model_data, atom_data=None, **kwargs
+    ):
+        """
+        Purpose:
+        ---------
+        Set up the workflow on a Configuration and a csvy model in memory, e.g. the
+        TardisEpochModel.tardis_inputs of an epoch.
+
+        ----------
+        Parameters:
+            configuration: tardis.io.configuration.config_reader.Configuration
+            csvy_model_config: dict
+                The csvy headers
+            csvy_model_data: dataframe
+                The model table
+            atom_data: tardis AtomData or None
+                The atomic data of the run (not shared with other runs), None to read the
+                atomic data file of the configuration
+            **kwargs: tau and mean_optical_depth, see InMemoryInnerVelocitySolverWorkflow
+
+        ----------
+        Returns:
+            InMemoryInnerVelocitySolverWorkflow
+        """
+        if atom_data is None:
+            atom_data = parse_atom_data(configuration)
+        simulation_state = simulation_state_from_csvy_model(
+            configuration, csvy_model_config, csvy_model_data, atom_data
+        )
+        return cls(configuration, simulation_state, atom_data, **kwargs)
+
+
+class TardisWarmStart:
+    """
+    Purpose:
+    ---------
+    The converged state of a TARDIS run, used to warm start the run of the next epoch of a
+    time series instead of starting from the initial_t_inner and t_rad of its model, so the
+    v_inner solver and the temperatures start close to convergence.
+
+    The ejecta expand homologously, so the state is kept in velocity space. Between
+    epochs, the inner boundary velocity and the dilution factors (which only depend on the
+    ratios of the radii) carry over unchanged, and the temperatures are scaled with the
+    Stefan-Boltzmann law at the inner boundary, T ~ (L_requested / r_inner^2)^(1/4) with
+    r_inner = v_inner * time_explosion, see scaled_to.
+
+    ----------
+    Parameters:
+        time_explosion: float
+            The time of the epoch, in s
+        luminosity_requested: float
+            The requested luminosity of the epoch, in erg/s
+        t_inner: float
+            The converged inner boundary temperature, in K
+        v_inner_boundary: float
+            The converged inner boundary velocity, in cm/s
+        shell_velocity: array
+            The middle velocities of the shells above the inner boundary, in cm/s
+        t_rad: array
+            The converged radiative temperatures of the shells, in K
+        dilution_factor: array
+            The converged dilution factors of the shells
+        iterations: int or None
+            The number of iterations the run took to converge
+        wavelength, luminosity_density: array or None
+            The spectrum of the run, in Angstrom and erg/s/Angstrom
+    """
+
+    def __init__(
+        self,
+        time_explosion,
+        luminosity_requested,
+        t_inner,
+        v_inner_boundary,
+        shell_velocity,
+        t_rad,
+        dilution_factor,
+        iterations=None,
+        wavelength=None,
+        luminosity_density=None,
+    ):
+        self.time_explosion = time_explosion
+        self.luminosity_requested = luminosity_requested
+        self.t_inner = t_inner
+        self.v_inner_boundary = v_inner_boundary
+        self.shell_velocity = np.asarray(shell_velocity, dtype=np.float64)
+        self.t_rad = np.asarray(t_rad, dtype=np.float64)
+        self.dilution_factor = np.asarray(dilution_factor, dtype=np.float64)
+        self.iterations = iterations
+        self.wavelength = wavelength
+        self.luminosity_density = luminosity_density
+
+    @classmethod
+    def from_workflow(cls, workflow, config, wavelength=None, luminosity_density=None):
+        """The converged state of a v_inner workflow that has run and its spectrum, see
+        run_tardis_workflow"""
+        simulation_state = workflow.simulation_state
+        v_inner = simulation_state.v_inner.to(u.cm / u.s).value
+        v_outer = simulation_state.v_outer.to(u.cm / u.s).value
+        return cls(
+            time_explosion=simulation_state.time_explosion.to(u.s).value,
+            luminosity_requested=quantity_value(config.supernova.luminosity_requested, u.erg / u.s),
+            t_inner=simulation_state.t_inner.to(u.K).value,
+            v_inner_boundary=v_inner[0],
+            shell_velocity=0.5 * (v_inner + v_outer),
+            t_rad=simulation_state.t_radiative.to(u.K).value,
+            dilution_factor=np.asarray(simulation_state.dilution_factor),
+            iterations=getattr(workflow, "completed_iterations", None),
+            wavelength=wavelength,
+            luminosity_density=luminosity_density,
+        )
+
+    def scaled_to(self, time_explosion, luminosity_requested):
+        """
+        Purpose:
+        ---------
+        The state scaled homologously to another epoch: the velocities and dilution
+        factors are kept, and the temperatures are multiplied by
+        (L_new / L) ** (1 / 4) * (t / t_new) ** (1 / 2).
+
+        ----------
+        Parameters:
+            time_explosion: float
+                The time of the new epoch, in s
+            luminosity_requested: float
+                The requested luminosity of the new epoch, in erg/s
+
+        ----------
+        Returns:
+            TardisWarmStart
+        """
+        temperature_scale = (luminosity_requested / self.luminosity_requested) ** 0.25 * (
+            self.time_explosion / time_explosion
+        ) ** 0.5
+        return TardisWarmStart(
+            time_explosion,
+            luminosity_requested,
+            self.t_inner * temperature_scale,
+            self.v_inner_boundary,
+            self.shell_velocity,
+            self.t_rad * temperature_scale,
+            self.dilution_factor,
+            iterations=self.iterations,
+        )
+
+    def seed(self, epoch_model):
+        """
+        Purpose:
+        ---------
+        The TardisEpochModel of the next epoch, with the state scaled to its time and
+        luminosity as the starting point: initial_t_inner in the config, and the t_rad and
+        dilution_factor profiles of the model interpolated in velocity. The shells outside
+        the velocities of this state take the values of its innermost or outermost shell.
+
+        ----------
+        Parameters:
+            epoch_model: TardisEpochModel
+
+        ----------
+        Returns:
+            TardisEpochModel, a seeded copy of epoch_model
+        """
+        config = copy.deepcopy(epoch_model.config)
+        warm_start = self.scaled_to(
+            quantity_value(config["supernova"]["time_explosion"], u.s),
+            quantity_value(config["supernova"]["luminosity_requested"], u.erg / u.s),
+        )
+        config["plasma"]["initial_t_inner"] = f"{warm_start.t_inner} K"
+
+        # the csvy velocities are the outer velocities of the shells, the first row is the
+        # inner boundary of the model
+        df_csv = epoch_model.df_csv.copy()
+        velocity = df_csv["velocity"].to_numpy(dtype=np.float64)
+        shell_velocity = np.concatenate([velocity[:1], 0.5 * (velocity[:-1] + velocity[1:])])
+        df_csv["t_rad"] = np.interp(shell_velocity, warm_start.shell_velocity, warm_start.t_rad)
+        df_csv["dilution_factor"] = np.interp(
+            shell_velocity, warm_start.shell_velocity, warm_start.dilution_factor
+        )
+
+        csvy_headers = copy.deepcopy(epoch_model.csvy_headers)
+        csvy_headers["datatype"] = {"fields": get_fields_names(df_csv.columns.to_list())}
+        return TardisEpochModel(
+            epoch_model.csvy_file_name,
+            epoch_model.config_file_name,
+            epoch_model.csvy_leading_lines,
+            csvy_headers,
+            df_csv,
+            config,
+            config_dirname=epoch_model.config_dirname,
+        )
+
+    def seed_workflow(self, workflow):
+        """
+        Purpose:
+        ---------
+        Start the v_inner solver of a workflow that has not run yet from the inner
+        boundary velocity of this state, in place of the estimate the workflow makes when
+        it is set up. If the velocity is outside the shells of the model, the estimate is
+        kept.
+
+        ----------
+        Parameters:
+            workflow: InnerVelocitySolverWorkflow
+        """
+        simulation_state = workflow.simulation_state
+        geometry = simulation_state.geometry
+        v_min = geometry.v_inner.to(u.cm / u.s).value.min()
+        v_max = geometry.v_outer.to(u.cm / u.s).value.max()
+        if not v_min <= self.v_inner_boundary < v_max:
+            logger.info(
+                f"Warm start v_inner {self.v_inner_boundary:.4e} cm/s is outside the model "
+                f"({v_min:.4e} - {v_max:.4e} cm/s), keeping the estimated v_inner"
+            )
+            return
+        # the same updates as InnerVelocitySolverWorkflow makes with its estimated v_inner
+        geometry.v_inner_boundary = self.v_inner_boundary * u.cm / u.s
+        simulation_state.blackbody_packet_source.radius = simulation_state.r_inner[0]
+
+
+def quantity_value(value, unit):
+    """The value in unit of a Quantity or of a config string, e.g. "5 day" or "1e42 erg/s"."""
+    return u.Quantity(value).to(unit).value
+
+
+class TardisTemplates:
+    """
+    Purpose:
+    ---------
+    Parse the TARDIS template csvy and config files once, then write the files of
+    each time step by patching deep copies of the cached structures.
+
+    ----------
+    Parameters:
+        tardis_sample_csvy_path: str or None
+            The path to the template csvy file
+        tardis_sample_config_path: str or None
+            The path to the template config yml file
+    """
+
+    def __init__(self, tardis_sample_csvy_path=None, tardis_sample_config_path=None):
+        self.tardis_sample_csvy_path = tardis_sample_csvy_path
+        self.tardis_sample_config_path = tardis_sample_config_path
+
+        if tardis_sample_csvy_path is not None:
+            # Read the sample csvy file
+            with open(tardis_sample_csvy_path, "r") as file:
+                csvy_lines = file.readlines()
+
+            # Find the lines between "---" and datatype -- these are the headers
+            start_index = csvy_lines.index("---\n")
+            end_index = csvy_lines.index("datatype:\n")
+
+            # Keep the lines before the headers and parse the headers as YAML
+            self.csvy_leading_lines = csvy_lines[: start_index + 1]
+            self.csvy_headers = yaml.safe_load("".join(csvy_lines[start_index:end_index]))
+
+        if tardis_sample_config_path is not None:
+            # load in the sample config yml
+            with open(tardis_sample_config_path, "r") as file:
+                self.config = yaml.safe_load(file)
+
+    def csvy_headers_for(self, modify_csvy_headers, df_csv):
+        """
+        Purpose:
+        ---------
+        The csvy headers of a specific time step, the template headers with the modified
+        headers and the datatype fields of the model profiles.
+
+        ----------
+        Parameters:
+            modify_csvy_headers: dict
+                The dictionary that contains the to-be modified headers
+            df_csv: dataframe
+                The model profiles, see get_fields_names for the expected columns
+
+        ----------
+        Returns:
+            yml_data: dict
+        """
+        yml_data = copy.deepcopy(self.csvy_headers)
+
+        # Modify the header dictionary as needed
+        for key, value in modify_csvy_headers.items():
+            yml_data[key] = value
+
+        # add the datatype fields
+        fields = get_fields_names(df_csv.columns.to_list())
+        yml_data["datatype"] = {"fields": fields}
+        return yml_data
+
+    def write_csvy(self, modify_csvy_headers, df_csv, output_csvy_path):
+        """
+        Purpose:
+        ---------
+        Write the TARDIS model csvy file for a specific time step.
+
+        ----------
+        Parameters:
+            modify_csvy_headers: dict
+                The dictionary that contains the to-be modified headers
+            df_csv: dataframe
+                The model profiles, see get_fields_names for the expected columns
+            output_csvy_path: str
+                The path to the new csvy file
+        """
+        yml_data = self.csvy_headers_for(modify_csvy_headers, df_csv)
+        write_csvy_file(self.csvy_leading_lines, yml_data, df_csv, output_csvy_path)
+
+    def config_for(self, modify_parameters, csvy_model_path=None):
+        """
+        Purpose:
+        ---------
+        The TARDIS config dictionary of a specific time step.
+
+        ----------
+        Parameters:
+            modified_parameters: dict
+                The dictionary that contains the to-be modified parameters
+            csvy_model_path: str or None
+                If given, the csvy model file name written in the config
+
+        ----------
+        Returns:
+            config: dict
+        """
+        config = copy.deepcopy(self.config)
+
+        # Modify the config dictionary as needed
+        for key1, params in modify_parameters.items():
+            for key2, value in params.items():
+                config[key1][key2] = value
+
+        if csvy_model_path is not None:
+            config["csvy_model"] = csvy_model_path
+        return config
+
+    def write_config(self, modify_parameters, output_config_path, csvy_model_path=None):
+        """
+        Purpose:
+        ---------
+        Write the TARDIS config file for a specific time step.
+
+        ----------
+        Parameters:
+            modified_parameters: dict
+                The dictionary that contains the to-be modified parameters
+            output_config_path: str
+                The path to the new config file
+            csvy_model_path: str or None
+                If given, the csvy model file name written in the config
+        """
+        config = self.config_for(modify_parameters, csvy_model_path=csvy_model_path)
+
+        # Save the modified config back to a new YAML file
+        with open(output_config_path, "w") as file:
+            yaml.safe_dump(config, file, sort_keys=False)
+
+    @profiled("epoch_model")
+    def epoch_model(
+        self,
+        modify_csvy_headers,
+        df_csv,
+        modify_parameters,
+        csvy_file_name,
+        config_file_name,
+    ):
+        """
+        Purpose:
+        ---------
+        The TARDIS inputs of a specific time step in memory, see TardisEpochModel.
+
+        ----------
+        Parameters:
+            modify_csvy_headers: dict
+                The dictionary that contains the to-be modified csvy headers
+            df_csv: dataframe
+                The model profiles, see get_fields_names for the expected columns
+            modify_parameters: dict
+                The dictionary that contains the to-be modified config parameters
+            csvy_file_name: str
+                The csvy file name of the time step, written in the config
+            config_file_name: str
+                The config file name of the time step
+
+        ----------
+        Returns:
+            TardisEpochModel
+        """
+        return TardisEpochModel(
+            csvy_file_name,
+            config_file_name,
+            self.csvy_leading_lines,
+            self.csvy_headers_for(modify_csvy_headers, df_csv),
+            df_csv,
+            self.config_for(modify_parameters, csvy_model_path=csvy_file_name),
+        )
+
+
+def load_tardis_templates(tardis_sample_csvy_path=None, tardis_sample_config_path=None):
+    """
+    Purpose:
+    ---------
+    The TardisTemplates of the template files, parsed once per process and reused while
+    the files are unchanged, e.g. by the conversions of many models in batch_convert.
+
+    ----------
+    Parameters:
+        tardis_sample_csvy_path: str or None
+            The path to the template csvy file
+        tardis_sample_config_path: str or None
+            The path to the template config yml file
+
+    ----------
+    Returns:
+        TardisTemplates, shared by the callers, so it must not be modified
+    """
+    template_mtimes = tuple(
+        None if path is None else os.stat(path).st_mtime_ns
+        for path in (tardis_sample_csvy_path, tardis_sample_config_path)
+    )
+    return _load_tardis_templates(
+        tardis_sample_csvy_path, tardis_sample_config_path, template_mtimes
     )
 
 
+@functools.lru_cache(maxsize=16)
+def _load_tardis_templates(tardis_sample_csvy_path, tardis_sample_config_path, template_mtimes):
+    return TardisTemplates(tardis_sample_csvy_path, tardis_sample_config_path)
+
+
+def is_valid_nuclide_or_elem_cached(name):
+    """tardis.util.base.is_valid_nuclide_or_elem, looked up in the nuclide table, see
+    nuclide_table.load_nuclide_table"""
+    return load_nuclide_table().is_valid(name)
+
+
+class TardisEpochModel:
+    """
+    Purpose:
+    ---------
+    The TARDIS inputs of one time step held in memory: the config dictionary, the csvy
+    headers and the model profiles. The TARDIS Configuration is built straight from the
+    config dictionary, without writing and re-reading the config yml file, and writing
+    the files is optional, see write and run_tardis_epoch.
+
+    ----------
+    Parameters:
+        csvy_file_name: str
+            The csvy file name of the time step, as written in the config
+        config_file_name: str
+            The config file name of the time step
+        csvy_leading_lines: list
+            The lines of the template csvy before the headers
+        csvy_headers: dict
+            The csvy headers, with the datatype fields of the profiles
+        df_csv: dataframe
+            The model profiles (the model table), one row per shell
+        config: dict
+            The TARDIS config dictionary
+        config_dirname: str
+            The folder that the relative paths of the config (e.g. atom_data) are
+            relative to, default "" for the working directory
+    """
+
+    def __init__(
+        self,
+        csvy_file_name,
+        config_file_name,
+        csvy_leading_lines,
+        csvy_headers,
+        df_csv,
+        config,
+        config_dirname="",
+    ):
+        self.csvy_file_name = csvy_file_name
+        self.config_file_name = config_file_name
+        self.csvy_leading_lines = csvy_leading_lines
+        self.csvy_headers = csvy_headers
+        self.df_csv = df_csv
+        self.config = config
+        self.config_dirname = config_dirname
+
+    @classmethod
+    def from_config_file(cls, config_file_path):
+        """
+        Purpose:
+        ---------
+        Read the TARDIS inputs of a time step back from its config yml file and the csvy
+        model file it points to, e.g. the files written by the parsers.
+
+        ----------
+        Parameters:
+            config_file_path: str or Path
+
+        ----------
+        Returns:
+            TardisEpochModel
+        """
+        config_dirname = os.path.dirname(os.path.abspath(config_file_path))
+        with open(config_file_path, "r") as file:
+            config = yaml.safe_load(file)
+        csvy_leading_lines, csvy_headers, df_csv = read_csvy_file(
+            os.path.join(config_dirname, config["csvy_model"])
+        )
+        return cls(
+            os.path.basename(config["csvy_model"]),
+            os.path.basename(config_file_path),
+            csvy_leading_lines,
+            csvy_headers,
+            df_csv,
+            config,
+            config_dirname=config_dirname,
+        )
+
+    @property
+    def model_table(self):
+        """The model profiles in the column order of the csvy datatype fields"""
+        fields_columns = [field["name"] for field in self.csvy_headers["datatype"]["fields"]]
+        return self.df_csv[fields_columns]
+
+    def configuration(self, csvy_model_path=None):
+        """
+        Purpose:
+        ---------
+        Build the TARDIS Configuration of the time step from the config dictionary.
+
+        ----------
+        Parameters:
+            csvy_model_path: str or None
+                The path to the csvy model file to set as the csvy_model of the config, if
+                None the csvy file name of the time step (relative to the working directory)
+
+        ----------
+        Returns:
+            tardis.io.configuration.config_reader.Configuration
+        """
+        config = copy.deepcopy(self.config)
+        if csvy_model_path is not None:
+            config["csvy_model"] = os.path.abspath(csvy_model_path)
+        return Configuration.from_config_dict(config, config_dirname=self.config_dirname)
+
+    def tardis_csvy_model(self):
+        """
+        Purpose:
+        ---------
+        The csvy model of the time step as TARDIS reads it from the csvy file
+        (tardis.io.model.readers.csvy.load_csvy), without writing the file.
+
+        ----------
+        Returns:
+            csvy_model_config: dict
+                The csvy headers, loaded with the YAML loader of TARDIS
+            csvy_model_data: dataframe
+                A copy of the model table
+        """
+        csvy_model_config = yaml.load(
+            yaml.dump(self.csvy_headers, sort_keys=False), Loader=YAMLLoader
+        )
+        return csvy_model_config, self.model_table.reset_index(drop=True)
+
+    def tardis_inputs(self, csvy_model_path=None):
+        """
+        Purpose:
+        ---------
+        The inputs of the time step for InMemoryInnerVelocitySolverWorkflow.from_csvy_model,
+        the Configuration and the csvy model, without writing any file.
+
+        ----------
+        Parameters:
+            csvy_model_path: str or None
+                see configuration
+
+        ----------
+        Returns:
+            config: tardis.io.configuration.config_reader.Configuration
+            csvy_model_config: dict
+                The csvy headers, see tardis_csvy_model
+            csvy_model_data: dataframe
+                The model table
+        """
+        return (self.configuration(csvy_model_path=csvy_model_path), *self.tardis_csvy_model())
+
+    @profiled("csvy_write")
+    def write_csvy(self, output_csvy_path):
+        """Write the csvy model file of the time step"""
+        write_csvy_file(self.csvy_leading_lines, self.csvy_headers, self.df_csv, output_csvy_path)
+
+    @profiled("yml_write")
+    def write_config(self, output_config_path):
+        """Write the config yml file of the time step"""
+        with open(output_config_path, "w") as file:
+            yaml.safe_dump(self.config, file, sort_keys=False)
+
+    def write(self, output_folder_path):
+        """
+        Purpose:
+        ---------
+        Write the csvy and config files of the time step, the same files as the parsers
+        write, to output_folder_path.
+
+        ----------
+        Returns:
+            new_csvy_path, new_config_path: str
+        """
+        new_csvy_path = f"{output_folder_path}/{self.csvy_file_name}"
+        new_config_path = f"{output_folder_path}/{self.config_file_name}"
+        self.write_csvy(new_csvy_path)
+        self.write_config(new_config_path)
+        return new_csvy_path, new_config_path
+
+
+def write_csvy_file(csvy_leading_lines, csvy_headers, df_csv, output_csvy_path):
+    """
+    Purpose:
+    ---------
+    Stream the csvy headers and then the model profiles (in the order of the datatype
+    fields) to a csvy file.
+
+    ----------
+    Parameters:
+        csvy_leading_lines: list
+            The lines of the template csvy before the headers
+        csvy_headers: dict
+            The csvy headers, with the datatype fields
+        df_csv: dataframe
+            The model profiles
+        output_csvy_path: str
+            The path to the new csvy file
+    """
+    fields_columns = [field["name"] for field in csvy_headers["datatype"]["fields"]]
+    with open(output_csvy_path, "w") as file:
+        file.writelines(csvy_leading_lines)
+        yaml.dump(csvy_headers, file, sort_keys=False)
+        file.write("---\n")
+        write_csv_rows(file, df_csv[fields_columns])
+
+
+def read_csvy_file(csvy_path):
+    """
+    Purpose:
+    ---------
+    Read a csvy file back into the parts write_csvy_file writes.
+
+    ----------
+    Parameters:
+        csvy_path: str
+            The path to the csvy file
+
+    ----------
+    Returns:
+        csvy_leading_lines: list
+            The lines before the headers
+        csvy_headers: dict
+            The csvy headers, with the datatype fields
+        df_csv: dataframe
+            The model profiles
+    """
+    with open(csvy_path, "r") as file:
+        csvy_lines = file.readlines()
+
+    # the headers are between the first two "---" lines, the profiles follow
+    start_index = csvy_lines.index("---\n")
+    end_index = csvy_lines.index("---\n", start_index + 1)
+    csvy_leading_lines = csvy_lines[: start_index + 1]
+    csvy_headers = yaml.safe_load("".join(csvy_lines[start_index + 1 : end_index]))
+    df_csv = pd.read_csv(io.StringIO("".join(csvy_lines[end_index + 1 :])))
+    return csvy_leading_lines, csvy_headers, df_csv
+
+
+CSV_CHUNK_ROWS = 4096  # rows formatted at a time by write_csv_rows
+
+
+def write_csv_rows(file, df_csv, float_format="%.5e", chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Purpose:
+    ---------
+    Write a dataframe as csv to an open file, the same text as
+    df_csv.to_csv(index=False, float_format=float_format, sep=","), without building the
+    whole text in memory. An all-float frame is formatted straight from its float64
+    array, chunk_rows rows at a time; other frames (integer columns, NaN values or
+    column names that need quoting) are written with to_csv in chunks of rows.
+
+    ----------
+    Parameters:
+        file: file object
+            The text file to write to
+        df_csv: dataframe
+        float_format: str
+            The %-format of the float values
+        chunk_rows: int
+            The number of rows formatted at a time
+    """
+    column_names = [str(column) for column in df_csv.columns]
+    values = None
+    if all(pd.api.types.is_float_dtype(dtype) for dtype in df_csv.dtypes) and not any(
+        any(char in name for char in ',"\n\r') for name in column_names
+    ):
+        values = df_csv.to_numpy(dtype=np.float64)
+        if np.isnan(values).any():
+            # to_csv writes NaN as an empty field
+            values = None
+
+    if values is None:
+        for start in range(0, max(len(df_csv), 1), chunk_rows):
+            df_csv.iloc[start : start + chunk_rows].to_csv(
+                file,
+                index=False,
+                header=start == 0,
+                float_format=float_format,
+                sep=",",
+                lineterminator="\n",
+            )
+        return
+
+    file.write(",".join(column_names) + "\n")
+    row_format = ",".join([float_format] * values.shape[1]) + "\n"
+    for start in range(0, values.shape[0], chunk_rows):
+        chunk = values[start : start + chunk_rows]
+        file.write((row_format * chunk.shape[0]) % tuple(chunk.ravel().tolist()))
+
+
 def write_tardis_csvy(tardis_sample_csvy_path, modify_csvy_headers, df_csv, output_csvy_path):
     """
     Purpose:
     ---------
     Write the TARDIS model csvy file for a specific time step.
+    To write many time steps, parse the template once with TardisTemplates instead.
 
     ----------
     Parameters:
@@ -46,41 +1102,331 @@ def write_tardis_csvy(tardis_sample_csvy_path, modify_csvy_headers, df_csv, outp
         output_csvy_path: str
             The path to the new csvy file
     """
-    # Read the sample csvy file
-    with open(tardis_sample_csvy_path, "r") as file:
-        csvy_lines = file.readlines()
+    TardisTemplates(tardis_sample_csvy_path=tardis_sample_csvy_path).write_csvy(
+        modify_csvy_headers, df_csv, output_csvy_path
+    )
 
-    # Find the lines between "---" and datatype -- these are the headers
-    start_index = csvy_lines.index("---\n")
-    end_index = csvy_lines.index("datatype:\n")
 
-    # Parse the lines as YAML
-    yml_lines = csvy_lines[start_index:end_index]
-    yml_data = yaml.safe_load("".join(yml_lines))
+def increasing_subsequence_mask(values):
+    """
+    Purpose:
+    ---------
+    Find the shells to keep so that the values (e.g. velocity) are strictly increasing.
+    Gives the same result as repeatedly dropping the shells that are not larger than
+    their inner neighbour (snec_to_tardis_parser.delete_non_increasing_neighbour) until
+    the values are strictly increasing, without rebuilding a DataFrame for every pass.
 
-    # Modify the header dictionary as needed
-    for key, value in modify_csvy_headers.items():
-        yml_data[key] = value
+    Each pass is one vectorized O(n) check of the remaining shells. Once the innermost
+    shell is kept, the kept shells are the running maxima of the values and the loop
+    ends. While the innermost shell is dropped, the pass is repeated on the shells
+    that survived it, so a profile whose inner shells keep getting dropped takes up to
+    O(n) passes (O(n^2) in the worst case), usually one or two.
 
-    # add the datatype fields
-    fields = get_fields_names(df_csv.columns.to_list())
-    yml_data["datatype"] = {"fields": fields}
+    ----------
+    Parameters:
+        values: array-like
+            1D array of the shell values, from the inner to the outer shell
+
+    ----------
+    Returns:
+        mask: numpy array
+            Boolean array, True for the shells to keep
+    """
+    values = np.asarray(values, dtype=np.float64)
+    kept_index = np.arange(values.size)
+    while kept_index.size > 1:
+        kept_values = values[kept_index]
+        increasing = kept_values[1:] > kept_values[:-1]
+        if increasing.all():
+            break
+        if not increasing.any():
+            # every shell is lower than its inner neighbour, only the innermost one is left
+            kept_index = kept_index[:1]
+            break
 
-    # Convert the yml data back to lines
-    yml_lines = yaml.dump(yml_data, sort_keys=False).splitlines()
-    yml_lines = [line + "\n" for line in yml_lines]
+        # the innermost shell stays if it is lower than the first shell that survives
+        first_increasing = np.argmax(increasing) + 1
+        if kept_values[0] < kept_values[first_increasing]:
+            running_max = np.maximum.accumulate(kept_values)
+            kept_index = kept_index[np.r_[True, kept_values[1:] > running_max[:-1]]]
+            break
+        kept_index = kept_index[1:][increasing]
 
-    # Convert the csv data to lines
-    fields_columns = [field["name"] for field in fields]
-    csv_lines = (
-        df_csv[fields_columns].to_csv(index=False, float_format="%.5e", sep=",").splitlines()
-    )
-    csv_lines = [line + "\n" for line in csv_lines]
+    mask = np.zeros(values.size, dtype=bool)
+    mask[kept_index] = True
+    return mask
 
-    # Save the updated csvy data
-    updated_csvy_lines = csvy_lines[: start_index + 1] + yml_lines + ["---\n"] + csv_lines
-    with open(output_csvy_path, "w") as file:
-        file.writelines(updated_csvy_lines)
+
+class ProfileRemapper:
+    """
+    Purpose:
+    ---------
+    Linearly interpolate many profiles (e.g. the mass fraction of every isotope) that
+    share one source grid onto a target grid, in a single vectorized operation.
+
+    The results are the same as building a scipy.interpolate.interp1d(kind="linear",
+    bounds_error=False) per profile, with values outside the source grid filled with
+    the first/last value of each profile.
+
+    ----------
+    Parameters:
+        source_grid: array-like
+            1D grid of the profiles, shape (n_source,), e.g. the mass coordinate
+        profiles: array-like
+            The profiles on the source grid, shape (n_source,) or (n_source, n_profiles)
+    """
+
+    def __init__(self, source_grid, profiles):
+        source_grid = np.asarray(source_grid, dtype=np.float64)
+        profiles = np.asarray(profiles, dtype=np.float64)
+        if profiles.shape[0] != source_grid.shape[0]:
+            raise ValueError(
+                f"profiles have {profiles.shape[0]} rows but the source grid has "
+                f"{source_grid.shape[0]} points"
+            )
+
+        # sort the source grid once (interp1d does the same for every profile)
+        if np.any(np.diff(source_grid) < 0):
+            order = np.argsort(source_grid, kind="stable")
+            source_grid = source_grid[order]
+            profiles = profiles[order]
+
+        self.source_grid = source_grid
+        self.profiles = np.ascontiguousarray(profiles)
+
+    @profiled("composition_remap")
+    def remap(self, target_grid):
+        """
+        Purpose:
+        ---------
+        Evaluate all the profiles on the target grid.
+
+        ----------
+        Parameters:
+            target_grid: array-like
+                1D grid to interpolate onto, shape (n_target,)
+
+        Returns:
+            numpy array of shape (n_target,) or (n_target, n_profiles), float64
+        """
+        target_grid = np.asarray(target_grid, dtype=np.float64)
+        source_grid = self.source_grid
+        profiles = self.profiles
+        if source_grid.size == 1:
+            return np.repeat(profiles, target_grid.size, axis=0)
+
+        # the bracketing source points of each target point, shared by all profiles
+        lower_index = np.clip(
+            np.searchsorted(source_grid, target_grid, side="right") - 1, 0, source_grid.size - 2
+        )
+        upper_index = lower_index + 1
+        lower_grid = source_grid[lower_index]
+        upper_grid = source_grid[upper_index]
+
+        # one gather for the whole (n_target, n_profiles) block
+        lower_values = profiles[lower_index]
+        upper_values = profiles[upper_index]
+        grid_shape = (-1,) + (1,) * (profiles.ndim - 1)
+        # duplicate source points give zero-width intervals, only bracketing the targets
+        # outside the source grid whose values are replaced by the edge values below
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (upper_values - lower_values) / (upper_grid - lower_grid).reshape(grid_shape)
+            remapped = slope * (target_grid - lower_grid).reshape(grid_shape) + lower_values
+
+        # hold the edge values outside the source grid
+        remapped[target_grid < source_grid[0]] = profiles[0]
+        remapped[target_grid >= source_grid[-1]] = profiles[-1]
+        return remapped
+
+
+def regular_bin_starts(n_shells, num_keep_shells):
+    """
+    Purpose:
+    ---------
+    Index of the first shell of each bin when grouping every floor(n_shells / num_keep_shells)
+    consecutive shells, which gives ROUGHLY num_keep_shells bins (the old groupby binning).
+
+    ----------
+    Parameters:
+        n_shells: int
+        num_keep_shells: int
+
+    ----------
+    Returns:
+        bin_starts: numpy array of int
+    """
+    shell_gap_length = max(int(np.floor(n_shells / num_keep_shells)), 1)
+    return np.arange(0, n_shells, shell_gap_length)
+
+
+def bin_starts_from_edges(grid, bin_edges):
+    """
+    Purpose:
+    ---------
+    Index of the first shell of each bin for arbitrary bin edges on a (sorted) shell grid,
+    e.g. velocity edges. Shells below the first edge join the first bin, empty bins are dropped.
+
+    ----------
+    Parameters:
+        grid: array-like
+            1D increasing shell coordinate, e.g. velocity
+        bin_edges: array-like
+            1D increasing bin edges in the same unit as grid
+
+    ----------
+    Returns:
+        bin_starts: numpy array of int
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    bin_starts = np.searchsorted(grid, np.asarray(bin_edges, dtype=np.float64), side="left")
+    bin_starts = np.unique(np.r_[0, bin_starts])
+    return bin_starts[bin_starts < grid.size]
+
+
+def rebin_shells(values, bin_starts, weights=None):
+    """
+    Purpose:
+    ---------
+    Average consecutive shells into bins with np.add.reduceat, all columns in one pass.
+
+    ----------
+    Parameters:
+        values: array-like
+            Shell values, shape (n_shells,) or (n_shells, n_columns)
+        bin_starts: array-like
+            Strictly increasing index of the first shell of each bin, starting with 0
+        weights: array-like or None, default None
+            Shell weights, shape (n_shells,) (e.g. mass or volume). If None the plain mean
+            is taken. Bins with zero total weight fall back to the plain mean.
+
+    ----------
+    Returns:
+        binned: numpy array of shape (n_bins,) or (n_bins, n_columns), float64
+    """
+    values = np.asarray(values, dtype=np.float64)
+    bin_starts = np.asarray(bin_starts, dtype=np.intp)
+    n_shells = values.shape[0]
+    if n_shells == 0:
+        return values[:0]
+    if (
+        bin_starts.size == 0
+        or bin_starts[0] != 0
+        or bin_starts[-1] >= n_shells
+        or np.any(np.diff(bin_starts) <= 0)
+    ):
+        raise ValueError(
+            "bin_starts must be strictly increasing shell indices starting with 0, "
+            f"got {bin_starts} for {n_shells} shells"
+        )
+
+    bin_sizes = np.diff(np.r_[bin_starts, n_shells])
+    column_shape = (-1,) + (1,) * (values.ndim - 1)
+    binned = np.add.reduceat(values, bin_starts, axis=0) / bin_sizes.reshape(column_shape)
+    if weights is None:
+        return binned
+
+    weights = np.asarray(weights, dtype=np.float64)
+    bin_weights = np.add.reduceat(weights, bin_starts)
+    weighted_sums = np.add.reduceat(values * weights.reshape(column_shape), bin_starts, axis=0)
+    has_weight = bin_weights > 0
+    binned[has_weight] = weighted_sums[has_weight] / bin_weights[has_weight].reshape(column_shape)
+    return binned
+
+
+@profiled("rebin")
+def rebin_shell_profiles(
+    df_profiles,
+    bin_starts,
+    weighting=None,
+    composition_columns=None,
+    velocity_column="velocity",
+    density_column="density",
+    velocity_boundary="outer",
+):
+    """
+    Purpose:
+    ---------
+    Rebin the shell profiles (velocity, density, t_rad, composition ...) of a model into
+    fewer shells by averaging consecutive shells, see rebin_shells.
+
+    With weighting=None every column is the plain mean of the shells in a bin (the same as
+    df.groupby(shell_bin).mean()). With weighting="volume" or "mass" the bins keep the
+    boundary velocities of their shells: the velocity of a bin is its outer boundary (the
+    velocity of its last shell) for velocity_boundary="outer", or its inner boundary (the
+    velocity of its first shell) for "inner". The density is volume-weighted, so the mass
+    of each bin is conserved, and the composition columns are weighted by the shell volume
+    or mass, so the mass of each isotope is conserved for weighting="mass". The other
+    columns (t_rad ...) stay plain means.
+    The shell volumes are taken from the velocity column, since r = v * t is homologous.
+    The extent of the first shell (velocity_boundary="outer", the inner boundary of the
+    model) or of the last shell ("inner") is unknown, so that shell keeps a bin of its own.
+
+    ----------
+    Parameters:
+        df_profiles: pd.DataFrame
+            One row per shell, from the inner to the outer shell, numeric columns only
+        bin_starts: array-like
+            Index (position) of the first shell of each bin, see regular_bin_starts and
+            bin_starts_from_edges
+        weighting: None, "volume" or "mass", default None
+        composition_columns: list or None, default None
+            The columns averaged with the weights, if None all the columns other than
+            velocity, density and t_rad
+        velocity_column: str, default "velocity"
+        density_column: str, default "density"
+        velocity_boundary: "outer" or "inner", default "outer"
+            Whether the velocity column is the outer (SNEC/TARDIS csvy) or inner (STELLA
+            after the parser shift) boundary of the shell, used for the shell volumes
+
+    Returns:
+        pd.DataFrame with one row per bin and a RangeIndex
+    """
+    if weighting not in [None, "volume", "mass"]:
+        raise ValueError(f"weighting must be None, 'volume' or 'mass', got {weighting}")
+
+    values = df_profiles.to_numpy(dtype=np.float64)
+    if weighting is None:
+        return pd.DataFrame(rebin_shells(values, bin_starts), columns=df_profiles.columns)
+
+    # the shell volumes are proportional to the difference of the boundary velocity cubed,
+    # the shell without a known extent keeps a bin of its own
+    n_shells = values.shape[0]
+    bin_starts = np.asarray(bin_starts, dtype=np.intp)
+    velocity_cubed = df_profiles[velocity_column].to_numpy(dtype=np.float64) ** 3
+    if velocity_boundary == "outer":
+        volume = np.diff(velocity_cubed, prepend=velocity_cubed[:1])
+        if n_shells > 1:
+            bin_starts = np.union1d(bin_starts, [1])
+        boundary_rows = np.r_[bin_starts[1:], n_shells] - 1
+    elif velocity_boundary == "inner":
+        volume = np.diff(velocity_cubed, append=velocity_cubed[-1:])
+        if n_shells > 1:
+            bin_starts = np.union1d(bin_starts, [n_shells - 1])
+        boundary_rows = bin_starts
+    else:
+        raise ValueError(f"velocity_boundary must be 'outer' or 'inner', got {velocity_boundary}")
+    volume = np.clip(volume, 0, None)
+
+    if composition_columns is None:
+        composition_columns = [
+            col
+            for col in df_profiles.columns
+            if col not in [velocity_column, density_column, "t_rad"]
+        ]
+    column_index = df_profiles.columns.get_indexer
+    density_index = column_index([density_column])
+    composition_index = column_index(list(composition_columns))
+
+    binned = rebin_shells(values, bin_starts)
+    velocity_index = column_index([velocity_column])
+    binned[:, velocity_index] = values[boundary_rows][:, velocity_index]
+    binned[:, density_index] = rebin_shells(values[:, density_index], bin_starts, volume)
+    if len(composition_index) > 0:
+        weights = volume * values[:, density_index[0]] if weighting == "mass" else volume
+        binned[:, composition_index] = rebin_shells(
+            values[:, composition_index], bin_starts, weights
+        )
+    return pd.DataFrame(binned, columns=df_profiles.columns)
 
 
 def get_fields_names(column_names):
@@ -138,7 +1484,7 @@ def get_fields_names(column_names):
     # assume the rest are fractional abundance
     for element in column_names:
         # check the column is a valid element
-        if is_valid_nuclide_or_elem(element):
+        if is_valid_nuclide_or_elem_cached(element):
             fields.append(
                 {
                     "name": element,
@@ -161,6 +1507,7 @@ def write_tardis_config(
     Purpose:
     ---------
     Write the TARDIS config file for a specific time step.
+    To write many time steps, parse the template once with TardisTemplates instead.
 
     ----------
     Parameters:
@@ -169,18 +1516,6 @@ def write_tardis_config(
         output_config_path: str
             The path to the new config file
     """
-    # load in the sample config yml
-    with open(tardis_sample_config_path, "r") as file:
-        config = yaml.safe_load(file)
-
-    # Modify the config dictionary as needed
-    for key1, params in modify_parameters.items():
-        for key2, value in params.items():
-            config[key1][key2] = value
-
-    if csvy_model_path is not None:
-        config["csvy_model"] = csvy_model_path
-
-    # Save the modified config back to a new YAML file
-    with open(output_config_path, "w") as file:
-        yaml.safe_dump(config, file, sort_keys=False)
+    TardisTemplates(tardis_sample_config_path=tardis_sample_config_path).write_config(
+        modify_parameters, output_config_path, csvy_model_path=csvy_model_path
+    )